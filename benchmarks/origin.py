@@ -0,0 +1,290 @@
+import time
+import json
+import random
+import asyncio
+import argparse
+import threading
+from collections import Counter
+from dataclasses import dataclass, field, asdict
+
+from aiohttp import web
+from Crypto.Cipher import AES
+from Crypto.Util.Padding import pad
+
+
+@dataclass
+class OriginConfig:
+    """模擬HLS來源的設定，時間單位皆為秒"""
+    live: bool = True
+    segments: int = 30  # VOD的總碎片數；直播時為整場直播發佈的碎片數
+    initial_segments: int = 6  # 直播開始時已發佈的碎片數
+    window: int = 6  # 直播播放清單保留的碎片數
+    target_duration: int = 1
+    segment_size: int = 256 * 1024
+    start_number: int = 1000
+    deltas: list[int] = field(default_factory=lambda: [1])  # 碎片編號的間距，依序循環，例如common.Deltas.IG.value
+    encrypt: bool = False
+    archive: bool = True  # 已離開播放清單的碎片是否仍可下載
+    latency: float = 0.0
+    jitter: float = 0.0
+    error_rate: float = 0.0
+    max_inflight: int = 0  # 同時處理的碎片請求超過此數時回傳429，0為不限制
+    seed: int = 0
+
+
+class HLSOrigin:
+    """
+    本機模擬的HLS來源，依設定產生直播或VOD播放清單與碎片
+    碎片內容由編號決定，同一設定每次產生的內容相同；統計各類請求的次數與傳輸量
+    """
+
+    def __init__(self, config: OriginConfig):
+        self.config = config
+        self.random = random.Random(config.seed)
+        self.key = bytes(range(16))
+        self.numbers: list[int] = []
+        number = config.start_number
+        for i in range(config.segments):
+            self.numbers.append(number)
+            number += config.deltas[i % len(config.deltas)]
+        self.index_of = {number: i for i, number in enumerate(self.numbers)}
+        self.counters: Counter[str] = Counter()
+        self.bytes_sent = 0
+        self.inflight = 0
+        self.peak_inflight = 0
+        self.start_time = time.time()
+
+    # 發佈時間
+    def publish_time(self, index: int) -> float:
+        """碎片出現在播放清單的時間(time.time())"""
+        if not self.config.live or index < self.config.initial_segments:
+            return self.start_time
+        return self.start_time + (index - self.config.initial_segments + 1) * self.config.target_duration
+
+    def published(self) -> int:
+        if not self.config.live:
+            return self.config.segments
+        elapsed = time.time() - self.start_time
+        count = self.config.initial_segments + int(elapsed // self.config.target_duration)
+        return min(self.config.segments, count)
+
+    def ended(self) -> bool:
+        return self.published() >= self.config.segments
+
+    def filename(self, number: int) -> str:
+        return f"seg_{number}.ts"
+
+    # 內容
+    def playlist(self) -> str:
+        published = self.published()
+        first = max(0, published - self.config.window) if self.config.live else 0
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:3",
+            f"#EXT-X-TARGETDURATION:{self.config.target_duration}",
+            f"#EXT-X-MEDIA-SEQUENCE:{first}",
+        ]
+        if not self.config.live:
+            lines.append("#EXT-X-PLAYLIST-TYPE:VOD")
+        if self.config.encrypt:
+            lines.append('#EXT-X-KEY:METHOD=AES-128,URI="key.bin"')
+        for index in range(first, published):
+            lines.append(f"#EXTINF:{self.config.target_duration:.3f},")
+            lines.append(self.filename(self.numbers[index]))
+        if not self.config.live or published >= self.config.segments:
+            lines.append("#EXT-X-ENDLIST")
+        return "\n".join(lines) + "\n"
+
+    def segment(self, number: int) -> bytes:
+        body = (number.to_bytes(4, 'big') * (self.config.segment_size // 4 + 1))[:self.config.segment_size]
+        if self.config.encrypt:
+            iv = self.index_of[number].to_bytes(16, 'big')
+            body = AES.new(self.key, AES.MODE_CBC, iv).encrypt(pad(body, AES.block_size))
+        return body
+
+    def available(self, number: int) -> bool:
+        index = self.index_of.get(number)
+        if index is None:
+            return False
+        published = self.published()
+        if index >= published:
+            return False
+        if self.config.live and not self.config.archive:
+            return index >= published - self.config.window
+        return True
+
+    # 請求處理
+    async def delay(self) -> None:
+        wait = self.config.latency + self.random.uniform(0, self.config.jitter)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def respond(self, request: web.Request, body: bytes, content_type: str) -> web.Response:
+        range_header = request.headers.get('Range', '')
+        if range_header.startswith('bytes='):
+            start_text, end_text = range_header[6:].split('-', 1)
+            start = int(start_text or 0)
+            end = min(int(end_text), len(body) - 1) if end_text else len(body) - 1
+            self.counters["range"] += 1
+            part = body[start:end + 1]
+            response = web.Response(status=206, body=part, content_type=content_type)
+            response.headers['Content-Range'] = f"bytes {start}-{end}/{len(body)}"
+        else:
+            part = body
+            response = web.Response(body=body, content_type=content_type)
+        if request.method == 'HEAD':
+            self.counters["head"] += 1
+        else:
+            self.bytes_sent += len(part)
+        return response
+
+    async def handle_playlist(self, request: web.Request) -> web.Response:
+        self.counters["playlist"] += 1
+        await self.delay()
+        return web.Response(text=self.playlist(), content_type='application/vnd.apple.mpegurl')
+
+    async def handle_key(self, request: web.Request) -> web.Response:
+        self.counters["key"] += 1
+        return self.respond(request, self.key, 'application/octet-stream')
+
+    async def handle_segment(self, request: web.Request) -> web.Response:
+        self.counters["segment"] += 1
+        if self.config.max_inflight and self.inflight >= self.config.max_inflight:
+            self.counters["throttled"] += 1
+            raise web.HTTPTooManyRequests()
+        self.inflight += 1
+        self.peak_inflight = max(self.peak_inflight, self.inflight)
+        try:
+            await self.delay()
+        finally:
+            self.inflight -= 1
+        number = int(request.match_info['number'])
+        if not self.available(number):
+            self.counters["not_found"] += 1
+            raise web.HTTPNotFound()
+        if self.config.error_rate and self.random.random() < self.config.error_rate:
+            self.counters["error"] += 1
+            raise web.HTTPInternalServerError()
+        return self.respond(request, self.segment(number), 'video/mp2t')
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats())
+
+    def stats(self) -> dict:
+        return {
+            "requests": dict(self.counters),
+            "bytes_sent": self.bytes_sent,
+            "peak_inflight": self.peak_inflight,
+            "published": self.published(),
+            "ended": self.ended(),
+        }
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get('/stream/media.m3u8', self.handle_playlist)
+        app.router.add_get('/stream/key.bin', self.handle_key)
+        app.router.add_get(r'/stream/seg_{number:\d+}.ts', self.handle_segment)
+        app.router.add_get('/_stats', self.handle_stats)
+        return app
+
+
+class OriginServer:
+    """於背景執行緒中以獨立事件迴圈執行HLSOrigin，port為0時由系統分配"""
+
+    def __init__(self, config: OriginConfig, host: str = '127.0.0.1', port: int = 0):
+        self.origin = HLSOrigin(config)
+        self.host = host
+        self.port = port
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.runner: web.AppRunner | None = None
+
+    @property
+    def playlist_url(self) -> str:
+        return f"http://{self.host}:{self.port}/stream/media.m3u8"
+
+    async def _start(self):
+        self.runner = web.AppRunner(self.origin.create_app(), access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, self.host, self.port)
+        await site.start()
+        self.port = self.runner.addresses[0][1]
+
+    def start(self) -> str:
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self.loop).result()
+        # 直播從伺服器啟動後開始計時
+        self.origin.start_time = time.time()
+        return self.playlist_url
+
+    def stop(self):
+        if self.runner is not None:
+            asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def add_config_arguments(parser: argparse.ArgumentParser) -> None:
+    defaults = OriginConfig()
+    parser.add_argument('--vod', action='store_true', help="產生VOD播放清單 (預設為直播)")
+    parser.add_argument('--segments', type=int, default=defaults.segments, help="總碎片數")
+    parser.add_argument('--initial-segments', type=int, default=defaults.initial_segments, help="直播開始時已發佈的碎片數")
+    parser.add_argument('--window', type=int, default=defaults.window, help="直播播放清單保留的碎片數")
+    parser.add_argument('--target-duration', type=int, default=defaults.target_duration, help="碎片長度(秒)")
+    parser.add_argument('--segment-size', type=int, default=defaults.segment_size, help="碎片大小(位元組)")
+    parser.add_argument('--start-number', type=int, default=defaults.start_number, help="第一個碎片的編號")
+    parser.add_argument('--deltas', default='1', help="碎片編號間距，以逗號分隔依序循環，或IG、REALITY")
+    parser.add_argument('--encrypt', action='store_true', help="以AES-128加密碎片")
+    parser.add_argument('--no-archive', action='store_true', help="離開播放清單的碎片不可再下載")
+    parser.add_argument('--latency', type=float, default=defaults.latency, help="每個請求的延遲(秒)")
+    parser.add_argument('--jitter', type=float, default=defaults.jitter, help="延遲的隨機增量上限(秒)")
+    parser.add_argument('--error-rate', type=float, default=defaults.error_rate, help="碎片請求回傳500的機率")
+    parser.add_argument('--max-inflight', type=int, default=defaults.max_inflight, help="同時處理的碎片請求超過此數時回傳429 (0: 不限制)")
+    parser.add_argument('--seed', type=int, default=defaults.seed, help="隨機種子")
+
+def config_from_args(args: argparse.Namespace) -> OriginConfig:
+    from src.app_types.common import Deltas
+    if args.deltas.upper() in Deltas.__members__:
+        deltas = Deltas[args.deltas.upper()].value
+    else:
+        deltas = [int(delta) for delta in args.deltas.split(',')]
+    return OriginConfig(
+        live=not args.vod,
+        segments=args.segments,
+        initial_segments=args.initial_segments,
+        window=args.window,
+        target_duration=args.target_duration,
+        segment_size=args.segment_size,
+        start_number=args.start_number,
+        deltas=deltas,
+        encrypt=args.encrypt,
+        archive=not args.no_archive,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        max_inflight=args.max_inflight,
+        seed=args.seed,
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="啟動本機模擬HLS來源")
+    parser.add_argument('--port', type=int, default=8080, help="伺服器埠號 (預設: 8080)")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+    config = config_from_args(args)
+    server = OriginServer(config, port=args.port)
+    print(f"模擬來源：{server.start()}")
+    print(json.dumps(asdict(config), ensure_ascii=False))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,183 @@
+import os
+import sys
+import time
+import json
+import shutil
+import logging
+import argparse
+import tempfile
+import threading
+import statistics
+import multiprocessing
+from dataclasses import replace, asdict
+
+from benchmarks.origin import OriginConfig, OriginServer, add_config_arguments, config_from_args
+
+# 各下載模式：(直播, 回推下載)
+MODES = {
+    "stream": (True, False),
+    "format": (True, True),
+    "vod": (False, False),
+    "resume": (False, False),  # 於vod的輸出資料夾重新執行，量測已存在碎片的檢查成本
+}
+
+def peak_rss_mb() -> float:
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux單位為KB，macOS為位元組
+    return rss / 1024 / 1024 if sys.platform == 'darwin' else rss / 1024
+
+def run_download(mode: str, url: str, output: str, expected: list[str], options: dict, timeout: float, queue) -> None:
+    """於獨立行程中執行m3u8_downloader，量測此行程的CPU時間與記憶體峰值"""
+    logging.basicConfig(level=logging.WARNING)
+    from src.app_types import m3u8
+    from src.services import m3u8_downloader
+
+    stop_flag = threading.Event()
+    m3u8_info = m3u8.M3U8Info(url=url, filename='bench')
+    mission = m3u8_downloader.m3u8_downloader(
+        stop_flag, m3u8_info,
+        output_path=output,
+        full_download=MODES[mode][1],
+        merge=False,
+        decrypt=options["decrypt"],
+        verify=options["verify"],
+        transport=options["transport"],
+    )
+    fragment_folder = os.path.join(output, 'backup', 'bench', 'fragments')
+
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    thread = threading.Thread(target=mission.main, daemon=True)
+    thread.start()
+
+    # 以任務的碎片狀態判斷完成，從碎片紀錄恢復的檔案在讀取紀錄後即視為完成
+    done = 0
+    finish = start
+    while time.perf_counter() - start < timeout and done < len(expected) and thread.is_alive():
+        count = sum(1 for info in list(mission.files_status.values()) if info["status"] == "Successful")
+        if count != done:
+            done = count
+            finish = time.perf_counter()
+        time.sleep(0.02)
+    stop_flag.set()
+    thread.join(timeout=60)
+
+    completed = {
+        name: os.path.getmtime(os.path.join(fragment_folder, name))
+        for name in expected if os.path.exists(os.path.join(fragment_folder, name))
+    }
+    queue.put({
+        "wall_seconds": finish - start,
+        "cpu_seconds": time.process_time() - cpu_start,
+        "peak_rss_mb": peak_rss_mb(),
+        "completed": completed,
+        "bytes": sum(os.path.getsize(os.path.join(fragment_folder, name)) for name in completed),
+        "requests_saved": mission.stats.requests_saved,
+        "probe_requests": mission.stats.probe_requests,
+        "timed_out": done < len(expected),
+    })
+
+def percentile(values: list[float], ratio: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * ratio))]
+
+def run_mode(mode: str, config: OriginConfig, output: str, options: dict) -> dict:
+    live, full_download = MODES[mode]
+    config = replace(config, live=live)
+    with OriginServer(config) as server:
+        origin = server.origin
+        if live and not full_download:
+            # 串流下載只能取得第一次讀取時仍在播放清單中的碎片
+            first = max(0, config.initial_segments - config.window)
+        else:
+            first = 0
+        expected = [origin.filename(number) for number in origin.numbers[first:]]
+        live_seconds = (config.segments - config.initial_segments) * config.target_duration if live else 0
+        timeout = live_seconds + options["timeout"]
+
+        queue = multiprocessing.get_context('spawn').Queue()
+        process = multiprocessing.get_context('spawn').Process(
+            target=run_download, args=(mode, server.playlist_url, output, expected, options, timeout, queue))
+        process.start()
+        result = queue.get()
+        process.join()
+        origin_stats = origin.stats()
+
+    segments = len(result["completed"])
+    wall = result["wall_seconds"]
+    lags = []
+    if live:
+        for index, number in enumerate(origin.numbers):
+            name = origin.filename(number)
+            if index >= config.initial_segments and name in result["completed"]:
+                lags.append(result["completed"][name] - origin.publish_time(index))
+    return {
+        "mode": mode,
+        "segments": segments,
+        "expected": len(expected),
+        "wall_seconds": round(wall, 3),
+        "segments_per_second": round(segments / wall, 2) if wall > 0 else 0.0,
+        "mb_per_second": round(result["bytes"] / 1024 / 1024 / wall, 2) if wall > 0 else 0.0,
+        "cpu_seconds": round(result["cpu_seconds"], 3),
+        "peak_rss_mb": round(result["peak_rss_mb"], 1),
+        "requests": origin_stats["requests"],
+        "bytes_sent": origin_stats["bytes_sent"],
+        "peak_inflight": origin_stats["peak_inflight"],
+        "requests_saved": result["requests_saved"],
+        "probe_requests": result["probe_requests"],
+        "live_lag_mean": round(statistics.mean(lags), 3) if lags else None,
+        "live_lag_p95": round(percentile(lags, 0.95), 3) if lags else None,
+        "timed_out": result["timed_out"],
+    }
+
+def print_table(results: list[dict]) -> None:
+    header = f"{'模式':<8}{'碎片':>10}{'秒':>9}{'碎片/s':>9}{'MB/s':>9}{'CPU秒':>8}{'RSS MB':>8}{'請求':>8}{'延遲均值':>9}{'延遲p95':>9}"
+    print(header)
+    for r in results:
+        requests = sum(r["requests"].values())
+        lag_mean = f"{r['live_lag_mean']:.2f}" if r["live_lag_mean"] is not None else '-'
+        lag_p95 = f"{r['live_lag_p95']:.2f}" if r["live_lag_p95"] is not None else '-'
+        print(f"{r['mode']:<8}{str(r['segments']) + '/' + str(r['expected']):>10}{r['wall_seconds']:>9.2f}{r['segments_per_second']:>9.2f}"
+              f"{r['mb_per_second']:>9.2f}{r['cpu_seconds']:>8.2f}{r['peak_rss_mb']:>8.1f}{requests:>8}{lag_mean:>9}{lag_p95:>9}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="以本機模擬HLS來源量測各下載模式的效能")
+    parser.add_argument('--modes', default='stream,format,vod,resume', help=f"以逗號分隔的模式：{','.join(MODES)}")
+    parser.add_argument('--verify', default='record', help="已存在碎片的檢查方式 (record/probe/get)")
+    parser.add_argument('--decrypt', action='store_true', help="下載時解密 (搭配--encrypt)")
+    parser.add_argument('--transport', default='aiohttp', help="HTTP傳輸方式 (aiohttp/http2)")
+    parser.add_argument('--timeout', type=float, default=60, help="每個模式在直播長度之外的等待上限(秒)")
+    parser.add_argument('--output', default='', help="下載資料夾 (預設: 暫存資料夾，結束後刪除)")
+    parser.add_argument('--json', default='', help="將結果寫入JSON檔案")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    config = config_from_args(args)
+    options = {"verify": args.verify, "decrypt": args.decrypt, "transport": args.transport, "timeout": args.timeout}
+    root = args.output or tempfile.mkdtemp(prefix='hls_bench_')
+    results = []
+    try:
+        for mode in args.modes.split(','):
+            if mode not in MODES:
+                raise SystemExit(f"未知的模式：{mode}")
+            # resume沿用vod的輸出資料夾
+            output = os.path.join(root, 'vod' if mode == 'resume' else mode)
+            if mode != 'resume' and os.path.exists(output):
+                shutil.rmtree(output)
+            print(f"執行模式：{mode}", file=sys.stderr)
+            results.append(run_mode(mode, config, output, options))
+    finally:
+        if not args.output:
+            shutil.rmtree(root, ignore_errors=True)
+
+    print_table(results)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"config": asdict(config), "options": options, "results": results}, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,69 @@
+import sys
+import json
+import asyncio
+import argparse
+
+from src.app_types.common import FormatInfo
+from src.services import transport
+from src.utils.guess import StepFinder
+
+# 情境：(當前值, 最小有效值)
+SCENARIOS = {
+    "near": (1_000_000, 999_995),
+    "mid": (1_000_000, 997_000),
+    "edge": (1_000_000, 990_000),  # 最小值剛好在分段搜尋的距離邊界
+    "far": (1_000_000, 950_000),
+    "deep": (1_000_000, 1_000),
+}
+
+
+class SyntheticFinder(StepFinder):
+    """經由記憶體傳輸層(FakeTransport)以模擬延遲回應探測的StepFinder，有效序號為[minimum, new_value]"""
+
+    def __init__(self, minimum: int, rtt: float, jitter: float, seed: int = 0):
+        self.minimum = minimum
+        fake = transport.FakeTransport(default=self.respond, latency=rtt, jitter=jitter, seed=seed)
+        super().__init__(FormatInfo(url="https://synthetic.invalid/{num}.ts", fill=0, space=1), session=fake)
+
+    def respond(self, method: str, url: str, headers: dict) -> bytes | int:
+        value = int(url.rsplit('/', 1)[1].split('.')[0])
+        return b'\x47' * 188 if self.minimum <= value <= self.new_value else 404
+
+
+async def measure(method: str, value: int, minimum: int, rtt: float, jitter: float) -> dict:
+    finder = SyntheticFinder(minimum, rtt, jitter)
+    finder.new_value = value
+    found = await finder.timed_search(value, method)
+    return {
+        "method": method,
+        "found": found,
+        "correct": found == minimum,
+        "probes": finder.last_search["probes"],
+        "seconds": round(finder.last_search["seconds"], 3),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="比較分段搜尋與倍增搜尋尋找最小有效序號的探測次數與時間")
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help=f"以逗號分隔的情境：{','.join(SCENARIOS)}")
+    parser.add_argument('--rtts', default='0.01,0.1,0.3', help="以逗號分隔的模擬往返時間(秒)")
+    parser.add_argument('--jitter', type=float, default=0.0, help="往返時間的隨機增量上限(秒)")
+    parser.add_argument('--json', default='', help="將結果寫入JSON檔案")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'情境':<8}{'RTT':>6}{'方法':>8}{'結果':>6}{'探測':>8}{'秒':>8}")
+    for name in args.scenarios.split(','):
+        if name not in SCENARIOS:
+            raise SystemExit(f"未知的情境：{name}")
+        value, minimum = SCENARIOS[name]
+        for rtt in (float(rtt) for rtt in args.rtts.split(',')):
+            for method in ('split', 'gallop'):
+                result = asyncio.run(measure(method, value, minimum, rtt, args.jitter))
+                result.update(scenario=name, rtt=rtt)
+                results.append(result)
+                print(f"{name:<8}{rtt:>6.2f}{method:>8}{'正確' if result['correct'] else '錯誤':>6}{result['probes']:>8}{result['seconds']:>8.2f}")
+                sys.stdout.flush()
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
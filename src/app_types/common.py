@@ -27,6 +27,12 @@ class FileInfo:
     format_path: str
     fill: int
 
+@dataclass
+class DownloadStats:
+    requests_saved: int = 0
+    bytes_saved: int = 0
+    probe_requests: int = 0
+
 @dataclass
 class FormatInfo:
     url: str = ""
@@ -8,6 +8,10 @@ class MediaPlaylistFileInfo:
     media_type: str = ""
     line: str = ""
     filepath: str = ""
+    name: str = ""
+    default: bool = False
+    audio_group: str = ""
+    subtitle_group: str = ""
     
 @dataclass
 class MasterPlaylistInfo:
@@ -22,6 +26,11 @@ class MediaFile:
     extinf: float = 0
     path: str = ""
     time: str = ""
+    sequence: int = 0
+    byterange_length: int = 0
+    byterange_offset: int = 0
+    key_url: str = ""
+    iv: str = ""
 
 @dataclass
 class MediaPlaylistInfo:
@@ -37,7 +46,10 @@ class MediaPlaylistInfo:
     target_duration: int = 0
     version: int = 0
     media_sequence: int = 0
+    byterange: bool = False
+    endlist: bool = False  # 出現EXT-X-ENDLIST，播放清單不會再新增碎片
     files: list[MediaFile] = field(default_factory=list)
+    new_files: list[MediaFile] = field(default_factory=list)
 
 @dataclass
 class M3U8Info:
@@ -49,6 +61,16 @@ class M3U8Info:
     user_agent: str | None = None
     cookies: str | webdriver.Chrome | dict | None = None
 
+@dataclass
+class ShardJob:
+    """多行程下載的工作：一個m3u8任務，或依媒體序號分配的部分碎片"""
+    job_id: int
+    m3u8_info: M3U8Info
+    output_path: str
+    options: dict = field(default_factory=dict)  # m3u8_downloader的其他參數
+    shard: tuple[int, int] | None = None  # (編號, 總數)，None為整個任務
+    run_id: str = ''  # 同一次多行程下載的編號，標記保存的播放清單快照
+
 @dataclass
 class PatchInfo:
     base: str = ""
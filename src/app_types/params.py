@@ -67,6 +67,30 @@ class DefaultParams:
             "help": "user_agent，平常不用設定，如果無法下載可以手動添加",
             }
         )
+    max_connections: int = field(
+        default= 30,
+        metadata={
+            "help": "全域同時連線數\n所有m3u8任務共用的碎片下載連線上限",
+            }
+        )
+    host_connections: int = field(
+        default= 10,
+        metadata={
+            "help": "單一主機同時連線數上限\n所有m3u8任務對同一個主機的連線上限，收到限流訊號(429/503、延遲上升)時自動減少，回應正常後逐步恢復至此值",
+            }
+        )
+    metrics_port: int = field(
+        default= 0,
+        metadata={
+            "help": "指標伺服器埠號\n大於0時提供/metrics(Prometheus)與/metrics.json，0為停用",
+            }
+        )
+    metrics_file: str = field(
+        default= '',
+        metadata={
+            "help": "指標JSON檔案路徑\n下載期間每5秒寫入一次各任務的指標",
+            }
+        )
 
 @dataclass
 class WebParams():
@@ -140,12 +164,84 @@ class DownloadParams():
             "help": "邊下載中解密",
             }
         )
+    decrypt_workers: int = field(
+        default= 0,
+        metadata={
+            "help": "解密工作者數量\n所有m3u8任務共用的解密執行緒數，0為CPU核心數",
+            }
+        )
+    keep_encrypted: bool = field(
+        default= True,
+        metadata={
+            "help": "解密時保留加密碎片\n關閉時只寫入解密後的碎片，並以解密碎片合併",
+            }
+        )
     merge: bool = field(
         default= True,
         metadata={
             "help": "下載完成後合併媒體",
             }
         )
+    merge_method: str = field(
+        default= 'ffmpeg',
+        metadata={
+            "help": "合併方式\nffmpeg：透過檔案伺服器以ffmpeg封裝為MP4；concat：直接以位元組串接碎片，不需網路與ffmpeg",
+            }
+        )
+    live_remux: bool = field(
+        default= False,
+        metadata={
+            "help": "即時封裝\n下載期間依序將碎片寫入ffmpeg，直播結束後即可取得fragmented MP4",
+            }
+        )
+    renditions: bool = field(
+        default= True,
+        metadata={
+            "help": "下載獨立音訊與字幕\n同時下載主播放清單中與影像關聯的EXT-X-MEDIA音訊、字幕，並於合併時封裝",
+            }
+        )
+    processes: int = field(
+        default= 0,
+        metadata={
+            "help": "下載行程數\n大於1時將任務分配給多個行程，任務數少於行程數時依媒體序號分割同一任務的碎片，結束後由主行程合併",
+            }
+        )
+    single_loop: bool = field(
+        default= False,
+        metadata={
+            "help": "單一事件迴圈\n所有m3u8任務於同一事件迴圈執行並共用連線池，同一CDN的任務共用連線保持與DNS快取",
+            }
+        )
+    transport: str = field(
+        default= 'aiohttp',
+        metadata={
+            "help": "HTTP傳輸方式\naiohttp：HTTP/1.1連線池；http2：同一主機的碎片多工於HTTP/2連線，伺服器不支援時退回HTTP/1.1，需安裝httpx[http2]",
+            }
+        )
+    merge_workers: int = field(
+        default= 2,
+        metadata={
+            "help": "同時合併數量\n依排隊順序合併，仍有任務在下載時只允許一個合併進行",
+            }
+        )
+    verify: str = field(
+        default= 'record',
+        metadata={
+            "help": "已存在碎片的檢查方式\nrecord：信任碎片紀錄的大小，無紀錄時探測；probe：以HEAD或Range探測；get：完整請求比對大小",
+            }
+        )
+    profile: bool = field(
+        default= False,
+        metadata={
+            "help": "效能分析\n以cProfile與tracemalloc分析每個任務，報告寫入備份資料夾的profile資料夾",
+            }
+        )
+    profile_lag: float = field(
+        default= 0.1,
+        metadata={
+            "help": "事件迴圈阻塞門檻(秒)\n效能分析時，事件迴圈阻塞超過此秒數會記錄當下的呼叫堆疊",
+            }
+        )
 
 @dataclass
 class AllParams(WebParams, DefaultParams, DownloadParams):
@@ -4,6 +4,21 @@ import sys
 import time
 import logging
 import threading
+import contextvars
+
+
+# 目前任務名稱，多個任務共用同一事件迴圈或交由執行緒池執行時，以此取代日誌的threadName
+mission_name: contextvars.ContextVar[str | None] = contextvars.ContextVar('mission_name', default=None)
+_record_factory = logging.getLogRecordFactory()
+
+def mission_record_factory(*args, **kwargs):
+    record = _record_factory(*args, **kwargs)
+    name = mission_name.get()
+    if name is not None:
+        record.threadName = name
+    return record
+
+logging.setLogRecordFactory(mission_record_factory)
 
 
 def get_time():
@@ -22,11 +37,13 @@ class ThreadLogFilter(logging.Filter):
         return record.threadName == self.thread_name
 
 
-def start_thread_logging(log_file):
+def start_thread_logging(log_file, thread_name=None):
     """
     Add a log handler to separate file for current thread
+    thread_name: mission name when the mission does not own a thread (see mission_name)
     """
-    thread_name = threading.Thread.getName(threading.current_thread())
+    if thread_name is None:
+        thread_name = threading.Thread.getName(threading.current_thread())
     log_handler = logging.FileHandler(log_file)
 
     log_handler.setLevel(logging.DEBUG)
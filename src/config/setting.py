@@ -34,7 +34,7 @@ def parse_args(description="") -> argparse.ArgumentParser:
         description=description,
         formatter_class=CustomHelpFormatter
     )
-    for f in fields(params.WebParams):
+    for f in fields(params.AllParams):
         arg_type = f.type
         default = f.default_factory() if f.default_factory is not MISSING else f.default
         nargs = f.metadata.get("nargs", None)
@@ -0,0 +1,93 @@
+import time
+import logging
+
+log = logging.getLogger(__name__)
+
+
+class PollScheduler:
+    """
+    依據EXT-X-TARGETDURATION決定播放清單的輪詢間隔
+    HLS規範：播放清單有變更時，自開始讀取起至少等待target duration；未變更時等待target duration的一半
+    連續未變更時以backoff倍率拉長間隔，並將下一次讀取對齊下一個碎片預期出現的時間
+    播放清單出現EXT-X-ENDLIST或為VOD時立即結束；未變更超過stall_durations個target duration(至少min_stall_time秒)時視為直播結束
+    """
+
+    def __init__(self, default_interval: float = 3, min_interval: float = 0.5, max_interval: float = 30, backoff: float = 1.5, stall_durations: float = 3, min_stall_time: float = 30):
+        self.default_interval = default_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.stall_durations = stall_durations
+        self.min_stall_time = min_stall_time
+
+        self.target_duration: float = 0
+        self.unchanged_times = 0
+        self.reload_start_time: float | None = None
+        self.last_change_time: float | None = None
+        self.last_extinf: float = 0
+        self.unchanged_since: float | None = None  # 播放清單最後一次出現新碎片(或首次讀取)的時間
+        self.ended = False
+
+    def start_reload(self) -> None:
+        """於開始讀取播放清單前呼叫，間隔從開始讀取的時間起算"""
+        self.reload_start_time = time.monotonic()
+
+    def update(self, target_duration: float, changed: bool, last_extinf: float = 0, ended: bool = False) -> None:
+        """
+        :param target_duration: 媒體播放清單的EXT-X-TARGETDURATION
+        :param changed: 本次讀取是否出現新的碎片
+        :param last_extinf: 最新碎片的EXTINF長度，用於預估下一個碎片出現的時間
+        :param ended: 播放清單已有EXT-X-ENDLIST或為VOD，不需再讀取
+        """
+        self.target_duration = target_duration
+        self.ended = self.ended or ended
+        reload_time = self.reload_start_time or time.monotonic()
+        if changed:
+            self.unchanged_times = 0
+            self.last_change_time = reload_time
+            self.unchanged_since = reload_time
+            self.last_extinf = last_extinf or target_duration
+        else:
+            self.unchanged_times += 1
+            if self.unchanged_since is None:
+                self.unchanged_since = reload_time
+
+    def stall_timeout(self) -> float:
+        """播放清單未變更多久後視為直播結束"""
+        return max(self.min_stall_time, self.stall_durations * self.target_duration)
+
+    def finished(self) -> bool:
+        """播放清單已結束，或未變更的時間超過stall_timeout"""
+        if self.ended:
+            return True
+        if self.unchanged_times == 0 or self.unchanged_since is None:
+            return False
+        return time.monotonic() - self.unchanged_since >= self.stall_timeout()
+
+    def next_delay(self) -> float:
+        """取得距離下一次讀取播放清單的秒數"""
+        if self.target_duration <= 0:
+            return self.default_interval
+
+        now = time.monotonic()
+        if self.unchanged_times == 0:
+            delay = self.target_duration
+        else:
+            delay = self.target_duration / 2 * self.backoff ** (self.unchanged_times - 1)
+        delay = min(delay, self.max_interval)
+        if self.reload_start_time is not None:
+            delay -= now - self.reload_start_time
+
+        # 對齊下一個碎片預期出現的時間，避免在碎片出現前白白讀取
+        if self.last_change_time is not None and self.unchanged_times > 0:
+            expected = self.last_change_time + self.last_extinf - now
+            if delay < expected <= self.max_interval:
+                delay = expected
+
+        # 拉長的間隔不超過判定結束的時間點，結束的判定不受backoff延後
+        if self.unchanged_since is not None and self.unchanged_times > 0:
+            delay = min(delay, self.unchanged_since + self.stall_timeout() - now)
+
+        delay = max(self.min_interval, delay)
+        log.debug(f"下一次讀取播放清單間隔：{delay:.2f} 秒（目標長度：{self.target_duration}，未變更次數：{self.unchanged_times}）")
+        return delay
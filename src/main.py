@@ -12,7 +12,7 @@ from concurrent.futures import ThreadPoolExecutor
 from src.app_types import params
 from src.utils import set_cookies, default_info, path
 from src.config import logger, setting
-from src.services import downloader, driver_tools, m3u8_downloader
+from src.services import downloader, driver_tools, m3u8_downloader, scheduler, decrypt, merge_queue, metrics, orchestrator, coordinator
 from src.app_types import common
 import src.web_modules
 from src import __description__
@@ -84,24 +84,83 @@ def download(config: params.AllParams, mission: common.Mission) -> None:
     if config.media:
         with ThreadPoolExecutor(max_workers=config.threads) as executor:
             threadPool = []
-            lock = threading.Lock()
+            merges = merge_queue.MergeQueue(config.merge_workers)
+            connection_scheduler = scheduler.ConnectionScheduler(config.max_connections, config.host_connections)
+            decrypt_pool = decrypt.DecryptPool(config.decrypt_workers or None) if config.decrypt else None
+            exporter = metrics.MetricsExporter(config.metrics_port, config.metrics_file)
+            exporter.start()
             name_length = max(len(m3u8_info.filename) for m3u8_info in mission.m3u8s)
+            dl_missions = []
+            shard_missions = []
+            use_processes = config.processes > 1 and not any(isinstance(m3u8_info.cookies, driver_tools.webdriver.Chrome) for m3u8_info in mission.m3u8s)
+            if config.processes > 1 and not use_processes:
+                log.warning('瀏覽器的cookies無法傳遞給其他行程，改用執行緒模式下載')
             for m3u8_info in mission.m3u8s:
                 m3u8_info.order = config.quantity
                 output_path = os.path.join(config.output, m3u8_info.folder)
+                if use_processes:
+                    shard_missions.append((m3u8_info, output_path))
+                    continue
                 dl_mission = m3u8_downloader.m3u8_downloader(
                     m3u8_info= m3u8_info,
-                    merge_lock= lock,
+                    merge_queue= merges,
+                    connection_scheduler= connection_scheduler,
                     convert_tool= config.tool,
                     output_path= output_path,
                     decrypt= config.decrypt,
+                    keep_encrypted= config.keep_encrypted,
+                    decrypt_pool= decrypt_pool,
                     full_download=getattr(config, 'full_download', False),
                     merge = config.merge,
+                    verify = config.verify,
+                    merge_method = config.merge_method,
+                    live_remux = config.live_remux,
+                    renditions = config.renditions,
+                    profile = config.profile,
+                    profile_lag = config.profile_lag,
+                    transport = config.transport,
                     stop_flag=stop_flag
                 )
-                thread = executor.submit(dl_mission.main, name_length)
                 log.info(f'開始下載m3u8文件：\"{m3u8_info.url}\"')
-                threadPool.append(thread)
+                if config.single_loop:
+                    dl_missions.append(dl_mission)
+                else:
+                    threadPool.append(executor.submit(dl_mission.main, name_length))
+            if use_processes:
+                # 任務或碎片分配給多個行程下載，協調器彙整進度並合併
+                mission_coordinator = coordinator.Coordinator(
+                    shard_missions,
+                    options={
+                        "convert_tool": config.tool,
+                        "decrypt": config.decrypt,
+                        "keep_encrypted": config.keep_encrypted,
+                        "full_download": getattr(config, 'full_download', False),
+                        "merge": config.merge,
+                        "verify": config.verify,
+                        "merge_method": config.merge_method,
+                        "renditions": config.renditions,
+                        "transport": config.transport,
+                    },
+                    stop_flag=stop_flag,
+                    processes=config.processes,
+                    max_connections=config.max_connections,
+                    host_connections=config.host_connections,
+                    decrypt_workers=config.decrypt_workers,
+                    merge_workers=config.merge_workers,
+                    threads=config.threads,
+                )
+                threadPool.append(executor.submit(mission_coordinator.main, name_length))
+            elif config.single_loop:
+                # 所有任務於同一事件迴圈執行，共用連線池
+                mission_orchestrator = orchestrator.Orchestrator(
+                    dl_missions,
+                    max_missions=config.threads,
+                    connection_limit=config.max_connections * 2,
+                    profile=config.profile,
+                    profile_lag=config.profile_lag,
+                    profile_folder=config.output,
+                )
+                threadPool.append(executor.submit(mission_orchestrator.main, name_length))
             try:
                 while any(not t.done() for t in threadPool):
                     time.sleep(1)
@@ -118,6 +177,9 @@ def download(config: params.AllParams, mission: common.Mission) -> None:
                         future.result(timeout=1)
                     except Exception as e:
                         log.error(f'任務異常終止：{e}')
+                if decrypt_pool:
+                    decrypt_pool.shutdown()
+                exporter.stop()
     if config.attachment and mission.attachments:
         source_cookies = mission.attachments.cookies
         cookies = set_cookies.load_cookies_to_dict(source_cookies)
@@ -125,7 +187,8 @@ def download(config: params.AllParams, mission: common.Mission) -> None:
             mission.attachments,
             config.output,
             source_cookies.current_url if isinstance(source_cookies, driver_tools.webdriver.Chrome) else config.url,
-            cookies
+            cookies,
+            config.transport
             )
         asyncio.run(task)
 
@@ -0,0 +1,188 @@
+import os
+import time
+import uuid
+import queue
+import signal
+import logging
+import threading
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from src.app_types import m3u8
+from src.config import logger
+from src.services import decrypt, merge_queue, metrics, scheduler
+from src.services.m3u8_downloader import m3u8_downloader, remove_snapshots
+
+log = logging.getLogger(__name__)
+
+
+def run_shard(job: m3u8.ShardJob, progress_queue, stop_event, max_connections: int, host_connections: int, decrypt_workers: int, name_length: int) -> None:
+    """
+    工作行程：下載分配到的任務或部分碎片，寫入與單一行程相同的fragments/資料夾，不合併
+    Ctrl+C由協調器處理，工作行程透過stop_event停止
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logger.set_log_config()
+    stop_flag = threading.Event()
+
+    def watch_stop():
+        while not stop_flag.is_set():
+            if stop_event.is_set():
+                stop_flag.set()
+                break
+            time.sleep(1)
+
+    options = dict(job.options)
+    # 合併與即時封裝由協調器在所有行程結束後進行
+    options.pop("merge", None)
+    options.pop("live_remux", None)
+    decrypt_pool = decrypt.DecryptPool(decrypt_workers or None) if options.get("decrypt") else None
+    mission = m3u8_downloader(
+        stop_flag, job.m3u8_info,
+        connection_scheduler=scheduler.ConnectionScheduler(max_connections, host_connections),
+        output_path=job.output_path,
+        decrypt_pool=decrypt_pool,
+        shard=job.shard,
+        merge=False,
+        live_remux=False,
+        **options,
+    )
+    mission.progress = lambda num, status, size: progress_queue.put((job.job_id, num, status, size))
+    mission.run_id = job.run_id
+    watcher = threading.Thread(target=watch_stop, daemon=True)
+    watcher.start()
+    try:
+        mission.main(name_length)
+    finally:
+        stop_flag.set()
+        # 保存此行程使用的播放清單，合併時不再重新請求(直播結束後播放清單可能已失效)
+        try:
+            mission.save_snapshot()
+        except Exception as e:
+            log.error(f'播放清單快照保存失敗：{job.m3u8_info.filename} {job.shard} - {e}')
+        if decrypt_pool:
+            decrypt_pool.shutdown()
+        progress_queue.put((job.job_id, None, "Finished", 0))
+
+
+class Coordinator:
+    """
+    多行程下載的協調器：將任務分配給工作行程，任務數少於行程數時依媒體序號將同一任務的碎片分給多個行程
+    各行程寫入相同的fragments/與碎片紀錄，協調器經由佇列彙整進度，全部結束後讀取紀錄並合併
+    cookies為瀏覽器(webdriver)的任務無法傳遞給其他行程，由呼叫端改用執行緒模式
+    """
+
+    def __init__(self, missions: list[tuple[m3u8.M3U8Info, str]], options: dict, stop_flag: threading.Event, processes: int = 2, max_connections: int = 30, host_connections: int = 10, decrypt_workers: int = 0, merge_workers: int = 2, threads: int = 3):
+        self.missions = missions
+        self.options = options
+        self.stop_flag = stop_flag
+        self.processes = max(1, processes)
+        # 連線數由各行程平分
+        self.max_connections = max(1, max_connections // self.processes)
+        self.host_connections = max(1, host_connections // self.processes)
+        self.decrypt_workers = decrypt_workers
+        self.merge_workers = merge_workers
+        self.threads = threads
+        self.progress: dict[int, Counter[str]] = {}
+        self.bytes: Counter[int] = Counter()
+        self.run_id = uuid.uuid4().hex  # 標記本次執行保存的播放清單快照，合併時不使用先前執行留下的快照
+
+    def plan(self) -> list[m3u8.ShardJob]:
+        """任務數少於行程數時切分碎片；回推下載需依序號探測，不切分"""
+        shards = max(1, self.processes // len(self.missions))
+        jobs = []
+        for mission_id, (m3u8_info, output_path) in enumerate(self.missions):
+            count = 1 if self.options.get("full_download") else shards
+            for index in range(count):
+                options = dict(self.options)
+                # 音訊與字幕只由第一個行程下載
+                options["renditions"] = options.get("renditions", True) and index == 0
+                jobs.append(m3u8.ShardJob(
+                    job_id=mission_id,
+                    m3u8_info=m3u8_info,
+                    output_path=output_path,
+                    options=options,
+                    shard=(index, count) if count > 1 else None,
+                    run_id=self.run_id,
+                ))
+        return jobs
+
+    def collect(self, progress_queue, running: dict[int, int]) -> None:
+        """彙整工作行程回報的碎片狀態，並定期輸出進度"""
+        last_report = time.monotonic()
+        mission_metrics = {mission_id: metrics.registry.register(f"{m3u8_info.filename}#shards") for mission_id, (m3u8_info, _) in enumerate(self.missions)}
+        while any(running.values()):
+            try:
+                job_id, num, status, size = progress_queue.get(timeout=1)
+            except queue.Empty:
+                job_id = None
+            if job_id is not None:
+                if num is None:
+                    running[job_id] -= 1
+                else:
+                    self.progress.setdefault(job_id, Counter())[status] += 1
+                    self.bytes[job_id] += size
+                    mission_metrics[job_id].segment_finished(status, size)
+            if time.monotonic() - last_report >= 10:
+                last_report = time.monotonic()
+                for mission_id, counts in self.progress.items():
+                    log.info(f"多行程進度：{self.missions[mission_id][0].filename} 成功{counts['Successful']}個，失敗{counts['Failed']}個，{self.bytes[mission_id] / 1024 / 1024:.2f} MB")
+
+    def download(self, jobs: list[m3u8.ShardJob], name_length: int) -> None:
+        for m3u8_info, output_path in self.missions:
+            remove_snapshots(os.path.join(output_path, 'backup', m3u8_info.filename))
+        context = multiprocessing.get_context('spawn')
+        with context.Manager() as manager:
+            progress_queue = manager.Queue()
+            stop_event = manager.Event()
+            running = Counter(job.job_id for job in jobs)
+            collector = threading.Thread(target=self.collect, args=(progress_queue, running), daemon=True)
+            collector.start()
+            with ProcessPoolExecutor(max_workers=self.processes, mp_context=context) as pool:
+                futures = [
+                    pool.submit(run_shard, job, progress_queue, stop_event, self.max_connections, self.host_connections, self.decrypt_workers, name_length)
+                    for job in jobs
+                ]
+                while any(not future.done() for future in futures):
+                    if self.stop_flag.is_set() and not stop_event.is_set():
+                        log.warning('🛑 收到停止訊號，通知所有工作行程停止')
+                        stop_event.set()
+                    time.sleep(1)
+                for job, future in zip(jobs, futures):
+                    try:
+                        future.result()
+                    except Exception as e:
+                        log.error(f'工作行程異常終止：{job.m3u8_info.filename} {job.shard} - {e}')
+                        # 異常結束的行程不會回報完成
+                        progress_queue.put((job.job_id, None, "Finished", 0))
+            collector.join()
+
+    def finalize(self, name_length: int) -> None:
+        """於協調器中讀取各行程保存的播放清單快照與碎片紀錄並合併，不重新請求播放清單；合併數量依合併佇列限制"""
+        merges = merge_queue.MergeQueue(self.merge_workers)
+        decrypt_pool = decrypt.DecryptPool(self.decrypt_workers or None) if self.options.get("decrypt") else None
+        options = dict(self.options)
+        options["full_download"] = False
+        missions = [
+            m3u8_downloader(self.stop_flag, m3u8_info, merge_queue=merges, output_path=output_path, decrypt_pool=decrypt_pool, **options)
+            for m3u8_info, output_path in self.missions
+        ]
+        for mission in missions:
+            mission.run_id = self.run_id
+        try:
+            with ThreadPoolExecutor(max_workers=self.threads) as executor:
+                for mission, future in [(mission, executor.submit(mission.finalize, name_length)) for mission in missions]:
+                    try:
+                        future.result()
+                    except Exception as e:
+                        log.error(f'合併異常終止：{mission.m3u8_info.filename} - {e}')
+        finally:
+            if decrypt_pool:
+                decrypt_pool.shutdown()
+
+    def main(self, name_length: int = 0) -> None:
+        jobs = self.plan()
+        log.info(f"多行程下載：{len(self.missions)}個任務分為{len(jobs)}個工作，使用{self.processes}個行程")
+        self.download(jobs, name_length)
+        self.finalize(name_length)
@@ -1,7 +1,12 @@
 from Crypto.Cipher import AES
 import os
 import sys
+import time
+import shutil
+import asyncio
 import logging
+import argparse
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 
 log = logging.getLogger(__name__)
 
@@ -9,9 +14,14 @@ def set_logger(new_log):
     current_module = sys.modules[__name__]  # 取得 `c` 模組的引用
     setattr(current_module, "log", new_log)
 
-def process_iv(iv=None):
+def process_iv(iv=None, sequence: int | None = None):
+    '''
+    未指定IV時，依HLS規範以媒體序號(128位元大端序)作為IV，沒有序號時使用16個0字節
+    '''
     try:
-        if iv is None or iv == "":
+        if (iv is None or iv == "") and sequence is not None:
+            iv = sequence.to_bytes(16, 'big')
+        elif iv is None or iv == "":
             iv = bytes(16)  # 默認 16 個 0 字節
         elif isinstance(iv, (bytes, bytearray)):
             pass  # 已经是 bytes，直接返回
@@ -25,6 +35,40 @@ def process_iv(iv=None):
         raise ValueError(f"Invalid IV format: {e}") from e
     return iv
 
+def unpad(data: bytes) -> bytes:
+    """去除PKCS7填充，填充不合法時保留原始內容"""
+    if len(data) > 0:
+        padding_length = data[-1]
+        if 0 < padding_length <= 16 and data[-padding_length:] == bytes([padding_length]) * padding_length:
+            return data[:-padding_length]
+    return data
+
+class StreamDecryptor:
+    """
+    AES-128 CBC串流解密，下載時逐段輸入密文並取得明文
+    最後一個區塊保留至finalize時處理填充
+    """
+
+    def __init__(self, key: bytes, iv=None):
+        self.cipher = AES.new(key, AES.MODE_CBC, process_iv(iv))
+        self.buffer = b''
+
+    def update(self, data: bytes) -> bytes:
+        data = self.buffer + data
+        usable = len(data) - len(data) % AES.block_size
+        if usable == len(data):
+            usable -= AES.block_size  # 保留最後一個完整區塊
+        self.buffer = data[usable:]
+        return self.cipher.decrypt(data[:usable]) if usable > 0 else b''
+
+    def finalize(self) -> bytes:
+        if not self.buffer:
+            return b''
+        if len(self.buffer) % AES.block_size:
+            raise ValueError(f"密文長度不是{AES.block_size}的倍數")
+        data, self.buffer = self.cipher.decrypt(self.buffer), b''
+        return unpad(data)
+
 def ts_with_key_file(ts_path, decrypted_path, key, iv=None):
     """
     解密單個 .ts 文件，並檢查解密後的文件格式（前 8 字節）。
@@ -33,7 +77,7 @@ def ts_with_key_file(ts_path, decrypted_path, key, iv=None):
     if os.path.exists(decrypted_path):
         decrypted_size = os.path.getsize(decrypted_path)
         encrypted_size = os.path.getsize(ts_path)
-        if decrypted_size == encrypted_size:
+        if encrypted_size - AES.block_size <= decrypted_size <= encrypted_size:
             log.warning(f"目標文件已存在: {decrypted_path}")
             return True
     
@@ -53,20 +97,18 @@ def ts_with_key_file(ts_path, decrypted_path, key, iv=None):
         decrypted_data = cipher.decrypt(encrypted_data)
         
         # 去除可能的填充
-        if len(decrypted_data) > 0:
-            padding_length = decrypted_data[-1]
-            if 0 < padding_length <= 16 and decrypted_data[-padding_length:] == bytes([padding_length]) * padding_length:
-                decrypted_data = decrypted_data[:-padding_length]
+        decrypted_data = unpad(decrypted_data)
         #print(decrypted_data[:16].hex())
-        # 寫入解密後的文件
-        with open(decrypted_path, 'wb') as outfile:
+        # 寫入解密後的文件，完成後才改名，中斷時不會留下不完整的明文
+        with open(decrypted_path + '.part', 'wb') as outfile:
             outfile.write(decrypted_data)
+        os.replace(decrypted_path + '.part', decrypted_path)
         
-        # 檢查解密後文件大小是否與原始文件大小一致
-        decrypted_size = os.path.getsize(decrypted_path)
-        encrypted_size = os.path.getsize(ts_path)
+        # 檢查解密後文件大小是否與原始文件大小一致，允許去除填充後少一個區塊
+        decrypted_size = len(decrypted_data)
+        encrypted_size = len(encrypted_data)
         
-        if decrypted_size != encrypted_size:
+        if not encrypted_size - AES.block_size <= decrypted_size <= encrypted_size:
             #log.warning(f"解密後的文件大小 ({decrypted_size} bytes) 與原始文件大小 ({encrypted_size} bytes) 不一致，文件已保存到: {decrypted_path}")
             return False
         
@@ -86,21 +128,124 @@ def ts_with_key_file(ts_path, decrypted_path, key, iv=None):
         return False
 
 
+class DecryptPool:
+    """
+    解密工作池，pycryptodome在解密時會釋放GIL，預設使用執行緒池
+    串流解密的StreamDecryptor帶有狀態，只能使用執行緒池；整檔解密可使用行程池
+    """
+
+    def __init__(self, workers: int | None = None, use_process: bool = False):
+        self.workers = workers or os.cpu_count() or 1
+        self.use_process = use_process
+        self.executor: Executor = ProcessPoolExecutor(max_workers=self.workers) if use_process else ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='decrypt')
+
+    def submit(self, ts_path, decrypted_path, key, iv=None):
+        """提交整檔解密，回傳Future"""
+        return self.executor.submit(ts_with_key_file, ts_path, decrypted_path, key, iv)
+
+    async def run(self, func, *args):
+        """於事件迴圈中等待工作池執行func，行程池時func與參數必須可序列化"""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+def load_playlist_entries(playlist_path: str) -> list[tuple[str, str | None, bytes | None]]:
+    """
+    從已儲存的媒體播放清單取得(檔名, 金鑰檔名, IV)列表
+    金鑰檔名為None表示使用預設金鑰，空字串表示該碎片未加密(METHOD=NONE)
+    """
+    from src.services import m3u8_graber
+    with open(playlist_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    media_playlist_info = m3u8_graber.process_media_playlist(playlist_path, content)
+    has_key = any(file.key_url for file in media_playlist_info.files)
+    entries = []
+    for file in media_playlist_info.files:
+        name = os.path.basename(file.path.split('?')[0])
+        if not has_key:
+            entries.append((name, None, process_iv(media_playlist_info.iv, file.sequence)))
+        elif file.key_url:
+            entries.append((name, os.path.basename(file.key_url.split('?')[0]), process_iv(file.iv, file.sequence)))
+        else:
+            entries.append((name, '', None))
+    return entries
+
+def decrypt_folder(source_folder: str, decrypted_folder: str, key: bytes, playlist_path: str | None = None, workers: int | None = None, use_process: bool = True) -> dict:
+    """
+    並行解密整個碎片資料夾，有播放清單時依播放清單取得檔案、金鑰與IV
+    :param key: 預設金鑰，播放清單中有指定金鑰檔時改用資料夾中的金鑰檔
+    :return: 檔案數、失敗數、位元組數、耗時與MB/s等統計
+    """
+    if playlist_path:
+        entries = load_playlist_entries(playlist_path)
+    else:
+        entries = [(name, None, None) for name in sorted(os.listdir(source_folder))
+                   if not name.endswith(('.key', '.m3u8', '.jsonl', '.log'))]
+    entries = [entry for entry in entries if os.path.isfile(os.path.join(source_folder, entry[0]))]
+    os.makedirs(decrypted_folder, exist_ok=True)
+
+    keys: dict[str, bytes] = {}
+    def get_key(key_file: str | None) -> bytes:
+        if key_file is None:
+            return key
+        if key_file not in keys:
+            with open(os.path.join(source_folder, key_file), 'rb') as f:
+                keys[key_file] = f.read()
+        return keys[key_file]
+
+    pool = DecryptPool(workers, use_process)
+    total_bytes = sum(os.path.getsize(os.path.join(source_folder, name)) for name, _, _ in entries)
+    start = time.perf_counter()
+    futures = {}
+    for name, key_file, iv in entries:
+        if key_file == '':
+            # 未加密的碎片直接複製
+            shutil.copy(os.path.join(source_folder, name), os.path.join(decrypted_folder, name))
+            continue
+        futures[pool.submit(os.path.join(source_folder, name), os.path.join(decrypted_folder, name), get_key(key_file), iv)] = name
+    failed = []
+    for future in as_completed(futures):
+        if not future.result():
+            failed.append(futures[future])
+    pool.shutdown()
+    elapsed = time.perf_counter() - start
+
+    mb_per_second = total_bytes / 1024 / 1024 / elapsed if elapsed > 0 else 0.0
+    result = {
+        "files": len(entries),
+        "failed": failed,
+        "bytes": total_bytes,
+        "seconds": elapsed,
+        "workers": pool.workers,
+        "mb_per_second": mb_per_second,
+        "mb_per_second_per_core": mb_per_second / pool.workers,
+    }
+    log.info(f"解密完成：{len(entries) - len(failed)}/{len(entries)}個檔案，{total_bytes / 1024 / 1024:.2f} MB，耗時{elapsed:.2f}秒")
+    log.info(f"解密速度：{mb_per_second:.2f} MB/s，每核心{result['mb_per_second_per_core']:.2f} MB/s（{pool.workers}個工作者）")
+    return result
+
+
 if __name__ == '__main__':
-    # 使用範例
-    source_folder = r"M:\自製資料\開發中\m3u8下載器\downloads\VALIS 6th ONE-MAN LIVE「喝采Curtain Call」 -  Z-aN\backup\VALIS 6th ONE-MAN LIVE「喝采Curtain Call」 -  Z-aN\fragments"
-    decrypted_folder = r"M:\自製資料\開發中\m3u8下載器\downloads\VALIS 6th ONE-MAN LIVE「喝采Curtain Call」 -  Z-aN\backup\VALIS 6th ONE-MAN LIVE「喝采Curtain Call」 -  Z-aN\decrypt"
-    ts_file_path = 'index_8_683900.ts'         # 加密的 .ts 文件路徑
-    key_file_path = 'server.key'             # 密鑰文件路徑
-    #iv_hex = '0x3DEFA6D2DC885ED5223B4D4B7C50A72F'  # 可選，初始化向量（如未指定，默認為 0 填充）
-    # 如果提供 IV，將其轉換為字節
-    #iv = bytes.fromhex(iv_hex.replace('0x', '')) if iv_hex else None
-    with open(os.path.join(source_folder, key_file_path), 'rb') as key_file:
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s | %(levelname)-8s | %(message)s')
+    parser = argparse.ArgumentParser(description="並行解密碎片資料夾")
+    parser.add_argument('fragments', help="碎片資料夾路徑")
+    parser.add_argument('--output', default='', help="解密輸出資料夾 (預設: 碎片資料夾旁的decrypt)")
+    parser.add_argument('--key', default='', help="金鑰檔案路徑 (預設: 碎片資料夾中的server.key)")
+    parser.add_argument('--playlist', default='', help="媒體播放清單路徑，用於取得檔案順序、輪替的金鑰與IV (預設: 碎片資料夾中的media.m3u8)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="工作者數量")
+    parser.add_argument('--thread', action='store_true', help="使用執行緒池取代行程池")
+    args = parser.parse_args()
+
+    key_path = args.key or os.path.join(args.fragments, 'server.key')
+    with open(key_path, 'rb') as key_file:
         key = key_file.read()
-    #print(f"IV: {iv.hex()} (len={len(iv)})" if iv else "IV: None")
-    print(f"Key: {key.hex()} (len={len(key)})")
-    # 執行解密
-    ts_with_key_file(os.path.join(source_folder, ts_file_path), os.path.join(decrypted_folder, ts_file_path), key)
-    #command = f"openssl aes-128-cbc -d -in {os.path.join(source_folder, ts_file_path)} -out {os.path.join(decrypted_folder)} -K 6806902080b0fc7c17e13611347802ee -iv 3defa6d2dc885ed5223b4d4b7c50a72f -nosalt"
-    #print(command)
-    #openssl aes-128-cbc -d -in "M:\自製資料\開發中\m3u8下載器\downloads\SINKA LIVE SERIES EP.Ⅵ V.W.P 3rd ONE-MAN LIVE 「現象Ⅲ-神椿市探訪中-」 -  Z-aN\視聴ページ\fragments\index_6_11083.ts" -out "M:\自製資料\開發中\m3u8下載器\downloads\SINKA LIVE SERIES EP.Ⅵ V.W.P 3rd ONE-MAN LIVE 「現象Ⅲ-神椿市探訪中-」 -  Z-aN\視聴ページ\decrypt\index_6_11083.ts" -K 6806902080b0fc7c17e13611347802ee -iv 0 -nosalt
\ No newline at end of file
+    playlist_path = args.playlist or os.path.join(args.fragments, 'media.m3u8')
+    decrypt_folder(
+        args.fragments,
+        args.output or os.path.join(os.path.dirname(os.path.abspath(args.fragments)), 'decrypt'),
+        key,
+        playlist_path if os.path.exists(playlist_path) else None,
+        args.workers,
+        not args.thread,
+    )
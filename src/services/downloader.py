@@ -2,19 +2,22 @@ import os
 import sys
 import time
 import json
-import aiohttp
 import asyncio
 import aiofiles
 import logging
 import requests
 import threading
+import contextlib
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from src.utils import default_info
 from src.app_types import common
+from src.services import scheduler, probe, decrypt, transport
 
 log = logging.getLogger(__name__)
 
+RANGE_PART_SIZE = 4 * 1024 * 1024  # 大型區段切割為多個Range請求的單位大小
+
 def set_logger(new_log):
     current_module = sys.modules[__name__]  # 取得 `c` 模組的引用
     setattr(current_module, "log", new_log)
@@ -107,16 +110,121 @@ def download_file_by_url(url: str, filepath: str, cookies: dict | None = None, h
     log.error(f"下載失敗，URL: {url}")
     return False
 
-async def async_download(url: str, filepath: str, session: aiohttp.ClientSession, retry_times=3, chunk_size=262144, timeout=10, size_check = True, log_fullpath=False):
+def size_matches(local_size: int, remote_size: int, padded: bool = False) -> bool:
+    """比對檔案大小，padded為True時表示本地為解密後的明文，最多少去一個AES區塊的填充"""
+    if padded:
+        return remote_size - 16 <= local_size <= remote_size
+    return local_size == remote_size
+
+async def verify_existing(url: str, filepath: str, session: transport.Transport, verify: str, known_size: int | None, size_check: bool, stats: common.DownloadStats | None, timeout=10, padded: bool = False) -> bool:
+    """
+    不傳輸內容的情況下檢查已存在的檔案是否完整，完整則回傳True
+    verify: record 信任本地紀錄的大小，沒有紀錄時探測；probe 一律以HEAD或Range探測
+    """
+    log_file = filepath.split(os.path.sep)[-1]
+    local_size = os.path.getsize(filepath)
+    if not size_check:
+        remote_size = local_size
+    elif verify == 'record' and known_size is not None:
+        remote_size = known_size
+    else:
+        remote_size = await probe.probe_size(url, session, timeout)
+        if stats is not None:
+            stats.probe_requests += 1
+    if remote_size is None:
+        return False
+    if not size_matches(local_size, remote_size, padded):
+        log.warning(f"檔案異常！移除檔案: {log_file}")
+        log.warning(f"檔案大小不匹配！伺服器大小: {remote_size}，本地大小: {local_size}")
+        os.remove(filepath)
+        return False
+    log.info(f"檔案已存在: {log_file}，符合大小: {local_size / 1024 / 1024:.2f} MB")
+    if stats is not None:
+        stats.requests_saved += 1
+        stats.bytes_saved += local_size
+    return True
+
+async def write_response(response: transport.Response, filepath: str | None, chunk_size: int, decryptor: decrypt.StreamDecryptor | None = None, decrypt_path: str | None = None, decrypt_pool: decrypt.DecryptPool | None = None) -> int:
+    """
+    將回應內容寫入檔案，提供decryptor時同步將明文寫入decrypt_path，filepath為None時不保留密文
+    提供decrypt_pool時解密運算交由工作池執行，不佔用事件迴圈
+    明文先寫入decrypt_path.part，解密完成才改名，中斷時不會留下不完整的明文
+    :return: 接收的位元組數
+    """
+    received = 0
+    plain_part = decrypt_path + '.part' if decryptor and decrypt_path else None
+    try:
+        async with contextlib.AsyncExitStack() as stack:
+            raw_file = await stack.enter_async_context(aiofiles.open(filepath, 'wb')) if filepath else None
+            plain_file = await stack.enter_async_context(aiofiles.open(plain_part, 'wb')) if plain_part else None
+            async for chunk in response.iter_chunked(chunk_size):
+                if chunk:  # 避免空內容
+                    received += len(chunk)
+                    if raw_file:
+                        await raw_file.write(chunk)
+                    if plain_file and decryptor:
+                        plain = await decrypt_pool.run(decryptor.update, chunk) if decrypt_pool else decryptor.update(chunk)
+                        await plain_file.write(plain)
+            if plain_file and decryptor:
+                await plain_file.write(decryptor.finalize())
+    except BaseException:
+        remove_files(plain_part)
+        raise
+    if plain_part:
+        os.replace(plain_part, decrypt_path)
+    return received
+
+def remove_files(*filepaths: str | None):
+    for filepath in filepaths:
+        if filepath and os.path.exists(filepath):
+            os.remove(filepath)
+
+async def async_download(url: str, filepath: str, session: transport.Transport, retry_times=3, chunk_size=262144, timeout=10, size_check = True, log_fullpath=False, verify: str = 'get', known_size: int | None = None, stats: common.DownloadStats | None = None, decrypt_key: bytes | None = None, decrypt_iv=None, decrypt_path: str | None = None, keep_encrypted: bool = True, decrypt_pool: decrypt.DecryptPool | None = None, connection_scheduler: scheduler.ConnectionScheduler | None = None):
+    """
+    :param verify: 已存在檔案的檢查方式，get 以完整請求的Content-Length比對；record、probe 不傳輸內容，見verify_existing
+    :param known_size: 本地紀錄的檔案大小
+    :param stats: 累計節省的請求數與位元組
+    :param decrypt_key: 提供時以AES-128 CBC邊下載邊解密，明文寫入decrypt_path
+    :param keep_encrypted: 解密時是否同時將密文保留於filepath
+    :param decrypt_pool: 解密工作池，未提供時於事件迴圈中解密
+    :param connection_scheduler: 回報每次請求的狀態碼與回應時間，調整主機的同時連線數；連線名額由呼叫端取得
+    """
     if not filepath:
         log.error("檔案路徑無效！")
         return False
-    timeout_context = aiohttp.ClientTimeout(total=timeout)
-    os.makedirs(os.path.dirname(filepath), exist_ok=True)
-    log_file = filepath if log_fullpath else filepath.split(os.path.sep)[-1]
+    decrypting = decrypt_key is not None and decrypt_path is not None
+    raw_path = filepath if keep_encrypted or not decrypting else None
+    # 不保留密文時，以解密後的明文判斷檔案是否已存在
+    check_path = raw_path or decrypt_path or filepath
+    padded = raw_path is None
+    for path in (raw_path, decrypt_path if decrypting else None):
+        if path:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+    log_file = check_path if log_fullpath else check_path.split(os.path.sep)[-1]
+
+    async def ensure_decrypted():
+        # 密文已存在但缺少明文或明文大小不符時，於執行緒中補做解密
+        if not (decrypting and raw_path):
+            return
+        if os.path.exists(decrypt_path) and not size_matches(os.path.getsize(decrypt_path), os.path.getsize(raw_path), padded=True):
+            log.warning(f"明文大小與密文不符，重新解密: {decrypt_path.split(os.path.sep)[-1]}")
+            os.remove(decrypt_path)
+        if not os.path.exists(decrypt_path):
+            if decrypt_pool:
+                await decrypt_pool.run(decrypt.ts_with_key_file, raw_path, decrypt_path, decrypt_key, decrypt_iv)
+            else:
+                await asyncio.to_thread(decrypt.ts_with_key_file, raw_path, decrypt_path, decrypt_key, decrypt_iv)
+
+    if verify != 'get' and os.path.exists(check_path):
+        if await verify_existing(url, check_path, session, verify, known_size, size_check, stats, timeout, padded):
+            await ensure_decrypted()
+            return True
     for attempt in range(1, retry_times + 1):
+        request_start = time.perf_counter()
         try:
-            async with session.get(url, timeout=timeout_context) as response:
+            async with session.get(url, timeout=timeout) as response:
+                if connection_scheduler is not None:
+                    connection_scheduler.report(url, response.status, time.perf_counter() - request_start)
                 if response.status != 200:
                     log.warning(f"HTTP 狀態碼錯誤: {response.status}，URL: {url}，嘗試次數: {attempt}")
                     await asyncio.sleep(3)
@@ -128,61 +236,134 @@ async def async_download(url: str, filepath: str, session: aiohttp.ClientSession
                     await asyncio.sleep(3)
                     continue
 
-                if os.path.exists(filepath):
-                    local_size = os.path.getsize(filepath)
+                if os.path.exists(check_path):
+                    local_size = os.path.getsize(check_path)
                     if size_check:
                         # 確認檔案大小一致
-                        if local_size != file_size:
+                        if not size_matches(local_size, file_size, padded):
                             log.warning(f"檔案異常！移除檔案: {log_file}")
                             log.warning(f"檔案大小不匹配！伺服器大小: {file_size}，本地大小: {local_size}，嘗試次數: {attempt}")
-                            os.remove(filepath)
+                            os.remove(check_path)
                         else:
                             log.info(f"檔案已存在: {log_file}，符合大小: {local_size / 1024 / 1024:.2f} MB")
                             response.close()
+                            await ensure_decrypted()
                             return True
                     else:
-                        log.info(f"檔案已存在: {filepath}，跳過檔案大小檢查")
+                        log.info(f"檔案已存在: {check_path}，跳過檔案大小檢查")
                         response.close()
+                        await ensure_decrypted()
                         return True
 
-                async with aiofiles.open(filepath, 'wb') as f:
-                    async for chunk in response.content.iter_chunked(chunk_size):
-                        if chunk:  # 避免空內容
-                            await f.write(chunk)
-                
-                local_size = os.path.getsize(filepath)
+                decryptor = decrypt.StreamDecryptor(decrypt_key, decrypt_iv) if decrypting and decrypt_key else None
+                local_size = await write_response(response, raw_path, chunk_size, decryptor, decrypt_path, decrypt_pool)
                 if size_check:
                     # 確認檔案大小一致
                     if local_size != file_size:
                         log.warning(f"檔案異常！移除檔案: {log_file}")
                         log.warning(f"檔案大小不匹配！伺服器大小: {file_size}，本地大小: {local_size}，嘗試次數: {attempt}")
                         await asyncio.sleep(3)
-                        os.remove(filepath)
+                        remove_files(raw_path, decrypt_path if decrypting else None)
                         continue
 
             log.info(f"下載成功: {log_file}，大小: {local_size / 1024 / 1024:.2f} MB")
             return True
         except asyncio.TimeoutError:
             log.warning(f"下載超時，URL: {url}，嘗試次數: {attempt}")
+            if connection_scheduler is not None:
+                connection_scheduler.report(url, None, time.perf_counter() - request_start)
+        except transport.TransportConnectionError as e:
+            log.warning(f"連線錯誤: {e}，URL: {url}，嘗試次數: {attempt}")
+            if connection_scheduler is not None:
+                connection_scheduler.report(url, None, time.perf_counter() - request_start)
         except Exception as e:
             log.warning(f"下載時發生其他錯誤: {e}，嘗試次數: {attempt}")
         await asyncio.sleep(1)
-        if os.path.exists(filepath):
-            os.remove(filepath)
+        remove_files(raw_path, decrypt_path if decrypting else None)
         await asyncio.sleep(3)
 
     log.error(f"下載失敗，URL: {url}")
     return False
 
+async def async_download_part(url: str, filepath: str, session: transport.Transport, start: int, end: int, file_start: int, retry_times=3, chunk_size=262144, timeout=30) -> bool:
+    """下載url的[start, end]位元組，寫入filepath的file_start位置"""
+    headers = {'Range': f'bytes={start}-{end}'}
+    expected = end - start + 1
+    for attempt in range(1, retry_times + 1):
+        try:
+            async with session.get(url, headers=headers, timeout=timeout) as response:
+                if response.status != 206:
+                    # 伺服器忽略Range時會回傳整個檔案，直接關閉連線避免傳輸多餘內容
+                    log.warning(f"分段請求狀態碼錯誤: {response.status}，範圍: {start}-{end}，URL: {url}，嘗試次數: {attempt}")
+                    response.close()
+                    await asyncio.sleep(3)
+                    continue
+                received = 0
+                async with aiofiles.open(filepath, 'r+b') as f:
+                    await f.seek(file_start)
+                    async for chunk in response.iter_chunked(chunk_size):
+                        if chunk:
+                            await f.write(chunk)
+                            received += len(chunk)
+                if received == expected:
+                    return True
+                log.warning(f"分段大小不匹配！預期: {expected}，實際: {received}，範圍: {start}-{end}，嘗試次數: {attempt}")
+        except asyncio.TimeoutError:
+            log.warning(f"分段下載超時，範圍: {start}-{end}，URL: {url}，嘗試次數: {attempt}")
+        except Exception as e:
+            log.warning(f"分段下載時發生其他錯誤: {e}，範圍: {start}-{end}，嘗試次數: {attempt}")
+        await asyncio.sleep(3)
+    return False
+
+async def async_download_range(url: str, filepath: str, session: transport.Transport, offset: int, length: int, connection_scheduler: scheduler.ConnectionScheduler | None = None, part_size=RANGE_PART_SIZE, retry_times=3, chunk_size=262144, timeout=30) -> bool:
+    """
+    下載EXT-X-BYTERANGE區段，超過part_size的區段切割為多個Range請求並行下載，寫入同一個檔案的對應位置
+    下載中寫入filepath.part，所有分段完成後才改名，中斷時不會留下大小正確但內容不完整的檔案
+    :param connection_scheduler: 每個分段各自取得連線名額，未提供則不限制
+    """
+    if not filepath:
+        log.error("檔案路徑無效！")
+        return False
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    log_file = filepath.split(os.path.sep)[-1]
+    if os.path.exists(filepath) and os.path.getsize(filepath) == length:
+        log.info(f"檔案已存在: {log_file}，符合大小: {length / 1024 / 1024:.2f} MB")
+        return True
+
+    # 預先配置暫存檔大小，各分段直接寫入對應位置
+    part_path = filepath + '.part'
+    async with aiofiles.open(part_path, 'wb') as f:
+        await f.truncate(length)
+
+    async def download_part(part_start: int) -> bool:
+        part_end = min(part_start + part_size, length) - 1
+        if connection_scheduler is None:
+            return await async_download_part(url, part_path, session, offset + part_start, offset + part_end, part_start, retry_times, chunk_size, timeout)
+        async with connection_scheduler.slot(url):
+            return await async_download_part(url, part_path, session, offset + part_start, offset + part_end, part_start, retry_times, chunk_size, timeout)
+
+    try:
+        results = await asyncio.gather(*(download_part(part_start) for part_start in range(0, length, part_size)))
+    except BaseException:
+        remove_files(part_path)
+        raise
+    if all(results):
+        os.replace(part_path, filepath)
+        log.info(f"下載成功: {log_file}，大小: {length / 1024 / 1024:.2f} MB，分段數: {len(results)}")
+        return True
+    remove_files(part_path)
+    log.error(f"下載失敗，範圍: {offset}-{offset + length - 1}，URL: {url}")
+    return False
+
 
-async def downlaod_attachment(attachments: common.AttachmentInfo, output_path: str, referer: str, cookies: dict[str, str] | None) -> None:
+async def downlaod_attachment(attachments: common.AttachmentInfo, output_path: str, referer: str, cookies: dict[str, str] | None, transport_name: str = 'aiohttp') -> None:
     task = []
     headers = {
         'User-Agent': default_info.DEFAULT_USER_AGENT,
         'Referer': referer
     }
 
-    session = aiohttp.ClientSession(headers=headers, cookies=cookies)
+    session = transport.create_transport(transport_name, headers, cookies)
     for name, info in attachments.files.items():
         if name == 'driver':
             continue
@@ -0,0 +1,68 @@
+import os
+import json
+import time
+import logging
+import threading
+
+log = logging.getLogger(__name__)
+
+JOURNAL_PREFIX = 'fragments'
+JOURNAL_SUFFIX = '.jsonl'
+
+
+class FragmentJournal:
+    """
+    碎片狀態的追加式紀錄檔(JSONL)，每完成一個碎片寫入一行
+    重新啟動任務時讀取紀錄，已完成且檔案大小相符的碎片不需要再次請求
+    多行程下載時各行程寫入各自的紀錄檔(fragments_<編號>.jsonl)，讀取時合併資料夾中所有紀錄檔
+    """
+
+    def __init__(self, folder: str, shard: int | None = None):
+        self.folder = folder
+        suffix = f'_{shard}' if shard is not None else ''
+        self.path = os.path.join(folder, f'{JOURNAL_PREFIX}{suffix}{JOURNAL_SUFFIX}')
+        self._lock = threading.Lock()
+
+    def paths(self) -> list[str]:
+        if not os.path.isdir(self.folder):
+            return []
+        return [
+            os.path.join(self.folder, name) for name in sorted(os.listdir(self.folder))
+            if name.startswith(JOURNAL_PREFIX) and name.endswith(JOURNAL_SUFFIX)
+        ]
+
+    def load(self) -> dict[int, dict]:
+        """讀取所有紀錄檔，同一序號以記錄時間最晚的一筆為準(同一檔案中為最後一筆)"""
+        records: dict[int, dict] = {}
+        for path in self.paths():
+            with open(path, 'r', encoding='utf-8') as f:
+                lines = f.readlines()
+            if path == self.path and lines and not lines[-1].endswith('\n'):
+                # 補上換行，避免新紀錄接在不完整的最後一行後面；其他行程的紀錄檔不修改
+                with open(path, 'a', encoding='utf-8') as f:
+                    f.write('\n')
+            for line in lines:
+                try:
+                    record = json.loads(line)
+                    number = int(record["number"])
+                except (ValueError, KeyError, TypeError):
+                    # 中斷時可能留下不完整的最後一行
+                    log.debug(f"略過無法解析的紀錄：{line.strip()}")
+                    continue
+                if number not in records or record.get("time", 0) >= records[number].get("time", 0):
+                    records[number] = record
+        return records
+
+    def record(self, number: int, filename: str, url: str, size: int, status: str, **extra) -> None:
+        line = json.dumps({
+            "number": number,
+            "filename": filename,
+            "url": url,
+            "size": size,
+            "status": status,
+            "time": time.time(),
+            **extra,
+        }, ensure_ascii=False)
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
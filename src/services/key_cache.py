@@ -0,0 +1,77 @@
+import asyncio
+import logging
+import threading
+
+from src.services import transport
+
+log = logging.getLogger(__name__)
+
+
+class KeyCache:
+    """
+    以金鑰網址為鍵的金鑰快取，同一程序內所有任務共用
+    每個任務有各自的事件迴圈，下載中的金鑰以(迴圈, 網址)記錄，避免同一迴圈重複請求
+    """
+
+    def __init__(self):
+        self._keys: dict[str, bytes] = {}
+        self._pending: dict[tuple[int, str], asyncio.Task] = {}
+        self._lock = threading.Lock()
+
+    def get_cached(self, url: str) -> bytes | None:
+        with self._lock:
+            return self._keys.get(url)
+
+    async def fetch(self, url: str, session: transport.Transport, retry_times=3, timeout=10) -> bytes | None:
+        for attempt in range(1, retry_times + 1):
+            try:
+                async with session.get(url, timeout=timeout) as response:
+                    if response.status == 200:
+                        key = await response.read()
+                        if len(key) == 16:
+                            return key
+                        log.warning(f"金鑰長度錯誤：{len(key)}，URL: {url}，嘗試次數: {attempt}")
+                    else:
+                        log.warning(f"金鑰下載狀態碼錯誤: {response.status}，URL: {url}，嘗試次數: {attempt}")
+            except (transport.TransportError, asyncio.TimeoutError) as e:
+                log.warning(f"金鑰下載時發生錯誤: {e}，URL: {url}，嘗試次數: {attempt}")
+            await asyncio.sleep(1)
+        return None
+
+    async def get(self, url: str, session: transport.Transport) -> bytes | None:
+        """取得金鑰，快取中沒有時下載，同一迴圈內同時請求同一金鑰只會下載一次"""
+        key = self.get_cached(url)
+        if key is not None:
+            return key
+        return await asyncio.shield(self._get_task(url, session))
+
+    def _get_task(self, url: str, session: transport.Transport) -> asyncio.Task:
+        pending_key = (id(asyncio.get_running_loop()), url)
+        with self._lock:
+            task = self._pending.get(pending_key)
+            if task is None:
+                task = asyncio.create_task(self._download(url, session, pending_key))
+                self._pending[pending_key] = task
+        return task
+
+    async def _download(self, url: str, session: transport.Transport, pending_key: tuple[int, str]) -> bytes | None:
+        try:
+            key = await self.fetch(url, session)
+            if key is not None:
+                with self._lock:
+                    self._keys[url] = key
+                log.info(f"取得金鑰：{url}")
+            return key
+        finally:
+            with self._lock:
+                self._pending.pop(pending_key, None)
+
+    def prefetch(self, urls, session: transport.Transport) -> None:
+        """預先下載即將使用的金鑰，不等待結果"""
+        for url in urls:
+            if url and self.get_cached(url) is None:
+                self._get_task(url, session)
+
+
+# 程序內所有任務共用的金鑰快取
+key_cache = KeyCache()
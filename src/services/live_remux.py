@@ -0,0 +1,142 @@
+import os
+import sys
+import asyncio
+import logging
+from collections import deque
+
+log = logging.getLogger(__name__)
+
+def set_logger(new_log):
+    current_module = sys.modules[__name__]  # 取得 `c` 模組的引用
+    setattr(current_module, "log", new_log)
+
+class LiveRemuxer:
+    """
+    下載期間將完成的碎片依序寫入常駐的ffmpeg標準輸入，邊下載邊封裝為fragmented MP4
+    碎片依加入下載的順序(expect)寫入，先完成的碎片暫存於重排緩衝區，
+    緩衝區超過上限時放棄仍未完成的最前面碎片，避免單一碎片卡住整條管線；
+    有略過的碎片時輸出不完整，close回傳False，由一般合併流程重新產生
+    """
+
+    def __init__(self, tool: str, output_path: str, log_path: str | None = None, init_segment: str | None = None, reorder_limit: int = 30, chunk_size: int = 1024 * 1024):
+        self.tool = tool
+        self.output_path = output_path
+        self.log_path = log_path
+        self.init_segment = init_segment
+        self.reorder_limit = max(1, reorder_limit)
+        self.chunk_size = chunk_size
+
+        self.process: asyncio.subprocess.Process | None = None
+        self._order: deque[int] = deque()  # 等待寫入的碎片序號，依加入順序排列
+        self._ready: dict[int, str | None] = {}  # 已完成的碎片，None表示下載失敗
+        self._expected: set[int] = set()
+        self._waiting: set[int] = set()  # 尚在_order中的碎片
+        self._write_lock = asyncio.Lock()
+        self._log_file = None
+        self.written = 0
+        self.dropped = 0
+
+    async def start(self) -> bool:
+        command = [
+            self.tool, '-hide_banner', '-y',
+            '-i', 'pipe:0',
+            '-c', 'copy',
+            '-movflags', '+frag_keyframe+empty_moov+default_base_moof',
+            '-f', 'mp4', self.output_path,
+        ]
+        log.debug(' '.join(command))
+        self._log_file = open(self.log_path, 'ab') if self.log_path else None
+        try:
+            self.process = await asyncio.create_subprocess_exec(
+                *command,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=self._log_file or asyncio.subprocess.DEVNULL,
+            )
+        except OSError as e:
+            log.error(f"無法啟動ffmpeg進行即時封裝：{e}")
+            self._close_log()
+            return False
+        if self.init_segment:
+            await self._write_file(self.init_segment)
+        log.info(f"開始即時封裝至：{self.output_path}")
+        return True
+
+    def has(self, num: int) -> bool:
+        return num in self._expected
+
+    def expect(self, num: int) -> None:
+        """依下載順序登記碎片，必須在任何await之前呼叫以維持順序"""
+        if num in self._expected:
+            return
+        self._expected.add(num)
+        self._waiting.add(num)
+        self._order.append(num)
+
+    async def complete(self, num: int, path: str | None) -> None:
+        """碎片下載結束，path為None表示失敗，該碎片會被略過"""
+        if num not in self._waiting:
+            # 未登記或已被略過的碎片
+            return
+        self._ready[num] = path
+        await self._flush()
+
+    async def _flush(self, final: bool = False) -> None:
+        async with self._write_lock:
+            while self._order:
+                num = self._order[0]
+                if num in self._ready:
+                    path = self._ready.pop(num)
+                elif final or len(self._ready) > self.reorder_limit:
+                    log.warning(f"{'下載已結束' if final else '重排緩衝區已滿'}，略過尚未完成的碎片：{num}")
+                    path = None
+                else:
+                    break
+                self._order.popleft()
+                self._waiting.discard(num)
+                if path is None:
+                    self.dropped += 1
+                    continue
+                await self._write_file(path)
+
+    async def _write_file(self, path: str) -> None:
+        if self.process is None or self.process.stdin is None or self.process.stdin.is_closing():
+            # ffmpeg已停止接收，此碎片不會出現在輸出中
+            self.dropped += 1
+            return
+        try:
+            with open(path, 'rb') as f:
+                while chunk := f.read(self.chunk_size):
+                    self.process.stdin.write(chunk)
+                    await self.process.stdin.drain()
+            self.written += 1
+        except FileNotFoundError:
+            log.warning(f"即時封裝找不到碎片：{path}")
+            self.dropped += 1
+        except (BrokenPipeError, ConnectionResetError) as e:
+            log.error(f"ffmpeg已停止接收資料：{e}")
+            self.process.stdin.close()
+
+    async def close(self) -> bool:
+        """寫入剩餘碎片並等待ffmpeg結束，回傳是否成功輸出"""
+        if self.process is None:
+            return False
+        await self._flush(final=True)
+        if self.process.stdin is not None and not self.process.stdin.is_closing():
+            self.process.stdin.close()
+            try:
+                await self.process.stdin.wait_closed()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+        return_code = await self.process.wait()
+        self._close_log()
+        log.info(f"即時封裝結束，寫入{self.written}個碎片，略過{self.dropped}個碎片，ffmpeg結束碼：{return_code}")
+        if self.dropped:
+            log.warning(f"即時封裝略過了{self.dropped}個碎片，輸出不完整")
+            return False
+        return return_code == 0 and self.written > 0 and os.path.exists(self.output_path)
+
+    def _close_log(self):
+        if self._log_file:
+            self._log_file.close()
+            self._log_file = None
@@ -1,20 +1,50 @@
 import re
 import os
 import sys
+import json
+import bisect
+import shutil
+import time
 import aiohttp
 import asyncio
 import logging
 import threading
 import subprocess
+import hashlib
+import contextlib
+from collections import Counter
+from typing import Callable
 from selenium import webdriver
 
-from src.app_types import common
-from src.services import share, decrypt, downloader, m3u8_graber
+from src.app_types import common, m3u8
+from src.services import share, decrypt, downloader, m3u8_graber, scheduler, journal, merger, live_remux
+from src.services import merge_queue as merge_queue_module
+from src.services import transport as transport_module
+from src.services import metrics, profiler, numbering
+from src.services.key_cache import key_cache
+from src.services.probe_cache import ProbeCache
 from src.config import logger
-from src.utils import set_cookies, default_info, guess
+from src.core.poll_scheduler import PollScheduler
+from src.utils import set_cookies, default_info, guess, path
 
 log = logging.getLogger(name=__name__)
 
+SNAPSHOT_PREFIX = 'playlist_snapshot'  # 多行程下載時各行程保存的播放清單與碎片狀態
+
+
+def snapshot_paths(backup_folder: str) -> list[str]:
+    if not os.path.isdir(backup_folder):
+        return []
+    return [
+        os.path.join(backup_folder, name) for name in sorted(os.listdir(backup_folder))
+        if name.startswith(SNAPSHOT_PREFIX) and name.endswith('.json')
+    ]
+
+def remove_snapshots(backup_folder: str) -> None:
+    '''移除先前執行留下的播放清單快照，由協調器在啟動工作行程前呼叫'''
+    for snapshot_file in snapshot_paths(backup_folder):
+        os.remove(snapshot_file)
+
 def set_logger(new_log):
     current_module = sys.modules[__name__]  # 取得 `c` 模組的引用
     setattr(current_module, "log", new_log)
@@ -57,7 +87,7 @@ def get_fileinfo(filepath: str, replacement: str) -> common.FileInfo|None:
 
 ################################################################
 class FindStartFile:
-    def __init__(self, format_url:str, fill:int, session: aiohttp.ClientSession, split_times:int=10, space:int=10000):
+    def __init__(self, format_url:str, fill:int, session: transport_module.Transport, split_times:int=10, space:int=10000):
         self.format_url = format_url
         self.fill = fill
         self.session = session
@@ -78,9 +108,6 @@ class FindStartFile:
                     return True
                 log.debug(f"檢查網址無效：{url} - {response.status}")
                 return False
-        except aiohttp.ClientError as e:
-            log.warning(f"檢查網址無效：{url} - {str(e)}")
-            return False
         except Exception as e:
             log.warning(f"檢查網址無效：{url} - {str(e)}")
             return False
@@ -177,6 +204,23 @@ def convert_m3u8_to_media(m3u8_url, output_path, tool):
         log.info(f"重新封裝MPEG-TS至MP4容器：{output_path}")
         output_path = os.path.splitext(output_path)[0] + '.mp4'
     command = f'\"{tool}\" -hwaccel auto -analyzeduration 100M -probesize 50M -i \"{m3u8_url}\" -c copy \"{output_path}\"'
+    run_ffmpeg(command)
+
+def mux_m3u8_to_media(m3u8_urls: list[str], media_types: list[str], output_path, tool):
+    '''
+    將影像播放清單與獨立的音訊、字幕播放清單封裝為單一MP4
+    m3u8_urls第一個為影像串流，其餘依序對應media_types(AUDIO/SUBTITLES)
+    '''
+    output_path = os.path.splitext(output_path)[0] + '.mp4'
+    inputs = ''.join(f' -i \"{url}\"' for url in m3u8_urls)
+    maps = ' -map 0:v? -map 0:a?'
+    for i, media_type in enumerate(media_types, start=1):
+        maps += f' -map {i}:s' if media_type == 'SUBTITLES' else f' -map {i}:a'
+    subtitle = ' -c:s mov_text' if 'SUBTITLES' in media_types else ''
+    command = f'\"{tool}\" -hwaccel auto -analyzeduration 100M -probesize 50M{inputs}{maps} -c copy{subtitle} \"{output_path}\"'
+    run_ffmpeg(command)
+
+def run_ffmpeg(command: str):
     log.debug(command)
     with subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True, shell=True) as process:
         if process.stdout is not None:
@@ -191,33 +235,63 @@ def convert_m3u8_to_media(m3u8_url, output_path, tool):
 ################################################################
 # 下載區塊
 class m3u8_downloader:
-    def __init__(self, stop_flag: threading.Event, m3u8_info: common.M3U8Info, merge_lock: threading.Lock, convert_tool="ffmpeg.exe", output_path="output", decrypt=False, full_download: bool= False, merge: bool = True):
+    def __init__(self, stop_flag: threading.Event, m3u8_info: common.M3U8Info, merge_queue: merge_queue_module.MergeQueue | None = None, connection_scheduler: scheduler.ConnectionScheduler | None = None, convert_tool="ffmpeg.exe", output_path="output", decrypt=False, full_download: bool= False, merge: bool = True, verify: str = 'record', keep_encrypted: bool = True, decrypt_pool: decrypt.DecryptPool | None = None, merge_method: str = 'ffmpeg', live_remux: bool = False, renditions: bool = True, profile: bool = False, profile_lag: float = 0.1, shard: tuple[int, int] | None = None, transport: str = 'aiohttp'):
         self.m3u8_info = m3u8_info
-        self.merge_lock = merge_lock
+        self.merge_queue = merge_queue or merge_queue_module.MergeQueue()
         self.convert_tool = convert_tool
         self.output_path = output_path
         self.decrypt = decrypt
+        self.keep_encrypted = keep_encrypted
+        self.decrypt_pool = decrypt_pool
         self.full_download = full_download
         self.merge = merge
+        self.merge_method = merge_method
+        self.live_remux = live_remux
+        self.remuxer: live_remux.LiveRemuxer | None = None
+        self.download_renditions = renditions
+        self.renditions: list[m3u8_downloader] = []  # 同時下載的獨立音訊與字幕
+        self.rendition_type = ''
+        self.profile = profile
+        self.profile_lag = profile_lag
         self.stop_flag = stop_flag
+        self.verify = verify
+        self.shard = shard  # 多行程下載時負責的碎片(編號, 總數)，依媒體序號分配
+        self.run_id = ''  # 多行程下載的執行編號，合併時只讀取同一次執行保存的快照
+        self.progress: Callable[[int, str, int], None] | None = None  # 碎片完成時回報(序號, 狀態, 大小)
+        self.transport = transport
         
         self.key = None
+        self.key_files: dict[str, str] = {}  # 金鑰網址 -> 儲存的金鑰檔名
+        self.playlist_segments: dict[int, m3u8.MediaFile] = {}  # 檔名序號 -> 播放清單中的碎片資訊
         self.tasks: set[asyncio.Task] = set()
-        self.semaphore = asyncio.Semaphore(10)
+        self.scheduler = connection_scheduler or scheduler.ConnectionScheduler()
         self.files_status = {}
+        self.journal_records: dict[int, dict] = {}
+        self.stats = common.DownloadStats()
+        self.poll_scheduler = PollScheduler()
+        self.segment_seen: dict[int, float] = {}  # 檔名序號 -> 首次出現在播放清單的時間
+        self.delta_histogram: Counter[int] = Counter()  # 碎片序號差值 -> 出現次數，含同主機過去的紀錄
+        self.new_deltas: Counter[int] = Counter()  # 本次任務新學到、尚未寫入紀錄的差值
+        self.delta_host: str | None = None
+        self.counted_number: int | None = None  # 已計入差值分布的最大序號
+        self.metrics = metrics.registry.register(self.m3u8_info.filename, self.stats, lambda: len(self.tasks))
 
-        self._original_loop = asyncio.get_event_loop()
-        self.loop: asyncio.AbstractEventLoop = asyncio.new_event_loop()
+        # 事件迴圈於main建立，或由協調器(run)使用共用的事件迴圈與連線池
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.connector: aiohttp.BaseConnector | None = None
 
     def prepare(self):
-        asyncio.set_event_loop(self.loop)
+        self.initialize()
+        self.create_renditions()
+
+    def initialize(self):
         self.headers = {
             'User-Agent': (self.m3u8_info.user_agent or default_info.DEFAULT_USER_AGENT),
             'Referer': (self.m3u8_info.referer or '')
         }
         self.update_cookies()
 
-        self.m3u8_graber = m3u8_graber.get_media_m3u8(
+        self.m3u8_graber = m3u8_graber.async_get_media_m3u8(
             self.m3u8_info.url,
             self.m3u8_info.order,
             self.m3u8_info.cookies,
@@ -227,6 +301,36 @@ class m3u8_downloader:
         if not self.m3u8_graber.update_media_playlist():
             raise Exception("初始化失敗，無法更新媒體播放清單")
         self.create_folder()
+        self.load_journal()
+
+    def create_renditions(self):
+        '''建立所選影像串流關聯的音訊與字幕下載，與影像共用事件迴圈、連線與排程器'''
+        if not self.download_renditions:
+            return
+        for info, url in self.m3u8_graber.get_rendition_urls():
+            media_type = info.media_type.lower()
+            m3u8_info = m3u8.M3U8Info(
+                url=url,
+                filename=path.sanitize_windows_path(f"{self.m3u8_info.filename}.{media_type}_{info.name or info.quality}"),
+                folder=self.m3u8_info.folder,
+                referer=self.m3u8_info.referer,
+                user_agent=self.m3u8_info.user_agent,
+                cookies=self.m3u8_info.cookies,
+            )
+            rendition = m3u8_downloader(
+                self.stop_flag, m3u8_info, self.merge_queue, self.scheduler, self.convert_tool, self.output_path,
+                decrypt=self.decrypt, full_download=self.full_download, merge=False, verify=self.verify,
+                keep_encrypted=self.keep_encrypted, decrypt_pool=self.decrypt_pool, renditions=False, transport=self.transport,
+            )
+            rendition.rendition_type = info.media_type
+            rendition.loop = self.loop
+            try:
+                rendition.initialize()
+            except Exception as e:
+                log.error(f"無法取得{media_type}播放清單，略過：{url}\n{e}")
+                continue
+            self.renditions.append(rendition)
+            log.info(f"同時下載{media_type}：{info.name or info.quality}，網址：{url}")
 
     def create_folder(self):
         '''初始化資料夾 含碎片與碎片解析'''
@@ -243,19 +347,79 @@ class m3u8_downloader:
         self.fragment_folder = os.path.join(self.backup_folder, 'fragments')
         log.info(f'碎片檔、KEY、完整M3U8將儲存於：\"{self.fragment_folder}\"')
         os.makedirs(self.fragment_folder, exist_ok=True)
+        self.delta_store = numbering.DeltaStore(os.path.join(self.output_path, 'backup'))
+        # 合併時使用的碎片資料夾，不保留密文時改用解密資料夾
+        self.media_folder = self.fragment_folder
+        self.decrypted_folder = os.path.join(self.backup_folder, 'decrypt')
         if self.decrypt and self.m3u8_graber.media_playlist_info.key_url:
-            self.decrypted_folder = os.path.join(self.backup_folder, 'decrypt')
             os.makedirs(self.decrypted_folder, exist_ok=True)
+            if not self.keep_encrypted:
+                self.media_folder = self.decrypted_folder
+
+    def load_journal(self):
+        '''讀取碎片紀錄，已完成且檔案大小相符的碎片直接視為下載成功'''
+        self.journal = journal.FragmentJournal(self.backup_folder, self.shard[0] if self.shard else None)
+        self.journal_records = self.journal.load()
+        restored = 0
+        for num, record in self.journal_records.items():
+            if record.get("status") != "Successful":
+                continue
+            filepath = os.path.join(self.media_folder, record["filename"])
+            if os.path.exists(filepath) and os.path.getsize(filepath) == record.get("size"):
+                self.files_status[num] = {"filename": record["filename"], "url": record["url"], "status": "Successful"}
+                if "key" in record:
+                    self.files_status[num]["key"] = record["key"]
+                    self.files_status[num]["iv"] = record.get("iv", "")
+                restored += 1
+        if restored:
+            log.info(f"從碎片紀錄恢復{restored}個已完成的檔案：{self.journal.folder}")
+
+    def record_status(self, num: int, dl_info: dict, filepath: str, first_seen: float | None = None):
+        '''將碎片的最終狀態寫入紀錄與指標'''
+        if self.media_folder != self.fragment_folder:
+            filepath = os.path.join(self.media_folder, dl_info["filename"])
+        size = os.path.getsize(filepath) if dl_info["status"] == "Successful" and os.path.exists(filepath) else 0
+        extra = {"key": dl_info["key"], "iv": dl_info.get("iv", "")} if "key" in dl_info else {}
+        self.journal.record(num, dl_info["filename"], dl_info["url"], size, dl_info["status"], **extra)
+        self.metrics.segment_finished(dl_info["status"], size, first_seen)
+        if self.progress is not None:
+            self.progress(num, dl_info["status"], size)
+
+    async def reload_media_playlist(self) -> bool:
+        '''更新媒體播放清單並記錄讀取延遲'''
+        start = time.perf_counter()
+        status = await self.m3u8_graber.async_update_media_playlist()
+        self.metrics.observe_reload(time.perf_counter() - start, status and self.m3u8_graber.last_reload_ok)
+        return status
+
+    def decrypt_kwargs(self, filename: str, key: bytes | None, iv: bytes | None) -> dict:
+        '''邊下載邊解密所需的參數，未啟用解密或碎片未加密時回傳空字典'''
+        if not (key and self.decrypt):
+            return {}
+        return {
+            "decrypt_key": key,
+            "decrypt_iv": iv,
+            "decrypt_path": os.path.join(self.decrypted_folder, filename),
+            "keep_encrypted": self.keep_encrypted,
+            "decrypt_pool": self.decrypt_pool,
+        }
+
+    def get_known_size(self, num: int) -> int | None:
+        '''取得碎片紀錄中已完成檔案的大小'''
+        record = self.journal_records.get(num)
+        if record and record.get("status") == "Successful" and record.get("size"):
+            return record["size"]
+        return None
 
     def update_cookies(self):
         '''更新 cookies'''
         log.info(f"更新Cookies")
         self.cookies = set_cookies.load_cookies_to_dict(self.m3u8_info.cookies)
 
-    def write_source_m3u8(self):
+    async def write_source_m3u8(self):
         try:
             if self.m3u8_graber.master_playlist_url:
-                master_playlist_content = self.m3u8_graber.get_master_playlist()
+                master_playlist_content = await self.m3u8_graber.async_get_master_playlist()
                 if master_playlist_content:
                     filepath = os.path.join(self.backup_folder, self.m3u8_graber.master_playlist_url.split('?')[0].split('/')[-1])
                     with open(filepath, 'w', encoding='utf-8') as f:
@@ -273,105 +437,291 @@ class m3u8_downloader:
         else:
             url = self.m3u8_graber.media_patch_url + self.m3u8_graber.media_playlist_info.map_url
         filepath = os.path.join(self.fragment_folder, os.path.basename(url.split('?')[0]))
-        await downloader.async_download(url, filepath, self.session, size_check=False)
+        await downloader.async_download(url, filepath, self.session, size_check=False, verify=self.verify, stats=self.stats)
+        if self.media_folder != self.fragment_folder and os.path.exists(filepath):
+            shutil.copy(filepath, self.media_folder)
+
+    def resolve_url(self, path: str) -> str:
+        return path if 'http' in path else self.m3u8_graber.media_patch_url + path
+
+    def save_key(self, url: str, key: bytes) -> str:
+        '''儲存金鑰檔案，第一把金鑰為server.key，輪替後的金鑰依序編號'''
+        if url in self.key_files:
+            return self.key_files[url]
+        if self.shard is not None:
+            # 各行程取得金鑰的順序不同，以網址決定檔名使碎片紀錄一致
+            filename = f'server_{hashlib.md5(url.encode()).hexdigest()[:8]}.key'
+        else:
+            filename = 'server.key' if not self.key_files else f'server_{len(self.key_files)}.key'
+        filepath = os.path.join(self.fragment_folder, filename)
+        with open(filepath, 'wb') as key_file:
+            key_file.write(key)
+        self.key_files[url] = filename
+        if self.decrypt:
+            # 播放清單中途才開始加密時，解密資料夾可能尚未建立
+            os.makedirs(self.decrypted_folder, exist_ok=True)
+        if self.key is None:
+            self.key = key
+        log.info(f"AES128解密HEX：\"{key.hex()}\"，儲存於：{filepath}")
+        return filename
 
     async def download_key(self):
         '''下載金鑰'''
-        if 'http' in self.m3u8_graber.media_playlist_info.key_url:
-            url = self.m3u8_graber.media_playlist_info.key_url
-        else:
-            url = self.m3u8_graber.media_patch_url + self.m3u8_graber.media_playlist_info.key_url
-        filepath = os.path.join(self.fragment_folder, 'server.key')
-        await downloader.async_download(url, filepath, self.session, size_check=False)
-        with open(filepath, 'rb') as key_file:
-            self.key = key_file.read()
-            log.info(f"AES128解密HEX：\"{self.key.hex()}\"，儲存於：{filepath}")
+        url = self.resolve_url(self.m3u8_graber.media_playlist_info.key_url)
+        key = await key_cache.get(url, self.session)
+        if key is None:
+            log.error(f"金鑰下載失敗：{url}")
+            return
+        self.save_key(url, key)
         if self.m3u8_graber.media_playlist_info.iv:
             log.info(f"IV解密HEX：\"{self.m3u8_graber.media_playlist_info.iv}\"")
 
+    def update_playlist_segments(self):
+        '''記錄播放清單中碎片的序號與金鑰，並預先下載即將使用的金鑰'''
+        new_files = self.m3u8_graber.media_playlist_info.new_files
+        numbers = numbering.extract_numbers([file.path for file in new_files])
+        for file, number in zip(new_files, numbers):
+            if number is not None:
+                self.playlist_segments[number] = file
+                self.segment_seen.setdefault(number, time.time())
+        if new_files:
+            self.learn_deltas(numbers, self.resolve_url(new_files[0].path))
+        key_cache.prefetch({self.resolve_url(file.key_url) for file in new_files if file.key_url}, self.session)
+
+    def learn_deltas(self, numbers: list[int | None], url: str):
+        '''將新碎片的序號差值計入差值分布，任務結束時由save_deltas寫入同一輸出資料夾共用的主機紀錄'''
+        if self.delta_host is None:
+            self.delta_host = scheduler.get_host(url)
+            self.delta_histogram = self.delta_store.load(self.delta_host)
+        numbers = [number for number in numbers if number is not None]
+        if self.counted_number is not None:
+            # 重新讀取播放清單時只計入新的碎片，並與上次最後的碎片相連
+            numbers = [self.counted_number] + [number for number in numbers if number > self.counted_number]
+        if not numbers:
+            return
+        self.counted_number = max(numbers)
+        histogram = numbering.delta_histogram(numbers)
+        if histogram:
+            self.delta_histogram.update(histogram)
+            self.new_deltas.update(histogram)
+
+    def save_deltas(self):
+        '''將本次任務(含音訊與字幕)學到的差值寫入主機紀錄，檔案I/O於執行緒中呼叫'''
+        for mission in (self, *self.renditions):
+            if mission.delta_host is not None and mission.new_deltas:
+                mission.delta_store.update(mission.delta_host, mission.new_deltas)
+                mission.new_deltas = Counter()
+
+    def ranked_deltas(self) -> list[int]:
+        '''依出現次數排序的可能序號差值'''
+        return numbering.rank_deltas(self.delta_histogram)
+
+    def find_playlist_segment(self, num: int) -> tuple[m3u8.MediaFile | None, int | None]:
+        '''取得序號對應的碎片資訊與媒體序號，不在播放清單中時以最接近的較早碎片推算'''
+        if num in self.playlist_segments:
+            file = self.playlist_segments[num]
+            return file, file.sequence
+        if not self.playlist_segments:
+            return None, None
+        numbers = sorted(self.playlist_segments.keys())
+        index = bisect.bisect_left(numbers, num)
+        nearest = numbers[index - 1] if index > 0 else numbers[0]
+        file = self.playlist_segments[nearest]
+        space = self.format_info.space if self.format_info and self.format_info.space > 0 else 1
+        return file, file.sequence + round((num - nearest) / space)
+
+    async def get_segment_key(self, dl_info: dict, key_url: str, iv: str, sequence: int | None) -> tuple[bytes | None, bytes | None]:
+        '''取得碎片的金鑰與IV，並記錄於dl_info供建立m3u8使用'''
+        if not key_url:
+            if self.key_files:
+                dl_info["key"] = ""
+            return None, None
+        url = self.resolve_url(key_url)
+        key = await key_cache.get(url, self.session)
+        if key is None:
+            log.error(f"金鑰下載失敗：{url}")
+            return None, None
+        iv_bytes = decrypt.process_iv(iv, sequence)
+        dl_info["key"] = self.save_key(url, key)
+        dl_info["iv"] = iv_bytes.hex()
+        return key, iv_bytes
+
 #######################################################################
-    async def add_normal_download(self, url:str):
+    async def add_normal_download(self, url:str, media_file: m3u8.MediaFile | None = None):
+        first_seen = time.time()  # 碎片在播放清單更新後立即加入下載
         dl_info = {"filename": os.path.basename(url.split('?')[0]), "url": url, "status": "Downloading"}
-        last_number = get_last_number(dl_info["filename"][:dl_info["filename"].rfind('.')])
-        if last_number is None:
-            raise ValueError(f"無法從檔名中獲取序號：{dl_info['filename']}")
-        num = int(last_number)
+        if media_file is not None and media_file.byterange_length:
+            # 同一個檔案的多個區段，以媒體序號區分碎片檔名
+            stem, ext = os.path.splitext(dl_info["filename"])
+            dl_info["filename"] = f"{stem}_{media_file.sequence}{ext}"
+            num = media_file.sequence
+        else:
+            last_number = get_last_number(dl_info["filename"][:dl_info["filename"].rfind('.')])
+            if last_number is None:
+                raise ValueError(f"無法從檔名中獲取序號：{dl_info['filename']}")
+            num = int(last_number)
         if num in self.files_status.keys():
+            await self.remux_restored(num)
             return False
+        if self.remuxer is not None:
+            self.remuxer.expect(num)
         filepath = os.path.join(self.fragment_folder, dl_info["filename"])
         self.files_status[num] = dl_info
-        async with self.semaphore:
+        if media_file is not None:
+            key, iv = await self.get_segment_key(dl_info, media_file.key_url, media_file.iv, media_file.sequence)
+        else:
+            key, iv = None, None
+        if not key and self.media_folder != self.fragment_folder:
+            # 未加密的碎片直接存放於合併用的資料夾
+            filepath = os.path.join(self.media_folder, dl_info["filename"])
+        if media_file is not None and media_file.byterange_length:
+            # 分段請求各自向排程器取得連線名額
             for retries_time in range(3):
-                status = await downloader.async_download(url, filepath, self.session, retry_times=3,size_check=True)
+                status = await downloader.async_download_range(url, filepath, self.session, media_file.byterange_offset, media_file.byterange_length, self.scheduler)
                 if status:
                     break
                 else:
+                    self.metrics.add_retry()
                     await self.refresh_download_info()
+        else:
+            async with self.scheduler.slot(url):
+                for retries_time in range(3):
+                    status = await downloader.async_download(url, filepath, self.session, retry_times=3,size_check=True, verify=self.verify, known_size=self.get_known_size(num), stats=self.stats, connection_scheduler=self.scheduler, **self.decrypt_kwargs(dl_info["filename"], key, iv))
+                    if status:
+                        break
+                    else:
+                        self.metrics.add_retry()
+                        await self.refresh_download_info()
         if status:
             dl_info["status"] = "Successful"
-            if self.key and self.decrypt:
+            if key and self.decrypt and media_file is not None and media_file.byterange_length:
+                # 分段下載無法串流解密，交由解密工作池解密完整區段
                 decrypt_filepath = os.path.join(self.decrypted_folder, dl_info["filename"])
-                decrypt.ts_with_key_file(filepath, decrypt_filepath, self.key, self.m3u8_graber.media_playlist_info.iv)
+                if self.decrypt_pool:
+                    await self.decrypt_pool.run(decrypt.ts_with_key_file, filepath, decrypt_filepath, key, iv)
+                else:
+                    await asyncio.to_thread(decrypt.ts_with_key_file, filepath, decrypt_filepath, key, iv)
         else:
             log.critical(f"序號：{num},下載錯誤：{url}")
             dl_info["status"] = "Failed"
+        self.record_status(num, dl_info, filepath, first_seen)
+        if self.remuxer is not None:
+            await self.remuxer.complete(num, self.get_merge_path(dl_info) if status else None)
+
+    async def start_live_remux(self):
+        '''啟動即時封裝，加密碎片需搭配解密才能寫入ffmpeg'''
+        if not self.live_remux:
+            return
+        if self.renditions:
+            log.warning("存在獨立的音訊或字幕，無法即時封裝，下載完成後再合併")
+            return
+        if self.key_files and not self.decrypt:
+            log.warning("碎片已加密且未啟用解密，無法即時封裝，下載完成後再合併")
+            return
+        final_file = os.path.join(self.output_path, f'{self.m3u8_info.filename}.mp4')
+        if os.path.exists(final_file):
+            log.info("最終檔案已存在，不進行即時封裝。")
+            return
+        init_segment = None
+        if self.m3u8_graber.media_playlist_info.map_url:
+            init_segment = os.path.join(self.fragment_folder, os.path.basename(self.m3u8_graber.media_playlist_info.map_url.split('?')[0]))
+        remuxer = live_remux.LiveRemuxer(self.convert_tool, final_file, os.path.join(self.backup_folder, 'remux.log'), init_segment)
+        if await remuxer.start():
+            self.remuxer = remuxer
+
+    async def remux_restored(self, num: int):
+        '''從碎片紀錄恢復的檔案不需下載，直接依序寫入即時封裝'''
+        info = self.files_status[num]
+        if self.remuxer is None or self.remuxer.has(num) or info["status"] != "Successful":
+            return
+        self.remuxer.expect(num)
+        await self.remuxer.complete(num, self.get_merge_path(info))
+
+    async def finish_live_remux(self) -> bool:
+        '''結束即時封裝，失敗時移除不完整的輸出，改由合併流程產生'''
+        if self.remuxer is None:
+            return False
+        success = await self.remuxer.close()
+        if not success:
+            log.warning("即時封裝失敗，下載完成後改用合併方式輸出")
+            if os.path.exists(self.remuxer.output_path):
+                os.remove(self.remuxer.output_path)
+        self.remuxer = None
+        return success
+
+    def in_shard(self, file: m3u8.MediaFile) -> bool:
+        '''多行程下載時只下載媒體序號分配給此行程的碎片'''
+        return self.shard is None or file.sequence % self.shard[1] == self.shard[0]
 
     async def normal_downloader(self):
         '''監控m3u8檔案更新直到直播間關閉或是下載完成'''
-        retries, faided_times = 0, 0
+        await self.start_live_remux()
+        stopping, faided_times = False, 0
         m3u8_status = True
-        while retries < 10 or self.tasks:
-            if self.stop_flag.is_set() and retries < 10:
-                log.warning(f"收到停止訊號，等待當前下載任務完成。")
-                retries = 10
-            elif not self.stop_flag.is_set():
-                m3u8_status = self.m3u8_graber.update_media_playlist()
+        while not (stopping or self.poll_scheduler.finished()) or self.tasks:
+            if self.stop_flag.is_set():
+                if not stopping:
+                    log.warning(f"收到停止訊號，等待當前下載任務完成。")
+                    stopping = True
+            elif not self.poll_scheduler.finished():
+                self.poll_scheduler.start_reload()
+                m3u8_status = await self.reload_media_playlist()
                 if not self.key and not self.m3u8_graber.media_playlist_info.map_url:
-                    self.m3u8_graber.update_master_playlist()
-                end_number = self.get_last_file_number()
-                if end_number not in self.files_status.keys():
-                    for file in self.m3u8_graber.media_playlist_info.files:
-                        task = self.loop.create_task(self.add_normal_download(self.m3u8_graber.media_patch_url + file.path))
+                    await self.m3u8_graber.async_update_master_playlist()
+                self.update_playlist_segments()
+                new_files = self.m3u8_graber.media_playlist_info.new_files
+                if new_files:
+                    for file in new_files:
+                        if not self.in_shard(file):
+                            continue
+                        task = self.loop.create_task(self.add_normal_download(self.m3u8_graber.media_patch_url + file.path, file))
                         self.tasks.add(task)
                         task.add_done_callback(lambda t: self.tasks.discard(t))
-                    retries, faided_times = 0, 0
+                    faided_times = 0
+                    self.update_poll_scheduler(True)
                 else:
-                    retries += 1
                     log.info(f"未監控到新的檔案")
+                    self.update_poll_scheduler(False)
                 if not m3u8_status:
                     faided_times += 1
                     if faided_times > 10:
                         log.critical(f"直播間已關閉，停止所有下載任務。")
                         await self.stop_all_tasks()
                         break
-            await asyncio.sleep(3)
+            await asyncio.sleep(self.poll_wait(stopping))
 #########################
     async def add_format_download(self, num:int):
         if num in self.files_status.keys():
             return False
         dl_info = {"filename": "", "url": "", "status": "Downloading"}
         self.files_status[num] = dl_info
-        async with self.semaphore:
+        assert self.format_info is not None, "格式化網址無法使用，請檢查網路連線、Cookies、Referer、User-Agent。"
+        media_file, sequence = self.find_playlist_segment(num)
+        if media_file is not None:
+            key, iv = await self.get_segment_key(dl_info, media_file.key_url, media_file.iv if num in self.playlist_segments else '', sequence)
+        else:
+            key, iv = await self.get_segment_key(dl_info, self.m3u8_graber.media_playlist_info.key_url, self.m3u8_graber.media_playlist_info.iv, None)
+        async with self.scheduler.slot(self.format_info.url):
             for retries_time in range(3):
                 assert self.format_info is not None, "格式化網址無法使用，請檢查網路連線、Cookies、Referer、User-Agent。"
                 url:str = self.format_info.url.format(num=str(num).zfill(self.format_info.fill))
                 dl_info["url"] = url
                 if not dl_info["filename"]:
                     dl_info["filename"] = os.path.basename(url.split('?')[0])
-                    filepath = os.path.join(self.fragment_folder, dl_info["filename"])
-                status = await downloader.async_download(url, filepath, self.session, retry_times=5, size_check=True)
+                    filepath = os.path.join(self.fragment_folder if key else self.media_folder, dl_info["filename"])
+                status = await downloader.async_download(url, filepath, self.session, retry_times=5, size_check=True, verify=self.verify, known_size=self.get_known_size(num), stats=self.stats, connection_scheduler=self.scheduler, **self.decrypt_kwargs(dl_info["filename"], key, iv))
                 if status:
                     break
                 else:
+                    self.metrics.add_retry()
                     await self.refresh_download_info()
         if status:
             dl_info["status"] = "Successful"
-            if self.key and self.decrypt:
-                decrypt_filepath = os.path.join(self.decrypted_folder, dl_info["filename"])
-                decrypt.ts_with_key_file(filepath, decrypt_filepath, self.key, self.m3u8_graber.media_playlist_info.iv)
         else:
             log.critical(f"序號：{num},下載錯誤：{url}")
             dl_info["status"] = "Failed"
+        # 回推的碎片不曾出現在播放清單中，不計入出現至寫入的時間
+        self.record_status(num, dl_info, filepath, self.segment_seen.get(num))
 
     #async def format_downloader(self):
     #    """可用格式化下載方式下載"""
@@ -412,38 +762,65 @@ class m3u8_downloader:
 
     async def format_downloader(self):
         """可用格式化下載方式下載"""
-        finder = guess.Finder(self.format_info, session=self.session)
-        retries, faided_times = 0, 0
+        # 探測結果儲存於碎片資料夾旁，重新啟動時沿用
+        probe_cache = ProbeCache(self.backup_folder)
+        probe_cache.load()
+        finder = guess.Finder(self.format_info, session=self.session, cache=probe_cache, deltas=self.ranked_deltas(), connection_scheduler=self.scheduler)
+        stopping, faided_times = False, 0
         m3u8_status = True
-        while retries < 10 or self.tasks:
+        while not (stopping or self.poll_scheduler.finished()) or self.tasks:
             #if not self.key:
             #    self.m3u8_graber.update_master_playlist()
-            if self.stop_flag.is_set() and retries < 10:
-                log.warning(f"收到停止訊號，等待當前下載任務完成。")
-                retries = 10
-            elif not self.stop_flag.is_set():
-                m3u8_status = self.m3u8_graber.update_media_playlist()
+            if self.stop_flag.is_set():
+                if not stopping:
+                    log.warning(f"收到停止訊號，等待當前下載任務完成。")
+                    stopping = True
+            elif not self.poll_scheduler.finished():
+                self.poll_scheduler.start_reload()
+                m3u8_status = await self.reload_media_playlist()
+                self.update_playlist_segments()
+                finder.update_deltas(self.ranked_deltas())
+                probe_count = finder.probe_count
                 valid_segments = await finder.main(self.get_last_file_number())
+                self.stats.probe_requests += finder.probe_count - probe_count
+                probe_cache.save()
                 if valid_segments:
                     for num in valid_segments:
                         task = self.loop.create_task(self.add_format_download(num))
                         self.tasks.add(task)
                         task.add_done_callback(lambda t: self.tasks.discard(t))
                     log.info(f"添加下載範圍，序號：{valid_segments[0]} - {valid_segments[-1]}，共 {len(valid_segments)}個檔案")
-                    retries, faided_times = 0, 0
+                    faided_times = 0
+                    self.update_poll_scheduler(True)
                 else:
-                    retries += 1
                     log.info(f"未監控到新的檔案")
+                    self.update_poll_scheduler(False)
                 if not m3u8_status:
                     faided_times += 1
                     if faided_times > 10:
                         log.critical(f"直播間已關閉，停止所有下載任務。")
                         await self.stop_all_tasks()
                         break
-            await asyncio.sleep(3)
-        log.info(f"已結束的碎片下載完成")
+            await asyncio.sleep(self.poll_wait(stopping))
+        probe_cache.save()
+        log.info(f"已結束的碎片下載完成，探測快取命中{probe_cache.hits}次")
 #######################################################################
 
+    def update_poll_scheduler(self, changed: bool):
+        """以最新的媒體播放清單資訊更新輪詢間隔"""
+        media_playlist_info = self.m3u8_graber.media_playlist_info
+        last_extinf = media_playlist_info.files[-1].extinf if media_playlist_info.files else 0
+        ended = media_playlist_info.endlist or media_playlist_info.play_type == 'VOD'
+        if ended and not self.poll_scheduler.ended:
+            log.info("播放清單已結束(EXT-X-ENDLIST或VOD)，停止輪詢")
+        self.poll_scheduler.update(media_playlist_info.target_duration, changed, last_extinf, ended)
+
+    def poll_wait(self, stopping: bool) -> float:
+        """停止或播放清單結束後只等待下載中的任務，不需依輪詢間隔等待"""
+        if stopping or self.poll_scheduler.finished():
+            return 0.5
+        return self.poll_scheduler.next_delay()
+
     def get_last_file_number(self) -> int:
         """獲取最後一個檔案的序號"""
         last_file: str = self.m3u8_graber.media_playlist_info.files[-1].path.split('?')[0]
@@ -459,7 +836,7 @@ class m3u8_downloader:
         if isinstance(self.m3u8_info.cookies, webdriver.Chrome):
             self.update_cookies()
             if isinstance(self.cookies, dict):
-                self.session.cookie_jar.update_cookies(self.cookies)
+                self.session.update_cookies(self.cookies)
             else:
                 log.warning("Cookies已失效")
         #更新格式化網址
@@ -488,28 +865,92 @@ class m3u8_downloader:
                 break
             elif "#EXT-X-MAP:" in line:
                 header_text += line.replace(self.m3u8_graber.media_playlist_info.map_url, os.path.basename(self.m3u8_graber.media_playlist_info.map_url)) + '\n'
-            elif "#EXT-X-KEY:" in line and not without_key:
-                header_text += line.replace(self.m3u8_graber.media_playlist_info.key_url, "server.key") + '\n'
+            elif "#EXT-X-KEY:" in line:
+                # 金鑰改為依碎片逐一寫入
+                continue
             else:
                 header_text += line + '\n'
         with open(filepath, 'w', encoding='utf-8') as f:
             f.write(header_text)
+            current_key = None
             for num in sorted(self.files_status.keys()):
+                info = self.files_status[num]
+                if not without_key and "key" in info:
+                    key_line = f'#EXT-X-KEY:METHOD=AES-128,URI="{info["key"]}",IV=0x{info["iv"]}' if info["key"] else "#EXT-X-KEY:METHOD=NONE"
+                    if key_line != current_key:
+                        f.write(key_line + "\n")
+                        current_key = key_line
                 f.write(f"#EXTINF:{self.m3u8_graber.media_playlist_info.target_duration},\n")
-                f.write(self.files_status[num]["filename"] + "\n")
+                f.write(info["filename"] + "\n")
             f.write("#EXT-X-ENDLIST")
     
+    def get_merge_path(self, info: dict) -> str | None:
+        '''取得合併用的碎片路徑，加密碎片需使用解密後的檔案，無法取得時回傳None'''
+        encrypted = info["key"] if "key" in info else bool(self.key_files)
+        if not encrypted:
+            return os.path.join(self.media_folder, info["filename"])
+        if not self.decrypt:
+            return None
+        return os.path.join(self.decrypted_folder, info["filename"])
+
+    def concat_media(self) -> bool:
+        '''以位元組串接碎片，不經過檔案伺服器與ffmpeg，加密碎片未解密時回傳False'''
+        paths = []
+        if self.m3u8_graber.media_playlist_info.map_url:
+            paths.append(os.path.join(self.fragment_folder, os.path.basename(self.m3u8_graber.media_playlist_info.map_url.split('?')[0])))
+        for num in sorted(self.files_status.keys()):
+            path = self.get_merge_path(self.files_status[num])
+            if path is None:
+                log.warning("碎片已加密且未解密，無法直接串接，改用ffmpeg合併")
+                return False
+            paths.append(path)
+        # fMP4(具初始化片段)串接後為MP4，MPEG-TS串接後仍為TS
+        ext = 'mp4' if self.m3u8_graber.media_playlist_info.map_url else self.m3u8_graber.media_playlist_info.media_ext
+        final_file = os.path.join(self.output_path, f'{self.m3u8_info.filename}.{ext}')
+        if os.path.exists(final_file):
+            log.info("最終檔案已存在，不進行合併。")
+            return True
+        start = time.perf_counter()
+        total = merger.concat_files(paths, final_file)
+        elapsed = time.perf_counter() - start
+        log.info(f"串接{len(paths)}個檔案完成，{total / 1024 / 1024:.2f} MB，耗時{elapsed:.2f}秒：{final_file}")
+        return True
+
+    def mux_renditions(self):
+        '''以ffmpeg將影像與獨立的音訊、字幕封裝為單一MP4'''
+        final_file = os.path.join(self.output_path, f'{self.m3u8_info.filename}.mp4')
+        if os.path.exists(final_file):
+            log.info("最終檔案已存在，不進行合併。")
+            return
+        with contextlib.ExitStack() as stack:
+            servers = [stack.enter_context(share.FileServer(directory=mission.media_folder)) for mission in [self, *self.renditions]]
+            mux_m3u8_to_media(
+                [os.path.join(server.url, 'media.m3u8') for server in servers],
+                [rendition.rendition_type for rendition in self.renditions],
+                final_file,
+                self.convert_tool,
+            )
+        log.info("合併媒體檔案完成。")
+
     def merge_media(self):
         '''合併碎片檔案至MP4'''
-        log.info(f"開始合併媒體檔案")
-        share_url = share.main(set_port=8000, directory=self.fragment_folder) 
+        log.info("開始合併媒體檔案")
+        if self.renditions:
+            if self.merge_method == 'concat':
+                log.info("存在獨立的音訊或字幕，改用ffmpeg封裝")
+            self.mux_renditions()
+            return
+        if self.merge_method == 'concat' and self.concat_media():
+            return
         final_file = os.path.join(self.output_path, f'{self.m3u8_info.filename}.{self.m3u8_graber.media_playlist_info.media_ext}')
         if os.path.exists(final_file):
             log.info(f"最終檔案已存在，不進行合併。")
             return
-        convert_m3u8_to_media(os.path.join(share_url, 'media.m3u8'), final_file, self.convert_tool)
+        # 每次合併使用獨立的本機檔案伺服器與系統分配的埠號
+        with share.FileServer(directory=self.media_folder) as server:
+            log.debug(f"檔案伺服器：{server.url}")
+            convert_m3u8_to_media(os.path.join(server.url, 'media.m3u8'), final_file, self.convert_tool)
         log.info(f"合併媒體檔案完成。")
-        share.stop()
 
     def log_status(self):
         error = 0
@@ -520,6 +961,8 @@ class m3u8_downloader:
             else:
                 success += 1
         log.info(f"成功下載{success}個檔案，失敗{error}個檔案")
+        if self.stats.requests_saved:
+            log.info(f"已存在檔案免重新請求{self.stats.requests_saved}次，節省{self.stats.bytes_saved / 1024 / 1024:.2f} MB，探測請求{self.stats.probe_requests}次")
         return True if not error else False
 
     def log_thread_info(self):
@@ -527,13 +970,10 @@ class m3u8_downloader:
         log.debug(f"Loop ID：{threading.get_ident()}")
         log.debug(f"Session ID：{id(self.session)}")
 
-    async def mission(self):
-        log.info(f"開始下載m3u8內容，網址：{self.m3u8_graber.media_playlist_url}")
-        self.session = aiohttp.ClientSession(headers=self.headers, cookies=self.cookies)
-        self.log_thread_info()
-        self.write_source_m3u8()
+    async def download_media(self):
+        await self.write_source_m3u8()
 
-        if self.m3u8_graber.media_playlist_info.map_url:
+        if self.m3u8_graber.media_playlist_info.map_url and (self.shard is None or self.shard[0] == 0):
             await self.download_map()
 
         # 如果有解密金鑰，則下載
@@ -542,13 +982,21 @@ class m3u8_downloader:
 
         # 監控m3u8檔案更新直到直播間關閉或是下載完成
         log.info(f"開始下載媒體檔案")
-        if self.full_download:
+        if self.m3u8_graber.media_playlist_info.byterange:
+            log.info("播放清單使用EXT-X-BYTERANGE，使用分段下載方式下載")
+            await self.normal_downloader()
+        elif self.full_download:
             format_info = get_formatinfo(
                 self.m3u8_graber.media_patch_url,
                 self.m3u8_graber.media_playlist_info.files[0].path,
                 self.m3u8_graber.media_playlist_info.files[1].path
                 )
             if format_info:
+                # 以整份播放清單最常見的序號差值取代前兩個碎片的差值
+                histogram = numbering.delta_histogram(numbering.extract_numbers([file.path for file in self.m3u8_graber.media_playlist_info.files]))
+                if histogram:
+                    format_info.space = histogram.most_common(1)[0][0]
+                    log.info(f"碎片序號差值分布：{dict(histogram.most_common(5))}，間距：{format_info.space}")
                 log.info(f"存在關聯性檔案連結，使用格式化下載方式下載")
                 self.format_info = format_info
                 await self.format_downloader()
@@ -559,13 +1007,56 @@ class m3u8_downloader:
             log.info(f"使用串流下載方式下載")
             await self.normal_downloader()
 
+    async def download_rendition(self, session: transport_module.Transport):
+        '''於主任務的事件迴圈中下載音訊或字幕，共用主任務的連線'''
+        self.session = session
+        self.m3u8_graber.bind_session(session)
+        log.info(f"開始下載{self.rendition_type.lower()}：{self.m3u8_graber.media_playlist_url}")
+        await self.download_media()
+        self.create_m3u8_file(os.path.join(self.media_folder, "media.m3u8"), without_key=self.media_folder != self.fragment_folder)
+
+    def create_session(self) -> transport_module.Transport:
+        '''
+        建立任務的傳輸層，提供共用連線池時與其他任務共用連線保持、DNS快取與TLS工作階段
+        HTTP/2傳輸自行於每個主機的連線上多工，不使用共用連線池
+        '''
+        return transport_module.create_transport(self.transport, self.headers, self.cookies, self.connector, self.scheduler.max_connections)
+
+    def merge_in_slot(self):
+        '''取得合併佇列的名額後合併，於執行緒中呼叫避免阻塞事件迴圈'''
+        with self.merge_queue.slot():
+            self.merge_media()
+
+    async def mission(self):
+        log.info(f"開始下載m3u8內容，網址：{self.m3u8_graber.media_playlist_url}")
+        self.session = self.create_session()
+        self.m3u8_graber.bind_session(self.session)
+        self.log_thread_info()
+        # 下載期間合併佇列會限制其他任務的同時合併數
+        self.merge_queue.download_started()
+        try:
+            # 影像與音訊、字幕同時下載，總時間約等於最長的一軌
+            await asyncio.gather(self.download_media(), *(rendition.download_rendition(self.session) for rendition in self.renditions))
+        finally:
+            self.merge_queue.download_finished()
+            await asyncio.to_thread(self.save_deltas)
+
+        await self.complete()
+        await self.session.close()
+        return True
+
+    async def complete(self):
+        '''下載結束後建立m3u8並合併'''
+        remuxed = await self.finish_live_remux()
         log.info(f"所有媒體檔案下載完成，開始合併媒體檔案")
         # 創建m3u8文件
-        self.create_m3u8_file(os.path.join(self.fragment_folder, "media.m3u8"))
-        if self.log_status():
-            if self.merge:
-                with self.merge_lock:
-                    self.merge_media()
+        self.create_m3u8_file(os.path.join(self.media_folder, "media.m3u8"), without_key=self.media_folder != self.fragment_folder)
+        renditions_status = [rendition.log_status() for rendition in self.renditions]
+        if self.log_status() and all(renditions_status):
+            if remuxed:
+                log.info(f"已於下載期間完成即時封裝，儲存於：{self.output_path}")
+            elif self.merge:
+                await asyncio.to_thread(self.merge_in_slot)
                 log.info(f"媒體檔案合併完成，儲存於：{self.output_path}")
             else:
                 log.info(f"未啟用媒體檔案合併，儲存於：{self.output_path}")
@@ -574,29 +1065,196 @@ class m3u8_downloader:
             for name, info in self.files_status.items():
                 if info["status"] != 'Successful':
                     log.error(f"序號：{name},下載錯誤：{info['url']}")
-        await self.session.close()
-        return True
+
+    def snapshot_path(self) -> str:
+        suffix = f'_{self.shard[0]}' if self.shard else ''
+        return os.path.join(self.backup_folder, f'{SNAPSHOT_PREFIX}{suffix}.json')
+
+    def save_snapshot(self):
+        '''
+        保存下載時使用的播放清單與嘗試過的碎片狀態(含音訊與字幕)，
+        多行程下載結束後由協調器以finalize讀取，不需重新請求可能已失效的播放清單
+        '''
+        for mission in (self, *self.renditions):
+            data = {
+                "run_id": self.run_id,
+                "shard": list(mission.shard) if mission.shard else None,
+                "playlist": mission.m3u8_graber.snapshot(),
+                "key_files": mission.key_files,
+                "renditions": [{"filename": rendition.m3u8_info.filename, "media_type": rendition.rendition_type} for rendition in mission.renditions],
+                "segments": {str(num): info for num, info in mission.files_status.items()},
+            }
+            snapshot_file = mission.snapshot_path()
+            with open(snapshot_file + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(snapshot_file + '.tmp', snapshot_file)
+
+    def load_snapshots(self) -> list[dict]:
+        '''讀取backup資料夾中同一次執行(run_id)各行程保存的快照，其他執行留下的快照不使用'''
+        snapshots = []
+        stale = 0
+        for snapshot_file in snapshot_paths(self.backup_folder):
+            try:
+                with open(snapshot_file, 'r', encoding='utf-8') as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError) as e:
+                log.error(f"播放清單快照讀取失敗：{os.path.basename(snapshot_file)} - {e}")
+                continue
+            if snapshot.get("run_id") != self.run_id:
+                stale += 1
+                continue
+            snapshots.append(snapshot)
+        if stale:
+            log.warning(f"略過{stale}個其他執行留下的播放清單快照：{self.backup_folder}")
+        return snapshots
+
+    def restore(self) -> bool:
+        '''
+        以快照與完整的碎片紀錄還原任務狀態，不連線：
+        紀錄中的碎片以最後一筆為準(成功且檔案大小相符才視為成功，其餘為失敗)，
+        快照中嘗試過但沒有紀錄的碎片視為失敗；缺少任一行程的快照時回傳False
+        '''
+        self.backup_folder = os.path.join(self.output_path, 'backup', self.m3u8_info.filename)
+        snapshots = self.load_snapshots()
+        if not snapshots:
+            log.critical(f"找不到播放清單快照，無法合併：{self.backup_folder}")
+            return False
+        counts = {snapshot["shard"][1] if snapshot.get("shard") else 1 for snapshot in snapshots}
+        if len(counts) > 1:
+            log.critical(f"播放清單快照的行程數不一致：{sorted(counts)}，無法合併")
+            return False
+        # 以第一個行程(或未切分的任務)的播放清單為準
+        snapshots.sort(key=lambda snapshot: snapshot["shard"][0] if snapshot.get("shard") else 0)
+        self.m3u8_graber = m3u8_graber.async_get_media_m3u8.from_snapshot(snapshots[0]["playlist"])
+        self.create_folder()
+        for snapshot in snapshots:
+            self.key_files.update(snapshot.get("key_files", {}))
+        complete = True
+        missing = sorted(set(range(counts.pop())) - {snapshot["shard"][0] if snapshot.get("shard") else 0 for snapshot in snapshots})
+        if missing:
+            log.critical(f"缺少第{missing}個行程的播放清單快照，該行程可能異常終止")
+            complete = False
+
+        self.journal = journal.FragmentJournal(self.backup_folder)
+        self.journal_records = self.journal.load()
+        for num, record in self.journal_records.items():
+            filepath = os.path.join(self.media_folder, record["filename"])
+            ok = record.get("status") == "Successful" and os.path.exists(filepath) and os.path.getsize(filepath) == record.get("size")
+            self.files_status[num] = {"filename": record["filename"], "url": record["url"], "status": "Successful" if ok else "Failed"}
+            if "key" in record:
+                self.files_status[num]["key"] = record["key"]
+                self.files_status[num]["iv"] = record.get("iv", "")
+        attempted = {}
+        for snapshot in snapshots:
+            for num, info in snapshot.get("segments", {}).items():
+                attempted[int(num)] = info
+        unrecorded = [num for num in attempted if num not in self.files_status]
+        for num in unrecorded:
+            self.files_status[num] = {**attempted[num], "status": "Failed"}
+        if unrecorded:
+            log.critical(f"{self.rendition_type or '影像'}有{len(unrecorded)}個碎片未完成：{sorted(unrecorded)[:10]}")
+
+        for info in snapshots[0].get("renditions", []):
+            m3u8_info = m3u8.M3U8Info(url='', filename=info["filename"], folder=self.m3u8_info.folder)
+            rendition = m3u8_downloader(
+                self.stop_flag, m3u8_info, self.merge_queue, self.scheduler, self.convert_tool, self.output_path,
+                decrypt=self.decrypt, merge=False, verify=self.verify, keep_encrypted=self.keep_encrypted,
+                decrypt_pool=self.decrypt_pool, renditions=False,
+            )
+            rendition.rendition_type = info["media_type"]
+            rendition.run_id = self.run_id
+            if not rendition.restore():
+                complete = False
+            self.renditions.append(rendition)
+        return complete
+
+    async def finalize_mission(self):
+        for rendition in self.renditions:
+            rendition.create_m3u8_file(os.path.join(rendition.media_folder, "media.m3u8"), without_key=rendition.media_folder != rendition.fragment_folder)
+        await self.complete()
 
     def set_model_logger(self, log: logging.Logger):
         """設定模組日誌"""
         set_logger(log)
         downloader.set_logger(log)
         decrypt.set_logger(log)
+        merger.set_logger(log)
+        live_remux.set_logger(log)
+        profiler.set_logger(log)
         m3u8_graber.set_logger(log)
         log.info(f"模組日誌已設定為：{log.name}")
 
+    def mission_name(self, name_length: int = 0) -> str:
+        return self.m3u8_info.filename if name_length == 0 else self.m3u8_info.filename.ljust(name_length)
+
+    def start_logging(self, name: str) -> logging.Handler:
+        log_path = os.path.join(self.backup_folder, self.m3u8_info.filename+'.log')
+        return logger.start_thread_logging(log_path, name)
+
     def main(self, name_length: int = 0):
-        threading.current_thread().name = self.m3u8_info.filename if name_length == 0 else self.m3u8_info.filename.ljust(name_length)
+        name = self.mission_name(name_length)
+        threading.current_thread().name = name
+        # 合併等交由執行緒池的步驟沿用任務名稱記錄日誌
+        logger.mission_name.set(name)
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
         self.prepare()
-        log_path = os.path.join(self.backup_folder, self.m3u8_info.filename+'.log')
-        log_handler = logger.start_thread_logging(log_path)
+        log_handler = self.start_logging(name)
         log = logging.getLogger(self.m3u8_info.filename)
         self.set_model_logger(log)
-        self.loop.run_until_complete(self.mission())
-        self.loop.close()
-        asyncio.set_event_loop(self._original_loop)
-        logging.getLogger().removeHandler(log_handler)
-        log_handler.close()
+        mission_profiler = profiler.MissionProfiler(self.profile_lag) if self.profile else None
+        try:
+            if mission_profiler:
+                # 事件迴圈開始執行前才啟動，迴圈延遲不包含準備階段的同步請求
+                mission_profiler.start(self.loop)
+            self.loop.run_until_complete(self.mission())
+        finally:
+            if mission_profiler:
+                mission_profiler.stop(os.path.join(self.backup_folder, 'profile'))
+            self.loop.close()
+            asyncio.set_event_loop(None)
+            logger.stop_thread_logging(log_handler)
+
+    def finalize(self, name_length: int = 0):
+        '''
+        合併多行程下載的結果：讀取各行程保存的播放清單快照與完整的碎片紀錄，不發送任何請求，
+        建立m3u8後依設定合併；有未完成的碎片或缺少行程的快照時不合併
+        '''
+        name = self.mission_name(name_length)
+        threading.current_thread().name = name
+        logger.mission_name.set(name)
+        self.backup_folder = os.path.join(self.output_path, 'backup', self.m3u8_info.filename)
+        os.makedirs(self.backup_folder, exist_ok=True)
+        log_handler = self.start_logging(name)
+        try:
+            if not self.restore():
+                log.critical(f'多行程下載的結果不完整，不進行合併：{self.m3u8_info.filename}')
+                return
+            self.loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self.loop)
+            try:
+                self.loop.run_until_complete(self.finalize_mission())
+            finally:
+                self.loop.close()
+                asyncio.set_event_loop(None)
+        finally:
+            logger.stop_thread_logging(log_handler)
+
+    async def run(self, connector: aiohttp.BaseConnector, name_length: int = 0):
+        '''
+        於協調器的共用事件迴圈中執行任務，與其他任務共用連線池
+        準備階段的同步請求於執行緒中進行；日誌以任務名稱(logger.mission_name)區分
+        '''
+        name = self.mission_name(name_length)
+        logger.mission_name.set(name)
+        self.loop = asyncio.get_running_loop()
+        self.connector = connector
+        await asyncio.to_thread(self.prepare)
+        log_handler = self.start_logging(name)
+        try:
+            await self.mission()
+        finally:
+            logger.stop_thread_logging(log_handler)
 
 
 ################################################################
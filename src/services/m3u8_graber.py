@@ -1,5 +1,6 @@
 import re
 import sys
+import asyncio
 import logging
 import requests
 from selenium import webdriver
@@ -7,6 +8,7 @@ from collections import OrderedDict
 
 from src.app_types import m3u8
 from src.utils import set_cookies
+from src.services import transport
 
 log = logging.getLogger(__name__)
 
@@ -50,6 +52,21 @@ def check_url_status(url, headers, session = requests.Session()) -> bool:
         return False
     
 # 解析區塊
+def parse_byterange(line: str, default_offset: int) -> tuple[int, int]:
+    '''解析#EXT-X-BYTERANGE:<length>[@<offset>]，回傳(length, offset)，未指定offset時接續同一檔案的上一個區段'''
+    value = line.split(':', 1)[1].strip()
+    if '@' in value:
+        length, offset = value.split('@', 1)
+        return int(length), int(offset)
+    return int(value), default_offset
+
+ATTRIBUTE_PATTERN = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+
+def parse_attributes(line: str) -> dict[str, str]:
+    '''解析標籤的屬性列表，引號內的逗號不會被拆開'''
+    value = line.split(':', 1)[1] if ':' in line else line
+    return {key: value.strip('"') for key, value in ATTRIBUTE_PATTERN.findall(value)}
+
 # 將主播放列表解析為字典
 def process_master_playlist(url: str, content: str) -> m3u8.MasterPlaylistInfo:
     master_playlist_info = m3u8.MasterPlaylistInfo(
@@ -69,17 +86,21 @@ def process_master_playlist(url: str, content: str) -> m3u8.MasterPlaylistInfo:
         )
         if '#' in lines[n]:
             if 'EXT-X-MEDIA' in lines[n]:
-                info = lines[n].replace('#EXT-X-MEDIA:', '').split(',')
-                info = {i.split('=')[0]: i.split('=')[1].strip('"') for i in info}
+                info = parse_attributes(lines[n])
                 m3u8_info.quality = info.get('GROUP-ID', '')
                 m3u8_info.media_type = info.get('TYPE', '')
                 m3u8_info.filepath = info.get('URI', '')
+                m3u8_info.name = info.get('NAME', '')
+                m3u8_info.default = info.get('DEFAULT', '') == 'YES'
                 master_playlist_info.m3u8s[index] = m3u8_info
                 index += 1
             elif 'EXT-X-STREAM-INF' in lines[n]:
                 match = re.search(r'BANDWIDTH=(\d+)', lines[n])
                 m3u8_info.quality = match.group(1) if match else '0'
                 m3u8_info.media_type = 'STREAM'
+                info = parse_attributes(lines[n])
+                m3u8_info.audio_group = info.get('AUDIO', '')
+                m3u8_info.subtitle_group = info.get('SUBTITLES', '')
                 if n + 1 < len(lines):
                     m3u8_info.filepath = lines[n + 1]
                 master_playlist_info.m3u8s[index] = m3u8_info
@@ -109,16 +130,36 @@ def process_master_playlist(url: str, content: str) -> m3u8.MasterPlaylistInfo:
 
     return master_playlist_info
 
-# 將媒體播放列表解析為字典
-def process_media_playlist(url: str, content: str):
-    media_playlist_info = m3u8.MediaPlaylistInfo(
-        name=url.split('?')[0].split('/')[-1],
-        url=url,
-        play_type='STREAM',
-    )
-    order_counter = 0
-    lines = content.splitlines()
-    
+def get_renditions(master_playlist_info: m3u8.MasterPlaylistInfo, order: int) -> list[m3u8.MediaPlaylistFileInfo]:
+    '''
+    取得所選影像串流關聯的獨立音訊與字幕(EXT-X-MEDIA)，每個群組選擇DEFAULT=YES的項目，沒有時選第一個
+    未提供URI的項目已包含於影像串流中，不需另外下載
+    '''
+    if order not in master_playlist_info.m3u8s:
+        return []
+    stream = master_playlist_info.m3u8s[order]
+    if stream.media_type != 'STREAM':
+        return []
+    renditions = []
+    for media_type, group in (('AUDIO', stream.audio_group), ('SUBTITLES', stream.subtitle_group)):
+        if not group:
+            continue
+        candidates = [
+            info for info in master_playlist_info.m3u8s.values()
+            if info.media_type == media_type and info.quality == group and info.filepath
+        ]
+        if candidates:
+            renditions.append(next((info for info in candidates if info.default), candidates[0]))
+    return renditions
+
+MEDIA_SEQUENCE_PATTERN = re.compile(r'#EXT-X-MEDIA-SEQUENCE:\s*(\d+)')
+
+def parse_media_lines(media_playlist_info: m3u8.MediaPlaylistInfo, lines: list[str], last_sequence: int = -1) -> None:
+    '''解析媒體播放清單各行並寫入media_playlist_info，碎片接續在media_playlist_info.files之後'''
+    order_counter = len(media_playlist_info.files)
+    byterange_end: dict[str, int] = {}  # 各檔案上一個區段的結束位置
+    current_key_url, current_iv = '', ''  # 套用於後續碎片的金鑰與IV
+
     for n in range(len(lines)):
         line = lines[n]
         if '#' in line:
@@ -127,14 +168,31 @@ def process_media_playlist(url: str, content: str):
                     duration = float(line.split(':')[1].split(',')[0])
                 except (IndexError, ValueError):
                     duration = 0.0
+                sequence = media_playlist_info.media_sequence + order_counter
                 order_counter += 1
+                # EXTINF與檔案路徑之間可能夾有EXT-X-BYTERANGE等標籤
+                path_index = n + 1
+                byterange_line = ''
+                while path_index < len(lines) and lines[path_index].startswith('#'):
+                    if 'EXT-X-BYTERANGE' in lines[path_index]:
+                        byterange_line = lines[path_index]
+                    path_index += 1
                 file = m3u8.MediaFile(
                     order=order_counter,
+                    sequence=sequence,
                     extinf=duration,
-                    path=lines[n+1] if n+1 < len(lines) else '',
+                    path=lines[path_index] if path_index < len(lines) else '',
                     time=lines[n-1].replace('#EXT-X-PROGRAM-DATE-TIME:', '') if 'EXT-X-PROGRAM-DATE-TIME' in lines[n-1] else '',
+                    key_url=current_key_url,
+                    iv=current_iv,
                 )
+                if byterange_line:
+                    file.byterange_length, file.byterange_offset = parse_byterange(byterange_line, byterange_end.get(file.path, 0))
+                    byterange_end[file.path] = file.byterange_offset + file.byterange_length
+                    media_playlist_info.byterange = True
                 media_playlist_info.files.append(file)
+                if sequence > last_sequence:
+                    media_playlist_info.new_files.append(file)
             
             elif 'EXT-X-TARGETDURATION' in line:
                 media_playlist_info.target_duration = int(line.split(':')[1])
@@ -143,16 +201,68 @@ def process_media_playlist(url: str, content: str):
             elif 'EXT-X-MEDIA-SEQUENCE' in line:
                 media_playlist_info.media_sequence = int(line.split(':')[1])
             elif 'EXT-X-PLAYLIST-TYPE' in line:
-                media_playlist_info.play_type = 'VOD'
+                # VOD不再變更；EVENT只會在尾端新增碎片，仍需輪詢
+                media_playlist_info.play_type = line.split(':')[1].strip().upper()
+            elif 'EXT-X-ENDLIST' in line:
+                media_playlist_info.endlist = True
             elif 'EXT-X-KEY' in line:
+                current_key_url, current_iv = '', ''
+                if 'METHOD=NONE' in line:
+                    continue
                 if 'URI="' in line:
-                    media_playlist_info.key_url = line.split('URI="')[1].split('"')[0]
-                if 'IV=0x' in line:
-                    iv_split = line.split('IV=0x')
+                    current_key_url = line.split('URI="')[1].split('"')[0]
+                    media_playlist_info.key_url = current_key_url
+                if 'IV=0x' in line or 'IV=0X' in line:
+                    iv_split = re.split(r'IV=0[xX]', line)
                     if len(iv_split) > 1:
-                        media_playlist_info.iv = iv_split[1].split(',')[0]
+                        current_iv = iv_split[1].split(',')[0].strip()
+                        media_playlist_info.iv = current_iv
             elif 'EXT-X-MAP' in line:
                 media_playlist_info.map_url = line.split('URI="')[1].split('"')[0]
+
+def split_media_playlist(content: str, last_sequence: int, previous: m3u8.MediaPlaylistInfo) -> tuple[str, str, int] | None:
+    '''
+    以EXT-X-MEDIA-SEQUENCE找出序號為last_sequence的碎片在內容中的位置，回傳(已解析部分, 未解析部分, previous.files中仍在視窗內的起點)
+    序號與上一次解析結果對不上(序號重置、伺服器未維護序號)或使用EXT-X-BYTERANGE時回傳None，改為完整解析
+    '''
+    if last_sequence < 0 or not previous.files or previous.files[-1].sequence != last_sequence or '#EXT-X-BYTERANGE' in content:
+        return None
+    match = MEDIA_SEQUENCE_PATTERN.search(content)
+    media_sequence = int(match.group(1)) if match else 0
+    first = media_sequence - previous.files[0].sequence
+    if first < 0:
+        return None
+    text = content if content.endswith('\n') else content + '\n'
+    position = text.rfind('\n' + previous.files[-1].path + '\n')
+    if position < 0 or text.count('#EXTINF', 0, position) != last_sequence - media_sequence + 1:
+        return None
+    return text[:position + 1], text[position + 1:], first
+
+# 將媒體播放列表解析為字典
+def process_media_playlist(url: str, content: str, last_sequence: int = -1, previous: m3u8.MediaPlaylistInfo | None = None):
+    '''
+    last_sequence: 上一次已輸出的最大媒體序號，序號(EXT-X-MEDIA-SEQUENCE + 索引)大於此值的碎片才會放入new_files
+    previous: 同一播放清單上一次的解析結果，提供時只解析last_sequence之後的內容，之前的碎片沿用previous.files(order維持首次解析時的值)
+    '''
+    media_playlist_info = m3u8.MediaPlaylistInfo(
+        name=url.split('?')[0].split('/')[-1],
+        url=url,
+        play_type='STREAM',
+    )
+    split = split_media_playlist(content, last_sequence, previous) if previous is not None else None
+    if split is None:
+        parse_media_lines(media_playlist_info, content.splitlines(), last_sequence)
+    else:
+        parsed, rest, first = split
+        media_playlist_info.key_url, media_playlist_info.iv, media_playlist_info.map_url = previous.key_url, previous.iv, previous.map_url
+        media_playlist_info.files = previous.files[first:]
+        # 已解析部分只需要標頭與最後生效的金鑰、初始化區段，未解析部分以上一個碎片的路徑行開頭
+        lines = parsed[:parsed.find('#EXTINF')].splitlines()
+        for tag in ('#EXT-X-KEY', '#EXT-X-MAP'):
+            tag_start = parsed.rfind(tag)
+            if tag_start >= 0:
+                lines.append(parsed[tag_start:parsed.find('\n', tag_start)])
+        parse_media_lines(media_playlist_info, lines + rest.splitlines(), last_sequence)
     media_playlist_info.media_ext = media_playlist_info.files[-1].path.split('?')[0].split('.')[-1]
     return media_playlist_info
 
@@ -202,18 +312,22 @@ class get_media_m3u8:
             self.print_check = True
 
 
+    def parse_master_playlist(self) -> None:
+        '''解析已取得的Master Playlist內容，依self.m3u8_order組合Media Playlist網址'''
+        self.master_playlist_info = process_master_playlist(self.master_playlist_url, self.master_playlist_content)
+        if self.m3u8_order >= len(self.master_playlist_info.m3u8s) or self.m3u8_order < 0:
+            self.m3u8_order = -1
+        media_m3u8_file_url = self.master_playlist_info.m3u8s[self.m3u8_order].filepath
+        if not self.master_patch_url:
+            patch = get_patch_url(self.master_playlist_url, media_m3u8_file_url)
+            self.master_patch_url = patch.base
+        self.media_playlist_url = self.master_patch_url + media_m3u8_file_url
+
     def get_master_playlist(self) -> str:
         '''取得並回傳Master Playlist內容，過程中解析Master Playlist內容並取得Media Playlist網址'''
         try:
             self.master_playlist_content = self.session.get(self.master_playlist_url, headers=self.headers).text
-            self.master_playlist_info = process_master_playlist(self.master_playlist_url, self.master_playlist_content)
-            if self.m3u8_order >= len(self.master_playlist_info.m3u8s) or self.m3u8_order < 0:
-                self.m3u8_order = -1
-            media_m3u8_file_url = self.master_playlist_info.m3u8s[self.m3u8_order].filepath
-            if not self.master_patch_url:
-                patch = get_patch_url(self.master_playlist_url, media_m3u8_file_url)
-                self.master_patch_url = patch.base
-            self.media_playlist_url = self.master_patch_url + media_m3u8_file_url
+            self.parse_master_playlist()
             return self.master_playlist_content
         except:
             self.media_playlist_url = ''
@@ -243,23 +357,45 @@ class get_media_m3u8:
 
     def get_media_patch_url(self, media_playlist_info: m3u8.MediaPlaylistInfo) -> str | None:
         '''對Master Playlist與Media Playlist的網址進行拆解測試，從中取得可以與檔案組合成正確網址的Patch網址'''
+        patches = self.media_patch_candidates(media_playlist_info)
+        for patch in patches:
+            if check_url_status(patch.file, headers=self.headers, session = self.session):
+                self.media_patch_url = patch.base
+                return patch.base
+        self.log_patch_failure(patches[-1])
+        return None
+
+    def media_patch_candidates(self, media_playlist_info: m3u8.MediaPlaylistInfo) -> list:
+        '''依序列出可能的Patch網址：先以Media Playlist網址拆解，再以Master Playlist網址拆解'''
         file_url = media_playlist_info.files[0].path
-        patch = get_patch_url(self.media_playlist_url, file_url)
-        if not check_url_status(patch.file, headers=self.headers, session = self.session):
-            if self.master_playlist_url:
-                patch = get_patch_url(self.master_playlist_url, file_url)
-                if not check_url_status(patch.file, headers=self.headers, session = self.session):
-                    log.error(f"媒體播放清單網址與主播放清單網址皆無法用於檔案網址，請檢查網路連線、Cookies、Referer、User-Agent。")
-                    log.error(f"主播放清單基底網址：{patch.base}")
-                    log.error(f"檔案網址：{patch.file}")
-                    return None
-            else:
-                log.error(f"媒體播放清單網址無法用於檔案網址，並且缺失主播放清單網址。")
-                log.error(f"媒體播放清單基底網址：{patch.base}")
-                log.error(f"檔案網址：{patch.file}")
-                return None
-        self.media_patch_url = patch.base
-        return patch.base
+        patches = [get_patch_url(self.media_playlist_url, file_url)]
+        if self.master_playlist_url:
+            patches.append(get_patch_url(self.master_playlist_url, file_url))
+        return patches
+
+    def log_patch_failure(self, patch) -> None:
+        if self.master_playlist_url:
+            log.error("媒體播放清單網址與主播放清單網址皆無法用於檔案網址，請檢查網路連線、Cookies、Referer、User-Agent。")
+            log.error(f"主播放清單基底網址：{patch.base}")
+        else:
+            log.error("媒體播放清單網址無法用於檔案網址，並且缺失主播放清單網址。")
+            log.error(f"媒體播放清單基底網址：{patch.base}")
+        log.error(f"檔案網址：{patch.file}")
+
+    def log_media_playlist_url_change(self) -> None:
+        if self.old_media_playlist_url != self.media_playlist_url:
+            self.old_media_playlist_url = self.media_playlist_url
+            log.info(f"媒體播放清單網址更新為：{self.media_playlist_url}")
+
+    def get_rendition_urls(self) -> list[tuple[m3u8.MediaPlaylistFileInfo, str]]:
+        '''取得所選影像串流關聯的音訊與字幕播放清單網址'''
+        if not self.master_playlist_url:
+            return []
+        results = []
+        for info in get_renditions(self.master_playlist_info, self.m3u8_order):
+            url = info.filepath if info.filepath.startswith('http') else get_patch_url(self.master_playlist_url, info.filepath).file
+            results.append((info, url))
+        return results
 
     def update_master_playlist(self) -> None:
         if self.master_playlist_url:
@@ -274,10 +410,178 @@ class get_media_m3u8:
             self.session = set_cookies.update_session(self.cookies, self.session)
             log.info("更新媒體播放清單")
             self.get_media_playlist()
-            if self.old_media_playlist_url != self.media_playlist_url:
-                self.old_media_playlist_url = self.media_playlist_url
-                log.info(f"媒體播放清單網址更新為：{self.media_playlist_url}")
+            self.log_media_playlist_url_change()
+            return True
+        else:
+            log.warning("獲取媒體播放清單失敗")
+            return False
+
+async def async_check_url_status(url, session: transport.Transport) -> bool:
+    # 檢查網址是否有效，只讀取回應標頭，不下載內容
+    try:
+        async with session.get(url) as result:
+            result.release()
+            if result.status == 200:
+                log.debug(f"檢驗網址，檢驗有效：{url}")
+                return True
+            log.debug(f"檢驗網址，檢驗無效：{url} - {result.status}")
+            return False
+    except (transport.TransportError, asyncio.TimeoutError) as e:
+        log.warning(f"檢驗網址，檢驗無效：{url} - {str(e)}")
+        return False
+
+
+class async_get_media_m3u8(get_media_m3u8):
+    '''
+    get_media_m3u8的異步版本，初始化仍使用requests判定播放清單類型，
+    進入事件迴圈後透過bind_session綁定任務的傳輸層(transport.Transport)，
+    之後以async_update_media_playlist更新，播放清單輪詢不會阻塞碎片下載
+    '''
+
+    def __init__(self, url: str, m3u8_order:int = 0, cookies: webdriver.Chrome|dict|str|None = None, headers:dict = {}):
+        super().__init__(url, m3u8_order, cookies, headers)
+        self.async_session: transport.Transport | None = None
+        self.patch_checked_url = ''
+        self.last_sequence = -1
+        self.last_file_path = ''
+        self.last_reload_ok = False
+
+    def bind_session(self, session: transport.Transport) -> None:
+        '''綁定任務共用的傳輸層'''
+        self.async_session = session
+
+    def snapshot(self) -> dict:
+        '''目前使用的播放清單網址與內容，可由from_snapshot還原'''
+        return {
+            "m3u8_order": self.m3u8_order,
+            "master_playlist_url": self.master_playlist_url,
+            "master_playlist_content": self.master_playlist_content,
+            "media_playlist_url": self.media_playlist_url,
+            "media_patch_url": self.media_patch_url,
+            "media_playlist_content": self.media_playlist_content,
+        }
+
+    @classmethod
+    def from_snapshot(cls, snapshot: dict, headers: dict = {}) -> 'async_get_media_m3u8':
+        '''以保存的播放清單內容建立，不發送任何請求，供下載結束後合併使用'''
+        graber = cls.__new__(cls)
+        graber.m3u8_order = snapshot.get("m3u8_order", 0)
+        graber.cookies = None
+        graber.headers = headers
+        graber.print_check = True
+        graber.session = None
+        graber.async_session = None
+        graber.master_playlist_url = snapshot.get("master_playlist_url", '')
+        graber.master_playlist_content = snapshot.get("master_playlist_content", '')
+        graber.master_patch_url = ''
+        graber.master_playlist_info = process_master_playlist(graber.master_playlist_url, graber.master_playlist_content) if graber.master_playlist_content else m3u8.MasterPlaylistInfo()
+        graber.media_playlist_url = graber.old_media_playlist_url = snapshot["media_playlist_url"]
+        graber.media_patch_url = snapshot.get("media_patch_url", '')
+        graber.media_playlist_content = snapshot["media_playlist_content"]
+        graber.media_playlist_info = process_media_playlist(graber.media_playlist_url, graber.media_playlist_content)
+        graber.media_playlist_info.new_files = []
+        graber.patch_checked_url = graber.media_playlist_url
+        graber.last_sequence = graber.media_playlist_info.files[-1].sequence if graber.media_playlist_info.files else -1
+        graber.last_file_path = graber.media_playlist_info.files[-1].path if graber.media_playlist_info.files else ''
+        graber.last_reload_ok = True
+        return graber
+
+    async def fetch_text(self, url: str) -> str:
+        assert self.async_session is not None, "尚未綁定傳輸層"
+        async with self.async_session.get(url, headers=self.headers) as response:
+            if response.status != 200:
+                raise transport.TransportError(f"播放清單狀態碼錯誤：{response.status}，URL: {url}")
+            return await response.text()
+
+    async def async_update_cookies(self) -> None:
+        '''每次重新載入都重新讀取cookies(WebDriver、cookies檔案或dict)，讀取為阻塞操作，移至執行緒中處理'''
+        if self.async_session is None or self.cookies is None:
+            return
+        cookies_dict = await asyncio.to_thread(set_cookies.load_cookies_to_dict, self.cookies)
+        if cookies_dict:
+            self.async_session.update_cookies(cookies_dict)
+
+    async def async_get_master_playlist(self) -> str:
+        '''get_master_playlist的異步版本'''
+        try:
+            self.master_playlist_content = await self.fetch_text(self.master_playlist_url)
+            self.parse_master_playlist()
+            return self.master_playlist_content
+        except Exception:
+            self.media_playlist_url = ''
+            log.warning(f"獲取主播放清單失敗: {self.master_playlist_url}")
+            return ""
+
+    async def async_get_media_playlist(self) -> str:
+        '''get_media_playlist的異步版本，Patch網址只在媒體播放清單網址變更時重新檢驗'''
+        try:
+            content = await self.fetch_text(self.media_playlist_url)
+            self.last_reload_ok = True
+            if content == self.media_playlist_content and self.last_file_path:
+                # 內容未變更，不需重新解析
+                self.media_playlist_info.new_files = []
+                return self.media_playlist_content
+            self.media_playlist_content = content
+            media_playlist_info = self.process_media_playlist_delta(self.media_playlist_content)
+            if not self.media_patch_url or self.patch_checked_url != self.media_playlist_url:
+                if not self.media_patch_url or not await async_check_url_status(self.media_patch_url + media_playlist_info.files[0].path, self.async_session):
+                    await self.async_get_media_patch_url(media_playlist_info)
+                self.patch_checked_url = self.media_playlist_url
+            self.media_playlist_info = media_playlist_info
+            return self.media_playlist_content
+        except Exception:
+            self.last_reload_ok = False
+            self.media_patch_url = ''
+            self.patch_checked_url = ''
+            self.media_playlist_info.new_files = []
+            log.warning(f"MEDIA M3U8 URL: {self.media_playlist_url}")
+            log.warning("獲取媒體播放清單失敗")
+            return ""
+
+    def process_media_playlist_delta(self, content: str) -> m3u8.MediaPlaylistInfo:
+        '''以EXT-X-MEDIA-SEQUENCE解析媒體播放清單，new_files只包含尚未輸出過的碎片'''
+        previous = self.media_playlist_info if self.media_playlist_info.url == self.media_playlist_url else None
+        media_playlist_info = process_media_playlist(self.media_playlist_url, content, self.last_sequence, previous)
+        files = media_playlist_info.files
+        if files and files[-1].sequence < self.last_sequence:
+            # 媒體序號倒退，視為串流重新開始
+            log.warning(f"媒體序號重置：{self.last_sequence} -> {files[-1].sequence}")
+            media_playlist_info.new_files = list(files)
+        elif files and not media_playlist_info.new_files and files[-1].path != self.last_file_path and self.last_file_path:
+            # 序號未遞增但檔案有變化，伺服器未正確維護EXT-X-MEDIA-SEQUENCE，改以檔案路徑比對
+            paths = [file.path for file in files]
+            start = paths.index(self.last_file_path) + 1 if self.last_file_path in paths else 0
+            media_playlist_info.new_files = files[start:]
+        if files:
+            self.last_sequence = files[-1].sequence
+            self.last_file_path = files[-1].path
+        return media_playlist_info
+
+    async def async_get_media_patch_url(self, media_playlist_info: m3u8.MediaPlaylistInfo) -> str | None:
+        '''get_media_patch_url的異步版本'''
+        patches = self.media_patch_candidates(media_playlist_info)
+        for patch in patches:
+            if await async_check_url_status(patch.file, self.async_session):
+                self.media_patch_url = patch.base
+                return patch.base
+        self.log_patch_failure(patches[-1])
+        return None
+
+    async def async_update_master_playlist(self) -> None:
+        if self.master_playlist_url:
+            await self.async_update_cookies()
+            log.info(f"更新主播放清單: {self.master_playlist_url}")
+            await self.async_get_master_playlist()
+
+    async def async_update_media_playlist(self) -> bool:
+        # 更新媒體播放清單，可以透過self.m3u8_order來控制更新媒體播放清單
+        self.print_info()
+        if self.media_playlist_url:
+            await self.async_update_cookies()
+            log.info("更新媒體播放清單")
+            await self.async_get_media_playlist()
+            self.log_media_playlist_url_change()
             return True
         else:
             log.warning("獲取媒體播放清單失敗")
-            return False
\ No newline at end of file
+            return False
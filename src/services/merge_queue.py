@@ -0,0 +1,67 @@
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+log = logging.getLogger(__name__)
+
+
+class MergeQueue:
+    """
+    跨任務共用的合併佇列，依排隊順序(FIFO)限制同時合併的任務數
+    仍有任務在下載時只允許busy_merges個合併同時進行，避免合併搶走下載所需的磁碟頻寬；
+    所有下載結束後放寬為max_merges
+    """
+
+    def __init__(self, max_merges: int = 2, busy_merges: int = 1):
+        self.max_merges = max(1, max_merges)
+        self.busy_merges = max(1, min(busy_merges, self.max_merges))
+        self._condition = threading.Condition()
+        self._running = 0
+        self._downloading = 0
+        self._queue: deque[object] = deque()
+
+    def _limit(self) -> int:
+        return self.busy_merges if self._downloading > 0 else self.max_merges
+
+    def download_started(self) -> None:
+        with self._condition:
+            self._downloading += 1
+
+    def download_finished(self) -> None:
+        with self._condition:
+            self._downloading = max(0, self._downloading - 1)
+            self._condition.notify_all()
+
+    def acquire(self) -> None:
+        ticket = object()
+        with self._condition:
+            self._queue.append(ticket)
+            if self._queue[0] is not ticket or self._running >= self._limit():
+                log.info(f"等待合併，佇列中尚有{len(self._queue) - 1}個任務，合併中{self._running}個")
+            self._condition.wait_for(lambda: self._queue[0] is ticket and self._running < self._limit())
+            self._queue.popleft()
+            self._running += 1
+            # 下一個排隊者可能也能開始
+            self._condition.notify_all()
+
+    def release(self) -> None:
+        with self._condition:
+            self._running -= 1
+            self._condition.notify_all()
+
+    @contextmanager
+    def slot(self):
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def status(self) -> dict:
+        with self._condition:
+            return {
+                "running": self._running,
+                "waiting": len(self._queue),
+                "downloading": self._downloading,
+            }
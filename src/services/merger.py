@@ -0,0 +1,78 @@
+import os
+import sys
+import errno
+import shutil
+import logging
+
+log = logging.getLogger(__name__)
+
+def set_logger(new_log):
+    current_module = sys.modules[__name__]  # 取得 `c` 模組的引用
+    setattr(current_module, "log", new_log)
+
+# 不支援時改用下一種複製方式，避免每個碎片都重新嘗試
+_FALLBACK_ERRNOS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF}
+_copy_file_range_supported = hasattr(os, 'copy_file_range')
+_sendfile_supported = hasattr(os, 'sendfile') and sys.platform.startswith('linux')
+
+def _copy_file_range(src_fd: int, dst_fd: int, size: int) -> int:
+    copied = 0
+    while copied < size:
+        n = os.copy_file_range(src_fd, dst_fd, size - copied)
+        if n == 0:
+            break
+        copied += n
+    return copied
+
+def _sendfile(src_fd: int, dst_fd: int, size: int) -> int:
+    copied = 0
+    while copied < size:
+        n = os.sendfile(dst_fd, src_fd, copied, size - copied)
+        if n == 0:
+            break
+        copied += n
+    return copied
+
+def copy_into(src, dst) -> int:
+    """
+    將src整個檔案接到dst的目前位置，依序嘗試copy_file_range、sendfile，
+    皆不支援時改用一般讀寫；dst必須是無緩衝的檔案物件
+    """
+    global _copy_file_range_supported, _sendfile_supported
+    size = os.fstat(src.fileno()).st_size
+    if _copy_file_range_supported:
+        try:
+            return _copy_file_range(src.fileno(), dst.fileno(), size)
+        except OSError as e:
+            if e.errno not in _FALLBACK_ERRNOS:
+                raise
+            log.debug(f"copy_file_range不可用({e})，改用sendfile")
+            _copy_file_range_supported = False
+    if _sendfile_supported:
+        try:
+            copied = _sendfile(src.fileno(), dst.fileno(), size)
+            # sendfile以offset讀取來源，不會移動dst以外的位置
+            return copied
+        except OSError as e:
+            if e.errno not in _FALLBACK_ERRNOS:
+                raise
+            log.debug(f"sendfile不可用({e})，改用一般讀寫")
+            _sendfile_supported = False
+    src.seek(0)
+    shutil.copyfileobj(src, dst, 1024 * 1024)
+    return size
+
+def concat_files(paths: list[str], output_path: str) -> int:
+    """
+    依序將碎片以位元組層級串接為單一檔案，適用於MPEG-TS與fMP4(初始化片段+碎片)
+    先寫入.part暫存檔，完成後才改名，中斷時不會留下不完整的最終檔案
+    :return: 寫入的位元組數
+    """
+    temp_path = output_path + '.part'
+    total = 0
+    with open(temp_path, 'wb', buffering=0) as output:
+        for path in paths:
+            with open(path, 'rb') as fragment:
+                total += copy_into(fragment, output)
+    os.replace(temp_path, output_path)
+    return total
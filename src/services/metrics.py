@@ -0,0 +1,246 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+
+from src.app_types import common
+
+log = logging.getLogger(__name__)
+
+RELOAD_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+READY_BUCKETS = (0.5, 1, 2, 4, 8, 15, 30, 60, 120, 300)
+
+
+class Histogram:
+    """Prometheus格式的累積直方圖"""
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "buckets": {str(bound): count for bound, count in zip(self.buckets, self.counts)},
+        }
+
+
+class MissionMetrics:
+    """單一m3u8任務的計數器，下載執行緒寫入、指標伺服器執行緒讀取，以鎖保護"""
+
+    def __init__(self, mission: str, stats: common.DownloadStats | None = None, inflight: Callable[[], int] | None = None):
+        self.mission = mission
+        self.stats = stats
+        self.inflight = inflight
+        self._lock = threading.Lock()
+        self.bytes_downloaded = 0
+        self.segments: Counter[str] = Counter()
+        self.retries = 0
+        self.playlist_reload = Histogram(RELOAD_BUCKETS)
+        self.playlist_reload_failures = 0
+        self.last_playlist_reload = 0.0
+        self.segment_ready = Histogram(READY_BUCKETS)
+        self.live_edge_lag = 0.0
+
+    def observe_reload(self, seconds: float, success: bool) -> None:
+        with self._lock:
+            self.playlist_reload.observe(seconds)
+            if success:
+                self.last_playlist_reload = time.time()
+            else:
+                self.playlist_reload_failures += 1
+
+    def add_retry(self) -> None:
+        with self._lock:
+            self.retries += 1
+
+    def segment_finished(self, status: str, size: int, first_seen: float | None = None) -> None:
+        """
+        :param first_seen: 碎片首次出現在播放清單的時間(time.time())，用於計算出現至寫入磁碟的秒數
+        """
+        with self._lock:
+            self.segments[status] += 1
+            self.bytes_downloaded += size
+            if status == "Successful" and first_seen is not None:
+                ready = max(0.0, time.time() - first_seen)
+                self.segment_ready.observe(ready)
+                self.live_edge_lag = ready
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "mission": self.mission,
+                # 已存在而略過請求的檔案不計入下載量
+                "bytes_downloaded": max(0, self.bytes_downloaded - (self.stats.bytes_saved if self.stats else 0)),
+                "segments": dict(self.segments),
+                "retries": self.retries,
+                "probe_requests": self.stats.probe_requests if self.stats else 0,
+                "requests_saved": self.stats.requests_saved if self.stats else 0,
+                "inflight_tasks": self.inflight() if self.inflight else 0,
+                "playlist_reload_seconds": self.playlist_reload.to_dict(),
+                "playlist_reload_failures": self.playlist_reload_failures,
+                "last_playlist_reload_timestamp": self.last_playlist_reload,
+                "segment_ready_seconds": self.segment_ready.to_dict(),
+                "live_edge_lag_seconds": round(self.live_edge_lag, 3),
+            }
+
+
+def escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class MetricsRegistry:
+    """程序內所有任務的指標，輸出Prometheus文字格式與JSON"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.missions: dict[str, MissionMetrics] = {}
+
+    def register(self, mission: str, stats: common.DownloadStats | None = None, inflight: Callable[[], int] | None = None) -> MissionMetrics:
+        metrics = MissionMetrics(mission, stats, inflight)
+        with self._lock:
+            self.missions[mission] = metrics
+        return metrics
+
+    def snapshots(self) -> list[dict]:
+        with self._lock:
+            missions = list(self.missions.values())
+        return [metrics.snapshot() for metrics in missions]
+
+    def to_json(self) -> dict:
+        return {"timestamp": time.time(), "missions": self.snapshots()}
+
+    def render_prometheus(self) -> str:
+        lines: list[str] = []
+
+        def header(name: str, metric_type: str, help_text: str):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+
+        def histogram(name: str, label: str, data: dict):
+            for bound, count in data["buckets"].items():
+                lines.append(f'{name}_bucket{{{label},le="{bound}"}} {count}')
+            lines.append(f'{name}_bucket{{{label},le="+Inf"}} {data["count"]}')
+            lines.append(f'{name}_sum{{{label}}} {data["sum"]}')
+            lines.append(f'{name}_count{{{label}}} {data["count"]}')
+
+        snapshots = self.snapshots()
+        simple = [
+            ("hls_bytes_downloaded_total", "counter", "Bytes downloaded from the origin", "bytes_downloaded"),
+            ("hls_retries_total", "counter", "Segment download retries", "retries"),
+            ("hls_probe_requests_total", "counter", "Body-less probe requests", "probe_requests"),
+            ("hls_requests_saved_total", "counter", "Segment requests skipped for existing files", "requests_saved"),
+            ("hls_playlist_reload_failures_total", "counter", "Failed media playlist reloads", "playlist_reload_failures"),
+            ("hls_inflight_tasks", "gauge", "Segment downloads in flight", "inflight_tasks"),
+            ("hls_last_playlist_reload_timestamp_seconds", "gauge", "Unix time of the last successful playlist reload", "last_playlist_reload_timestamp"),
+            ("hls_live_edge_lag_seconds", "gauge", "Seconds from the latest segment appearing in the playlist to being on disk", "live_edge_lag_seconds"),
+        ]
+        for name, metric_type, help_text, key in simple:
+            header(name, metric_type, help_text)
+            for snapshot in snapshots:
+                lines.append(f'{name}{{mission="{escape_label(snapshot["mission"])}"}} {snapshot[key]}')
+
+        header("hls_segments_total", "counter", "Finished segments by status")
+        for snapshot in snapshots:
+            for status, count in snapshot["segments"].items():
+                lines.append(f'hls_segments_total{{mission="{escape_label(snapshot["mission"])}",status="{escape_label(status)}"}} {count}')
+
+        header("hls_playlist_reload_seconds", "histogram", "Media playlist reload latency")
+        for snapshot in snapshots:
+            histogram("hls_playlist_reload_seconds", f'mission="{escape_label(snapshot["mission"])}"', snapshot["playlist_reload_seconds"])
+
+        header("hls_segment_ready_seconds", "histogram", "Seconds from a segment first appearing in the playlist to being on disk")
+        for snapshot in snapshots:
+            histogram("hls_segment_ready_seconds", f'mission="{escape_label(snapshot["mission"])}"', snapshot["segment_ready_seconds"])
+        return "\n".join(lines) + "\n"
+
+
+# 程序內所有任務共用的指標
+registry = MetricsRegistry()
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        # 覆寫此方法以禁用日誌輸出
+        pass
+
+    def do_GET(self):
+        if self.path.split('?')[0] == '/metrics':
+            body = registry.render_prometheus().encode('utf-8')
+            content_type = 'text/plain; version=0.0.4; charset=utf-8'
+        elif self.path.split('?')[0] == '/metrics.json':
+            body = json.dumps(registry.to_json(), ensure_ascii=False).encode('utf-8')
+            content_type = 'application/json'
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class MetricsExporter:
+    """
+    輸出指標：port大於0時提供/metrics(Prometheus)與/metrics.json，
+    指定json_path時每interval秒寫入一次JSON檔案
+    """
+
+    def __init__(self, port: int = 0, json_path: str = '', interval: float = 5, host: str = ''):
+        self.port = port
+        self.json_path = json_path
+        self.interval = interval
+        self.host = host
+        self.httpd: ThreadingHTTPServer | None = None
+        self._stop = threading.Event()
+        self._writer: threading.Thread | None = None
+
+    def start(self) -> None:
+        if self.port > 0:
+            self.httpd = ThreadingHTTPServer((self.host, self.port), MetricsRequestHandler)
+            self.httpd.daemon_threads = True
+            threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+            log.info(f"指標伺服器：http://127.0.0.1:{self.port}/metrics")
+        if self.json_path:
+            self._writer = threading.Thread(target=self._write_loop, daemon=True)
+            self._writer.start()
+            log.info(f"指標將定期寫入：{self.json_path}")
+
+    def write_json(self) -> None:
+        folder = os.path.dirname(os.path.abspath(self.json_path))
+        os.makedirs(folder, exist_ok=True)
+        temp_path = self.json_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(registry.to_json(), f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, self.json_path)
+
+    def _write_loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.write_json()
+            except OSError as e:
+                log.warning(f"寫入指標檔案失敗：{e}")
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._writer is not None:
+            self._writer.join()
+            self.write_json()
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
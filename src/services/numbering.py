@@ -0,0 +1,126 @@
+import os
+import re
+import json
+import logging
+import tempfile
+import threading
+import contextlib
+from collections import Counter
+from itertools import pairwise
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+log = logging.getLogger(__name__)
+
+DELTAS_FILE = 'deltas.json'
+# 每行取最後一個數字組
+LAST_NUMBER_PATTERN = re.compile(r'^.*?(\d+)\D*$', re.M)
+# 同一程序內的任務可能寫入同一份紀錄
+_store_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def file_lock(path: str):
+    """跨行程的獨佔檔案鎖，多行程下載時保護讀取、合併到寫入的過程"""
+    with open(path, 'a+b') as f:
+        if os.name == 'nt':
+            f.seek(0)
+            while True:
+                try:
+                    # LK_LOCK最多等待約10秒，逾時後繼續等待
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def extract_numbers(paths: list[str]) -> list[int | None]:
+    """一次取出所有碎片路徑檔名(不含副檔名與參數)的最後一個數字組，沒有數字的檔名為None"""
+    stems = [os.path.splitext(os.path.basename(path.split('?')[0]))[0] for path in paths]
+    matches = LAST_NUMBER_PATTERN.findall('\n'.join(stems))
+    if len(matches) == len(stems):
+        return [int(match) for match in matches]
+    # 部分檔名沒有數字，逐一比對以保持位置對應
+    return [int(match.group(1)) if (match := LAST_NUMBER_PATTERN.match(stem)) else None for stem in stems]
+
+def delta_histogram(numbers: list[int | None]) -> Counter[int]:
+    """相鄰碎片序號的差值分布，只計入遞增的差值"""
+    return Counter(b - a for a, b in pairwise(numbers) if a is not None and b is not None and b > a)
+
+def rank_deltas(histogram: Counter[int], neighbors: int = 1) -> list[int]:
+    """依出現次數排序差值，並在後面補上各差值±neighbors的鄰近值，涵蓋序號的抖動"""
+    ranked = [delta for delta, _ in histogram.most_common()]
+    seen = set(ranked)
+    for delta in list(ranked):
+        for offset in range(1, neighbors + 1):
+            for near in (delta - offset, delta + offset):
+                if near > 0 and near not in seen:
+                    seen.add(near)
+                    ranked.append(near)
+    return ranked
+
+
+class DeltaStore:
+    """
+    以主機為鍵保存學習到的碎片序號差值分布，同一輸出資料夾的任務共用，
+    回推下載時第一輪即可使用過去觀察到的差值
+    多行程下載時以檔案鎖(deltas.json.lock)保護讀取到寫入的過程，避免其他行程的更新遺失；
+    寫入時以各自的暫存檔寫入後取代，檔案損毀時不覆寫，避免清空過去的紀錄
+    """
+
+    def __init__(self, folder: str):
+        self.path = os.path.join(folder, DELTAS_FILE)
+
+    def _read(self) -> dict[str, dict[str, int]] | None:
+        """讀取紀錄，檔案不存在時為空紀錄，無法讀取時回傳None"""
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            log.warning(f"序號差值紀錄讀取失敗：{e}")
+            return None
+
+    def load(self, host: str) -> Counter[int]:
+        with _store_lock:
+            data = self._read() or {}
+        return Counter({int(delta): count for delta, count in data.get(host, {}).items()})
+
+    def update(self, host: str, histogram: Counter[int]) -> None:
+        """將新的差值次數合併寫入檔案"""
+        if not histogram:
+            return
+        folder = os.path.dirname(self.path)
+        os.makedirs(folder, exist_ok=True)
+        with _store_lock, file_lock(self.path + '.lock'):
+            data = self._read()
+            if data is None:
+                return
+            learned = Counter({int(delta): count for delta, count in data.get(host, {}).items()})
+            learned.update(histogram)
+            data[host] = {str(delta): count for delta, count in learned.most_common()}
+            temp_path = None
+            try:
+                with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=folder, prefix=DELTAS_FILE, suffix='.tmp', delete=False) as f:
+                    temp_path = f.name
+                    json.dump(data, f, ensure_ascii=False, indent=2)
+                os.replace(temp_path, self.path)
+            except OSError as e:
+                log.warning(f"序號差值紀錄寫入失敗：{e}")
+                if temp_path and os.path.exists(temp_path):
+                    os.remove(temp_path)
@@ -0,0 +1,66 @@
+import os
+import asyncio
+import aiohttp
+import logging
+
+from src.services import profiler
+from src.services.m3u8_downloader import m3u8_downloader
+
+log = logging.getLogger(__name__)
+
+
+class Orchestrator:
+    """
+    以單一事件迴圈執行所有m3u8任務，各任務為迴圈中的一個Task，
+    共用同一個TCPConnector，同一CDN的任務可共用連線保持、DNS快取與TLS工作階段
+    max_missions限制同時執行的任務數，對應執行緒模式的threads
+    """
+
+    def __init__(self, missions: list[m3u8_downloader], max_missions: int = 3, connection_limit: int = 100, dns_ttl: int = 300, keepalive: float = 30, profile: bool = False, profile_lag: float = 0.1, profile_folder: str = ''):
+        self.missions = missions
+        self.max_missions = max(1, max_missions)
+        self.connection_limit = connection_limit
+        self.dns_ttl = dns_ttl
+        self.keepalive = keepalive
+        self.profile = profile
+        self.profile_lag = profile_lag
+        self.profile_folder = profile_folder
+
+    def create_connector(self) -> aiohttp.TCPConnector:
+        # 單一主機的連線數交由ConnectionScheduler調整，連線池只限制總數
+        return aiohttp.TCPConnector(
+            limit=self.connection_limit,
+            limit_per_host=0,
+            ttl_dns_cache=self.dns_ttl,
+            keepalive_timeout=self.keepalive,
+            enable_cleanup_closed=True,
+        )
+
+    async def run_all(self, name_length: int = 0) -> None:
+        connector = self.create_connector()
+        semaphore = asyncio.Semaphore(self.max_missions)
+
+        async def run(mission: m3u8_downloader):
+            async with semaphore:
+                await mission.run(connector, name_length)
+
+        try:
+            results = await asyncio.gather(*(run(mission) for mission in self.missions), return_exceptions=True)
+        finally:
+            await connector.close()
+        for mission, result in zip(self.missions, results):
+            if isinstance(result, BaseException):
+                log.error(f'任務異常終止：{mission.m3u8_info.filename} - {result}')
+
+    def main(self, name_length: int = 0) -> None:
+        loop = asyncio.new_event_loop()
+        mission_profiler = profiler.MissionProfiler(self.profile_lag) if self.profile else None
+        if mission_profiler:
+            # 所有任務共用同一執行緒，分析報告涵蓋全部任務
+            mission_profiler.start(loop)
+        try:
+            loop.run_until_complete(self.run_all(name_length))
+        finally:
+            if mission_profiler:
+                mission_profiler.stop(os.path.join(self.profile_folder, 'profile'))
+            loop.close()
@@ -0,0 +1,136 @@
+import re
+import time
+import asyncio
+import logging
+
+from src.services import scheduler, transport
+from src.services.scheduler import get_host
+
+log = logging.getLogger(__name__)
+
+CONTENT_RANGE_TOTAL = re.compile(r'/(\d+)\s*$')
+
+def get_total_size(response: transport.Response) -> int | None:
+    """從回應標頭取得檔案完整大小，206回應以Content-Range為準"""
+    if response.status == 206:
+        match = CONTENT_RANGE_TOTAL.search(response.headers.get('Content-Range', ''))
+        return int(match.group(1)) if match else None
+    if response.status == 200 and response.headers.get('Content-Length'):
+        return int(response.headers['Content-Length'])
+    return None
+
+async def probe_size(url: str, session: transport.Transport, timeout=10) -> int | None:
+    """
+    不下載內容取得遠端檔案大小，先使用HEAD，失敗時改用Range: bytes=0-0
+    :return: 檔案大小，無法取得時回傳None
+    """
+    try:
+        async with session.head(url, timeout=timeout) as response:
+            size = get_total_size(response)
+            if size:
+                return size
+        async with session.get(url, headers={'Range': 'bytes=0-0'}, timeout=timeout) as response:
+            size = get_total_size(response)
+            # 伺服器忽略Range時直接關閉連線，不讀取內容
+            response.close()
+            return size or None
+    except (transport.TransportError, asyncio.TimeoutError) as e:
+        log.debug(f"探測檔案大小失敗：{url} - {str(e)}")
+        return None
+
+# 各主機可用的存在性探測方式：head、range或get，同一程序內所有任務共用
+PROBE_METHODS = ('head', 'range', 'get')
+host_methods: dict[str, str] = {}
+
+async def request_status(url: str, session: transport.Transport, method: str, timeout=10) -> int | None:
+    """以指定方式請求網址，不讀取內容並立即釋放連線，回傳狀態碼，連線失敗時回傳None"""
+    if method == 'head':
+        request = session.head(url, timeout=timeout)
+    elif method == 'range':
+        request = session.get(url, headers={'Range': 'bytes=0-0'}, timeout=timeout)
+    else:
+        request = session.get(url, timeout=timeout)
+    try:
+        async with request as response:
+            status = response.status
+            if status == 206 or (status == 200 and method == 'head'):
+                response.release()
+            else:
+                # 伺服器回傳完整內容時直接關閉連線，不傳輸內容
+                response.close()
+            return status
+    except (transport.TransportError, asyncio.TimeoutError) as e:
+        log.debug(f"探測網址失敗：{url} - {str(e)}")
+        return None
+
+async def scheduled_status(url: str, session: transport.Transport, method: str, timeout=10, connection_scheduler: scheduler.ConnectionScheduler | None = None, throttle_retries=3) -> int | None:
+    """
+    提供connection_scheduler時先取得連線名額，並回報結果調整主機的同時連線數
+    被限流(429/503)時等待後重試，避免把限流誤判為不存在
+    """
+    if connection_scheduler is None:
+        return await request_status(url, session, method, timeout)
+    for attempt in range(throttle_retries + 1):
+        async with connection_scheduler.slot(url):
+            start = time.perf_counter()
+            status = await request_status(url, session, method, timeout)
+            connection_scheduler.report(url, status, time.perf_counter() - start)
+        if status not in scheduler.THROTTLE_STATUS or attempt == throttle_retries:
+            break
+        await asyncio.sleep(0.5 * 2 ** attempt)
+    return status
+
+def status_exists(status: int | None) -> bool | None:
+    """True存在、False不存在(404/410)、None無法判斷"""
+    if status in (200, 206, 416):
+        return True
+    if status in (404, 410):
+        return False
+    return None
+
+async def request_exists(url: str, session: transport.Transport, method: str, timeout=10, connection_scheduler: scheduler.ConnectionScheduler | None = None) -> bool | None:
+    """以指定方式檢查網址是否存在"""
+    return status_exists(await scheduled_status(url, session, method, timeout, connection_scheduler))
+
+async def calibrate(url: str, session: transport.Transport, timeout=10, connection_scheduler: scheduler.ConnectionScheduler | None = None) -> str:
+    """
+    以確定存在的網址決定主機的探測方式，依序嘗試HEAD、Range，皆被拒時使用GET
+    只記錄明確的結果；逾時、連線失敗、限流或伺服器錯誤時不記錄，之後由probe_exists逐步判斷
+    """
+    host = get_host(url)
+    if host in host_methods:
+        return host_methods[host]
+    method = 'get'
+    for candidate in ('head', 'range'):
+        status = await scheduled_status(url, session, candidate, timeout, connection_scheduler)
+        exists = status_exists(status)
+        if exists:
+            method = candidate
+            break
+        if exists is None and not is_rejected(status):
+            log.info(f"主機{host}的探測方式暫時無法判斷：{candidate} - {status}")
+            return 'head'
+    host_methods[host] = method
+    log.info(f"主機{host}的探測方式：{method}")
+    return method
+
+async def probe_exists(url: str, session: transport.Transport, timeout=10, connection_scheduler: scheduler.ConnectionScheduler | None = None) -> bool | None:
+    """以主機的探測方式檢查網址是否存在，方式被拒時改用下一種方式並記錄於主機"""
+    host = get_host(url)
+    method = host_methods.get(host, 'head')
+    status = await scheduled_status(url, session, method, timeout, connection_scheduler)
+    index = PROBE_METHODS.index(method)
+    while index + 1 < len(PROBE_METHODS) and is_rejected(status):
+        # HEAD被拒(405/403等)時改用Range，Range無法判斷時改用GET
+        index += 1
+        status = await scheduled_status(url, session, PROBE_METHODS[index], timeout, connection_scheduler)
+        if status_exists(status) is not None:
+            host_methods[host] = PROBE_METHODS[index]
+            log.info(f"主機{host}的探測方式改為：{PROBE_METHODS[index]}")
+    if status is not None and status_exists(status) is None:
+        log.debug(f"探測網址無法判斷：{url} - {status}")
+    return status_exists(status)
+
+def is_rejected(status: int | None) -> bool:
+    """探測方式被伺服器拒絕；限流、伺服器錯誤與連線失敗不改變探測方式"""
+    return status is not None and status_exists(status) is None and status < 500 and status not in scheduler.THROTTLE_STATUS
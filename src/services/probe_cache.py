@@ -0,0 +1,80 @@
+import os
+import json
+import time
+import logging
+
+log = logging.getLogger(__name__)
+
+PROBE_CACHE_FILE = 'probe_cache.json'
+
+
+class ProbeCache:
+    """
+    碎片探測結果快取，以FormatInfo.url為鍵記錄各序號是否存在及記錄時間，儲存於碎片資料夾旁
+    存在的結果保留positive_ttl秒，不存在的結果保留negative_ttl秒；無法判斷的結果不記錄
+    """
+
+    def __init__(self, folder: str, positive_ttl: float = 24 * 3600, negative_ttl: float = 1800):
+        self.path = os.path.join(folder, PROBE_CACHE_FILE)
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.entries: dict[str, dict[int, tuple[bool, float]]] = {}
+        self.hits = 0
+        self.dirty = False
+
+    def expired(self, exists: bool, checked: float, now: float) -> bool:
+        return now - checked > (self.positive_ttl if exists else self.negative_ttl)
+
+    def load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            log.warning(f"探測快取讀取失敗，重新建立：{e}")
+            return
+        now = time.time()
+        count = 0
+        for format_url, results in data.items():
+            entries = self.entries.setdefault(format_url, {})
+            for num, (exists, checked) in results.items():
+                if not self.expired(exists, checked, now):
+                    entries[int(num)] = (bool(exists), checked)
+                    count += 1
+        log.info(f"讀取探測快取{count}筆：{self.path}")
+
+    def get(self, format_url: str, num: int) -> bool | None:
+        """取得未過期的探測結果，沒有紀錄時回傳None"""
+        entry = self.entries.get(format_url, {}).get(num)
+        if entry is None:
+            return None
+        exists, checked = entry
+        if self.expired(exists, checked, time.time()):
+            del self.entries[format_url][num]
+            return None
+        self.hits += 1
+        return exists
+
+    def put(self, format_url: str, num: int, exists: bool) -> None:
+        self.entries.setdefault(format_url, {})[num] = (exists, time.time())
+        self.dirty = True
+
+    def save(self) -> None:
+        """有新紀錄時寫入檔案，同時移除過期紀錄"""
+        if not self.dirty:
+            return
+        now = time.time()
+        data = {
+            format_url: {str(num): [exists, checked] for num, (exists, checked) in results.items()
+                         if not self.expired(exists, checked, now)}
+            for format_url, results in self.entries.items()
+        }
+        temp_path = self.path + '.tmp'
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(temp_path, self.path)
+            self.dirty = False
+        except OSError as e:
+            log.warning(f"探測快取寫入失敗：{e}")
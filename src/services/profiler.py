@@ -0,0 +1,123 @@
+import os
+import sys
+import time
+import pstats
+import cProfile
+import logging
+import threading
+import traceback
+import tracemalloc
+import asyncio
+
+log = logging.getLogger(__name__)
+
+def set_logger(new_log):
+    current_module = sys.modules[__name__]  # 取得 `c` 模組的引用
+    setattr(current_module, "log", new_log)
+
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+
+
+class LoopLagMonitor:
+    """
+    事件迴圈延遲監控：迴圈內定期更新心跳，監控執行緒發現心跳停止超過threshold時，
+    記錄迴圈執行緒當下的呼叫堆疊，找出阻塞事件迴圈的同步呼叫
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, thread_id: int, threshold: float = 0.1):
+        self.loop = loop
+        self.thread_id = thread_id
+        self.threshold = threshold
+        self.interval = threshold / 2
+        self.last_beat = time.monotonic()
+        self.blocked_times = 0
+        self.max_lag = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._watch, name=f"loop-lag-{thread_id}", daemon=True)
+
+    def _beat(self) -> None:
+        now = time.monotonic()
+        lag = now - self.last_beat - self.interval
+        self.max_lag = max(self.max_lag, lag)
+        self.last_beat = now
+        if not self._stop.is_set():
+            self.loop.call_later(self.interval, self._beat)
+
+    def start(self) -> None:
+        self.last_beat = time.monotonic()
+        self.loop.call_soon_threadsafe(self._beat)
+        self._thread.start()
+
+    def _watch(self) -> None:
+        reported_beat = None
+        while not self._stop.wait(self.interval):
+            beat = self.last_beat
+            blocked = time.monotonic() - beat
+            if blocked > self.threshold and beat != reported_beat:
+                # 同一次阻塞只記錄一次堆疊
+                reported_beat = beat
+                self.blocked_times += 1
+                frame = sys._current_frames().get(self.thread_id)
+                stack = ''.join(traceback.format_stack(frame)) if frame else '無法取得堆疊'
+                log.warning(f"事件迴圈阻塞超過{self.threshold:.3f}秒（已{blocked:.3f}秒），目前堆疊：\n{stack}")
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+class MissionProfiler:
+    """
+    以cProfile與tracemalloc分析單一任務執行緒，並監控事件迴圈延遲
+    cProfile只記錄呼叫enable的執行緒；tracemalloc為全程序共用，多個任務同時分析時只啟動一次
+    """
+
+    def __init__(self, lag_threshold: float = 0.1, top: int = 40):
+        self.lag_threshold = lag_threshold
+        self.top = top
+        self.profile = cProfile.Profile()
+        self.monitor: LoopLagMonitor | None = None
+        self.start_time = 0.0
+
+    def start(self, loop: asyncio.AbstractEventLoop) -> None:
+        global _tracemalloc_users
+        with _tracemalloc_lock:
+            if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+                tracemalloc.start(10)
+            _tracemalloc_users += 1
+        self.start_time = time.perf_counter()
+        self.monitor = LoopLagMonitor(loop, threading.get_ident(), self.lag_threshold)
+        self.monitor.start()
+        self.profile.enable()
+
+    def stop(self, folder: str) -> None:
+        """停止分析並將報告寫入folder"""
+        global _tracemalloc_users
+        self.profile.disable()
+        if self.monitor is not None:
+            self.monitor.stop()
+        elapsed = time.perf_counter() - self.start_time
+        os.makedirs(folder, exist_ok=True)
+
+        self.profile.dump_stats(os.path.join(folder, 'profile.prof'))
+        with open(os.path.join(folder, 'profile.txt'), 'w', encoding='utf-8') as f:
+            f.write(f"執行時間：{elapsed:.2f}秒\n")
+            if self.monitor is not None:
+                f.write(f"事件迴圈阻塞次數：{self.monitor.blocked_times}，最大延遲：{self.monitor.max_lag:.3f}秒（門檻{self.lag_threshold}秒）\n\n")
+            stats = pstats.Stats(self.profile, stream=f)
+            stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.top)
+            stats.sort_stats(pstats.SortKey.TIME).print_stats(self.top)
+
+        with _tracemalloc_lock:
+            if tracemalloc.is_tracing():
+                snapshot = tracemalloc.take_snapshot()
+                current, peak = tracemalloc.get_traced_memory()
+                with open(os.path.join(folder, 'memory.txt'), 'w', encoding='utf-8') as f:
+                    f.write(f"目前配置：{current / 1024 / 1024:.2f} MB，峰值：{peak / 1024 / 1024:.2f} MB（全程序）\n\n")
+                    for stat in snapshot.statistics('lineno')[:self.top]:
+                        f.write(f"{stat}\n")
+            _tracemalloc_users -= 1
+            if _tracemalloc_users == 0 and tracemalloc.is_tracing():
+                tracemalloc.stop()
+        log.info(f"效能分析報告已寫入：{folder}")
@@ -0,0 +1,198 @@
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+
+log = logging.getLogger(__name__)
+
+
+def get_host(url: str) -> str:
+    return urlsplit(url).netloc
+
+
+class _Waiter:
+    __slots__ = ("host", "loop", "future", "granted")
+
+    def __init__(self, host: str, loop: asyncio.AbstractEventLoop, future: asyncio.Future):
+        self.host = host
+        self.loop = loop
+        self.future = future
+        self.granted = False
+
+
+# 代表伺服器限流的狀態碼
+THROTTLE_STATUS = (429, 503)
+
+
+class AIMDLimit:
+    """
+    單一主機的同時連線上限，以AIMD(加法增加、乘法減少)調整：
+    回應正常且延遲未明顯上升時，每完成約limit個請求上限加一；
+    收到429/503、連線失敗或延遲超過基準的latency_factor倍時，上限乘以decrease，
+    同一波請求的壅塞訊號只減少一次
+    """
+
+    def __init__(self, initial: int, minimum: int = 1, maximum: int = 30, decrease: float = 0.5, latency_factor: float = 2.0):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.base_latency: float | None = None  # 觀察到的最低延遲，緩慢上修
+        self.latency: float | None = None  # 延遲的移動平均
+        self.last_decrease = 0.0
+
+    def __int__(self) -> int:
+        return int(self.limit)
+
+    def observe(self, status: int | None, latency: float) -> str:
+        """
+        記錄一次請求的結果
+        :param status: HTTP狀態碼，連線失敗或逾時為None
+        :return: 調整原因，未減少時為空字串
+        """
+        if status is None or status in THROTTLE_STATUS:
+            return self._decrease(f"狀態碼{status}" if status else "連線失敗")
+        if status >= 500:
+            return ''
+        self.latency = latency if self.latency is None else self.latency * 0.8 + latency * 0.2
+        if self.base_latency is None or latency < self.base_latency:
+            self.base_latency = latency
+        else:
+            self.base_latency += (latency - self.base_latency) * 0.01
+        if self.latency > self.base_latency * self.latency_factor and self.latency > 0.05:
+            return self._decrease(f"延遲{self.latency:.2f}秒")
+        if not self._cooling(time.monotonic()):
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+        return ''
+
+    def _cooling(self, now: float) -> bool:
+        """減少後的兩個往返時間內仍在傳輸的請求屬於同一波，不重複減少也不增加"""
+        return now - self.last_decrease < max(2 * (self.latency or 0.0), 0.2)
+
+    def _decrease(self, reason: str) -> str:
+        now = time.monotonic()
+        if self._cooling(now):
+            return ''
+        self.last_decrease = now
+        self.limit = max(self.minimum, self.limit * self.decrease)
+        # 延遲基準跟著重新量測，避免長期偏低導致持續減少
+        self.base_latency = self.latency
+        return reason
+
+
+class ConnectionScheduler:
+    """
+    跨任務共用的連線排程器，同時限制全域與單一主機的同時連線數
+    單一主機的上限從host_connections開始，依report回報的結果以AIMD減少並逐步恢復，不超過host_connections
+    每個m3u8任務各自擁有執行緒與事件迴圈，因此計數以threading.Lock保護，
+    等待中的任務透過call_soon_threadsafe在自己的事件迴圈中被喚醒
+    """
+
+    def __init__(self, max_connections: int = 30, host_connections: int = 10):
+        self.max_connections = max(1, max_connections)
+        self.host_connections = max(1, host_connections)
+        self._lock = threading.Lock()
+        self._active = 0
+        self._host_active: dict[str, int] = {}
+        self._host_limits: dict[str, AIMDLimit] = {}
+        self._waiters: deque[_Waiter] = deque()
+
+    def _host_limit(self, host: str) -> AIMDLimit:
+        limit = self._host_limits.get(host)
+        if limit is None:
+            limit = self._host_limits[host] = AIMDLimit(self.host_connections, maximum=self.host_connections)
+        return limit
+
+    def _can_run(self, host: str) -> bool:
+        return self._active < self.max_connections and self._host_active.get(host, 0) < int(self._host_limit(host))
+
+    def _take(self, host: str) -> None:
+        self._active += 1
+        self._host_active[host] = self._host_active.get(host, 0) + 1
+
+    def _wake_waiters(self) -> None:
+        """依序喚醒可以執行的等待者，已滿的主機不會阻擋其他主機"""
+        for waiter in list(self._waiters):
+            if self._active >= self.max_connections:
+                break
+            if self._can_run(waiter.host):
+                self._waiters.remove(waiter)
+                self._take(waiter.host)
+                waiter.granted = True
+                waiter.loop.call_soon_threadsafe(self._set_result, waiter.future)
+
+    @staticmethod
+    def _set_result(future: asyncio.Future) -> None:
+        if not future.done():
+            future.set_result(None)
+
+    async def acquire(self, host: str) -> None:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if not self._waiters and self._can_run(host):
+                self._take(host)
+                return
+            waiter = _Waiter(host, loop, loop.create_future())
+            self._waiters.append(waiter)
+            self._wake_waiters()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter.granted:
+                    # 已取得名額但任務被取消，歸還名額
+                    self._release_locked(host)
+                else:
+                    self._waiters.remove(waiter)
+            raise
+
+    def _release_locked(self, host: str) -> None:
+        self._active -= 1
+        count = self._host_active.get(host, 1) - 1
+        if count > 0:
+            self._host_active[host] = count
+        else:
+            self._host_active.pop(host, None)
+        self._wake_waiters()
+
+    def release(self, host: str) -> None:
+        with self._lock:
+            self._release_locked(host)
+
+    def report(self, url: str, status: int | None, latency: float) -> None:
+        """回報請求結果，調整主機的同時連線上限"""
+        host = get_host(url)
+        with self._lock:
+            limit = self._host_limit(host)
+            before = int(limit)
+            reason = limit.observe(status, latency)
+            after = int(limit)
+            if after > before:
+                self._wake_waiters()
+        if reason:
+            log.warning(f"主機{host}限流訊號({reason})，同時連線數調整為{after}")
+        elif after != before:
+            log.info(f"主機{host}回應正常，同時連線數調整為{after}")
+
+    @asynccontextmanager
+    async def slot(self, url: str):
+        """以網址的主機名稱取得連線名額"""
+        host = get_host(url)
+        await self.acquire(host)
+        try:
+            yield
+        finally:
+            self.release(host)
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                "active": self._active,
+                "waiting": len(self._waiters),
+                "hosts": dict(self._host_active),
+                "limits": {host: int(limit) for host, limit in self._host_limits.items()},
+            }
@@ -3,8 +3,6 @@ from socketserver import ThreadingMixIn
 import threading
 import socket
 
-httpd_server = None
-
 class ThreadedHTTPServer(ThreadingMixIn, HTTPServer):
     """允許多發連線的 HTTPServer"""
     daemon_threads = True  # 確保線程在主程序退出時終止
@@ -13,23 +11,56 @@ class MyHTTPRequestHandler(SimpleHTTPRequestHandler):
     def log_message(self, format, *args):
         # 覆寫此方法以禁用日誌輸出
         pass
-    
+
     def end_headers(self):
         self.send_header('Content-Disposition', 'attachment')
         SimpleHTTPRequestHandler.end_headers(self)
 
+class FileServer:
+    """
+    單一資料夾的檔案伺服器，每次合併各自建立，互不共用狀態
+    port為0時由系統分配可用埠號，同一台機器上的多個行程不會互相衝突
+    """
+
+    def __init__(self, directory='.', port=0, host='127.0.0.1'):
+        self.directory = directory
+        self.host = host
+        self.httpd = ThreadedHTTPServer((host, port), lambda *args, **kwargs: MyHTTPRequestHandler(*args, directory=directory, **kwargs))
+        self.port = self.httpd.server_address[1]
+        self.thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}/"
+
+    def start(self) -> str:
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self.url
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+httpd_server: FileServer | None = None
+
 def run(server_class=ThreadedHTTPServer, handler_class=MyHTTPRequestHandler, directory='.'):
     global httpd_server
-    server_address = ('', port)
-    httpd_server = server_class(server_address, lambda *args, **kwargs: handler_class(*args, directory=directory, **kwargs))
+    httpd_server = FileServer(directory, port, host='')
     print(f"Server started on port {port}, serving directory: {directory}")
-    httpd_server.serve_forever()
+    httpd_server.httpd.serve_forever()
 
 def stop():
     # 關閉伺服器
     if httpd_server:
-        httpd_server.shutdown()
-        httpd_server.server_close()
+        httpd_server.stop()
 
 def get_local_ip() -> str | None:
     try:
@@ -37,11 +68,12 @@ def get_local_ip() -> str | None:
         s.connect(('8.8.8.8', 80))
         local_ip = s.getsockname()[0]
         s.close()
-        print(f"啟動檔案伺服器，網址: \"http://{local_ip}:{port}\"")
-        return f"http://{local_ip}:{port}/"
-    except Exception as e:
+    except OSError as e:
+        # 離線時無法取得區網IP，改用本機位址
         print("Error:", e)
-        return None
+        local_ip = '127.0.0.1'
+    print(f"啟動檔案伺服器，網址: \"http://{local_ip}:{port}\"")
+    return f"http://{local_ip}:{port}/"
 
 def main(set_port=8000, directory='.') -> str:
     global port
@@ -53,7 +85,7 @@ def main(set_port=8000, directory='.') -> str:
         return url
     else:
         raise Exception("無法獲取本地 IP 地址")
-    
+
 
 if __name__ == "__main__":
     import argparse
@@ -0,0 +1,295 @@
+import re
+import abc
+import random
+import asyncio
+import aiohttp
+import logging
+import contextlib
+from typing import AsyncIterator, Callable, Mapping
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+log = logging.getLogger(__name__)
+
+# 可由參數選擇的傳輸方式，fake只供測試與效能評估使用
+TRANSPORTS = ('aiohttp', 'http2')
+RANGE_PATTERN = re.compile(r'bytes=(\d+)-(\d*)')
+
+
+class TransportError(Exception):
+    """傳輸層請求失敗，各實作將底層函式庫的例外轉換為此類別；逾時仍為asyncio.TimeoutError"""
+
+
+class TransportConnectionError(TransportError):
+    """無法建立或維持連線"""
+
+
+class Response(abc.ABC):
+    """
+    碎片與播放清單請求共用的回應介面
+    release 讀取結束後將連線交還連線池；close 不讀取剩餘內容直接中斷
+    """
+
+    status: int
+    headers: Mapping[str, str]
+
+    @abc.abstractmethod
+    def iter_chunked(self, chunk_size: int) -> AsyncIterator[bytes]:
+        ...
+
+    @abc.abstractmethod
+    async def read(self) -> bytes:
+        ...
+
+    @abc.abstractmethod
+    async def text(self) -> str:
+        ...
+
+    def release(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class Transport(abc.ABC):
+    """
+    HTTP傳輸層介面，碎片下載、探測、金鑰與播放清單更新皆經由此介面請求
+    request 回傳async context manager，離開時釋放回應；timeout為整個請求的秒數，None使用實作的預設值
+    """
+
+    name = ''
+
+    @abc.abstractmethod
+    def request(self, method: str, url: str, headers: dict | None = None, timeout: float | None = None) -> contextlib.AbstractAsyncContextManager[Response]:
+        ...
+
+    def get(self, url: str, headers: dict | None = None, timeout: float | None = None) -> contextlib.AbstractAsyncContextManager[Response]:
+        return self.request('GET', url, headers, timeout)
+
+    def head(self, url: str, headers: dict | None = None, timeout: float | None = None) -> contextlib.AbstractAsyncContextManager[Response]:
+        return self.request('HEAD', url, headers, timeout)
+
+    @abc.abstractmethod
+    def update_cookies(self, cookies: dict) -> None:
+        ...
+
+    async def close(self) -> None:
+        pass
+
+
+################################################################
+# aiohttp
+class AiohttpResponse(Response):
+    def __init__(self, response: aiohttp.ClientResponse):
+        self.response = response
+        self.status = response.status
+        self.headers = response.headers
+
+    def iter_chunked(self, chunk_size: int) -> AsyncIterator[bytes]:
+        return self.response.content.iter_chunked(chunk_size)
+
+    async def read(self) -> bytes:
+        return await self.response.read()
+
+    async def text(self) -> str:
+        return await self.response.text()
+
+    def release(self) -> None:
+        self.response.release()
+
+    def close(self) -> None:
+        self.response.close()
+
+
+class AiohttpTransport(Transport):
+    """以aiohttp.ClientSession請求，提供connector時與其他任務共用連線池(connector_owner=False)"""
+
+    name = 'aiohttp'
+
+    def __init__(self, headers: dict | None = None, cookies: dict | None = None, connector: aiohttp.BaseConnector | None = None):
+        if connector is not None:
+            self.session = aiohttp.ClientSession(headers=headers, cookies=cookies, connector=connector, connector_owner=False)
+        else:
+            self.session = aiohttp.ClientSession(headers=headers, cookies=cookies)
+
+    @contextlib.asynccontextmanager
+    async def request(self, method: str, url: str, headers: dict | None = None, timeout: float | None = None):
+        kwargs = {'timeout': aiohttp.ClientTimeout(total=timeout)} if timeout is not None else {}
+        try:
+            async with self.session.request(method, url, headers=headers, allow_redirects=True, **kwargs) as response:
+                yield AiohttpResponse(response)
+        except aiohttp.ClientConnectionError as e:
+            raise TransportConnectionError(str(e) or type(e).__name__) from e
+        except aiohttp.ClientError as e:
+            raise TransportError(str(e) or type(e).__name__) from e
+
+    def update_cookies(self, cookies: dict) -> None:
+        self.session.cookie_jar.update_cookies(cookies)
+
+    async def close(self) -> None:
+        await self.session.close()
+
+
+################################################################
+# HTTP/2
+class Http2Response(Response):
+    def __init__(self, response: 'httpx.Response'):
+        self.response = response
+        self.status = response.status_code
+        self.headers = response.headers
+
+    def iter_chunked(self, chunk_size: int) -> AsyncIterator[bytes]:
+        return self.response.aiter_bytes(chunk_size)
+
+    async def read(self) -> bytes:
+        return await self.response.aread()
+
+    async def text(self) -> str:
+        await self.response.aread()
+        return self.response.text
+
+    # 離開request時關閉串流；HTTP/2中斷單一串流(RST_STREAM)不影響同一連線上的其他請求
+
+
+class Http2Transport(Transport):
+    """
+    以httpx的HTTP/2連線請求，同一主機的碎片多工於少數連線上，減少大量小檔案的連線與TLS交握
+    伺服器不支援HTTP/2時由ALPN協商退回HTTP/1.1；需安裝httpx[http2]
+    """
+
+    name = 'http2'
+
+    def __init__(self, headers: dict | None = None, cookies: dict | None = None, max_connections: int = 10):
+        if httpx is None:
+            raise ImportError("HTTP/2傳輸需要httpx，請執行：pip install httpx[http2]")
+        try:
+            self.client = httpx.AsyncClient(
+                http2=True,
+                headers=headers,
+                cookies=cookies,
+                follow_redirects=True,
+                timeout=None,
+                limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            )
+        except ImportError as e:
+            raise ImportError("HTTP/2傳輸需要h2，請執行：pip install httpx[http2]") from e
+
+    @contextlib.asynccontextmanager
+    async def request(self, method: str, url: str, headers: dict | None = None, timeout: float | None = None):
+        kwargs = {'timeout': timeout} if timeout is not None else {}
+        try:
+            async with self.client.stream(method, url, headers=headers, **kwargs) as response:
+                yield Http2Response(response)
+        except httpx.TimeoutException as e:
+            raise asyncio.TimeoutError(str(e)) from e
+        except httpx.TransportError as e:
+            raise TransportConnectionError(str(e) or type(e).__name__) from e
+        except httpx.HTTPError as e:
+            raise TransportError(str(e) or type(e).__name__) from e
+
+    def update_cookies(self, cookies: dict) -> None:
+        self.client.cookies.update(cookies)
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+################################################################
+# 測試用
+class FakeResponse(Response):
+    def __init__(self, status: int, body: bytes, headers: dict[str, str]):
+        self.status = status
+        self.body = body
+        self.headers = headers
+        self.closed = False
+
+    async def iter_chunked(self, chunk_size: int) -> AsyncIterator[bytes]:
+        for start in range(0, len(self.body), chunk_size):
+            if self.closed:
+                break
+            yield self.body[start:start + chunk_size]
+
+    async def read(self) -> bytes:
+        return self.body
+
+    async def text(self) -> str:
+        return self.body.decode('utf-8')
+
+    def close(self) -> None:
+        self.closed = True
+
+
+FakeRoute = bytes | int | Callable[[str, str, dict], bytes | int | None]
+
+
+class FakeTransport(Transport):
+    """
+    記憶體內的傳輸層，供測試與效能評估在不連線的情況下得到固定結果
+    routes：網址 -> 內容(bytes)、狀態碼(int)，或以(method, url, headers)回傳內容或狀態碼的函式；
+    不在routes中的網址交由default處理，沒有default時回傳404
+    內容支援HEAD與Range請求，每次請求模擬latency加上0~jitter秒的延遲(以seed固定)，requests記錄所有請求
+    """
+
+    name = 'fake'
+
+    def __init__(self, routes: dict[str, FakeRoute] | None = None, default: FakeRoute | None = None, latency: float = 0.0, jitter: float = 0.0, seed: int = 0):
+        self.routes = routes if routes is not None else {}
+        self.default = default
+        self.latency = latency
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self.cookies: dict = {}
+        self.requests: list[tuple[str, str]] = []
+
+    def resolve(self, method: str, url: str, headers: dict) -> bytes | int | None:
+        route = self.routes.get(url, self.default)
+        if callable(route):
+            return route(method, url, headers)
+        return route
+
+    def build(self, method: str, result: bytes | int | None, headers: dict) -> FakeResponse:
+        if result is None:
+            return FakeResponse(404, b'', {})
+        if isinstance(result, int):
+            return FakeResponse(result, b'', {'Content-Length': '0'})
+        status = 200
+        body = result
+        response_headers = {'Content-Length': str(len(result))}
+        match = RANGE_PATTERN.fullmatch(headers.get('Range', ''))
+        if match and result:
+            start = int(match.group(1))
+            if start >= len(result):
+                return FakeResponse(416, b'', {'Content-Range': f'bytes */{len(result)}'})
+            end = min(int(match.group(2)) if match.group(2) else len(result) - 1, len(result) - 1)
+            status = 206
+            body = result[start:end + 1]
+            response_headers = {'Content-Length': str(len(body)), 'Content-Range': f'bytes {start}-{end}/{len(result)}'}
+        return FakeResponse(status, b'' if method == 'HEAD' else body, response_headers)
+
+    @contextlib.asynccontextmanager
+    async def request(self, method: str, url: str, headers: dict | None = None, timeout: float | None = None):
+        headers = headers or {}
+        self.requests.append((method, url))
+        delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            if timeout is not None and delay > timeout:
+                await asyncio.sleep(timeout)
+                raise asyncio.TimeoutError(url)
+            await asyncio.sleep(delay)
+        yield self.build(method, self.resolve(method, url, headers), headers)
+
+    def update_cookies(self, cookies: dict) -> None:
+        self.cookies.update(cookies)
+
+
+def create_transport(name: str, headers: dict | None = None, cookies: dict | None = None, connector: aiohttp.BaseConnector | None = None, max_connections: int = 10) -> Transport:
+    """依名稱建立傳輸層；HTTP/2自行管理多工連線，不使用共用的aiohttp connector"""
+    if name == 'http2':
+        return Http2Transport(headers, cookies, max_connections)
+    if name == 'aiohttp':
+        return AiohttpTransport(headers, cookies, connector)
+    raise ValueError(f"未知的傳輸方式：{name}，可用：{', '.join(TRANSPORTS)}")
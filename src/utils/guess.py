@@ -1,63 +1,105 @@
+import time
 import asyncio
-import aiohttp
 import logging
 
 from src.app_types.common import FormatInfo, Deltas
+from src.services import probe
+from src.services.probe_cache import ProbeCache
+from src.services.scheduler import ConnectionScheduler
+from src.services.transport import Transport
 
 log = logging.getLogger(__name__)
 
 
 class Default_Class:
-    def __init__(self, format_info:FormatInfo, session: aiohttp.ClientSession|None, distance:int=10000):
+    def __init__(self, format_info:FormatInfo, session: Transport|None, distance:int=10000, cache:ProbeCache|None=None, deltas:list[int]|None=None, connection_scheduler:ConnectionScheduler|None=None):
         self.format_info = format_info
         self.session = session
+        self.connection_scheduler = connection_scheduler # 探測與下載共用的連線排程器，依限流訊號調整連線數
+        self.cache = cache # 探測結果快取
         self.distance = distance # 當前值與最小檢查值範圍
         
         self.old_value:int | None = None #階段值，上一輪的值或是最小值
         self.new_value:int #當前值
         self.record_values:set = set() # 儲存已經檢查過的檔案段
+        self.probe_count = 0 # 探測請求次數
+        self.cache_hits = 0 # 探測快取命中次數
+        self.rtt:float | None = None # 探測請求的平均往返時間(秒)
+        self.last_search:dict = {} # 最近一次最小值搜尋的探測次數與時間
 
         # 初始化步進值與猜測值
         self.step_init()
-        self.guess_init()
+        self.guess_init(deltas=deltas)
 
-    def step_init(self, split_times:int=10):
-        """初始化步進值，必須為正整數"""
+    def step_init(self, split_times:int=10, max_fanout:int=16, rtt_unit:float=0.02):
+        """
+        初始化步進值，必須為正整數
+        :param max_fanout: 倍增與多分搜尋每輪同時探測的節點數上限
+        :param rtt_unit: 往返時間每增加rtt_unit秒，每輪多探測一個節點
+        """
         self.split_times = split_times
+        self.max_fanout = max_fanout
+        self.rtt_unit = rtt_unit
         
-    def guess_init(self, async_limit:int = 300):
-        """初始化常見的檔案段差值"""
+    def guess_init(self, async_limit:int = 300, deltas:list[int]|None = None):
+        """
+        初始化常見的檔案段差值
+        :param deltas: 從播放清單學習、依出現次數排序的差值，優先於內建的常見差值
+        """
+        self.common_deltas = list(deltas or [])
         # 自動對比常見的檔案段差值
-        self.common_deltas = []
         for delta in Deltas:
             if self.format_info.space in delta.value:
-                self.common_deltas = delta.value
-                log.debug(f"使用常見的檔案段差值：{self.common_deltas}")
+                self.common_deltas += [value for value in delta.value if value not in self.common_deltas]
+                log.debug(f"使用常見的檔案段差值：{delta.value}")
                 break
         if not self.common_deltas:
             self.common_deltas = [self.format_info.space]
         self.async_limit = min(async_limit, self.format_info.space)  # 限制異步檢查的數量不超過空間大小
 
-    async def check_status(self, value:int) -> int | None:
-        """檢查網址是否有效"""
+    def update_deltas(self, deltas:list[int]):
+        """以學習到的差值排序更新常見差值，保留搜尋中找到的其他差值"""
+        self.common_deltas = list(deltas) + [value for value in self.common_deltas if value not in deltas]
+
+    async def probe_value(self, value:int) -> bool | None:
+        """實際送出探測請求，回傳是否存在，無法判斷時回傳None"""
         url = self.format_info.url.format(num=str(value).zfill(self.format_info.fill))
-        try:
-            if not self.session:
-                log.warning("未提供 aiohttp.ClientSession，無法檢查網址有效性")
-                return None
-            async with self.session.get(url) as response:
-                if response.status == 200:
-                    log.debug(f"檢查網址有效：{url}")
-                    return value
-                log.debug(f"檢查網址無效：{url} - {response.status}")
-                return None
-        except aiohttp.ClientError as e:
-            log.warning(f"檢查網址無效：{url} - {str(e)}")
+        if not self.session:
+            log.warning("未提供傳輸層，無法檢查網址有效性")
             return None
+        try:
+            # 以HEAD或Range: bytes=0-0探測，不下載碎片內容
+            return await probe.probe_exists(url, self.session, connection_scheduler=self.connection_scheduler)
         except Exception as e:
             log.warning(f"檢查網址無效：{url} - {str(e)}")
             return None
 
+    async def check_status(self, value:int) -> int | None:
+        """檢查網址是否有效"""
+        if self.cache is not None:
+            cached = self.cache.get(self.format_info.url, value)
+            if cached is not None:
+                self.cache_hits += 1
+                return value if cached else None
+        start = time.perf_counter()
+        exists = await self.probe_value(value)
+        elapsed = time.perf_counter() - start
+        self.rtt = elapsed if self.rtt is None else self.rtt * 0.8 + elapsed * 0.2
+        self.probe_count += 1
+        if exists is not None and self.cache is not None:
+            self.cache.put(self.format_info.url, value, exists)
+        if exists:
+            log.debug(f"檢查序號有效：{value}")
+            return value
+        log.debug(f"檢查序號無效：{value}")
+        return None
+
+    async def calibrate(self) -> None:
+        """以當前值(播放清單中確定存在的碎片)決定此主機的探測方式"""
+        if self.session:
+            url = self.format_info.url.format(num=str(self.new_value).zfill(self.format_info.fill))
+            await probe.calibrate(url, self.session, connection_scheduler=self.connection_scheduler)
+
 class StepFinder(Default_Class):
     async def step_round_test(self, value:int, space:int=10000) -> int | None:
         """
@@ -79,6 +121,7 @@ class StepFinder(Default_Class):
 
     async def step_search(self, value:int):
         """
+        分段搜尋(舊方法，保留供benchmarks.step_search比較)
         每次將當前值到self.distance的距離，切成self.split_times個節點，檢查全部節點取得最小值
         取得最小值後，縮減範圍至最小值到下一個節點，並重複切片檢查，直到最小值為0或是檢查範圍為1
         """
@@ -96,15 +139,77 @@ class StepFinder(Default_Class):
                 value = await self.step_search(min_value)
         return value
 
+    def fanout(self) -> int:
+        """依探測的平均往返時間決定每輪同時探測的節點數，延遲越高每輪探測越多節點以減少輪數"""
+        if self.rtt is None:
+            return self.max_fanout // 2
+        return max(1, min(self.max_fanout, int(self.rtt / self.rtt_unit) + 1))
+
+    async def probe_values(self, values:list[int]) -> dict[int, bool]:
+        """同時探測多個序號"""
+        results = await asyncio.gather(*(self.check_status(value) for value in values))
+        return {value: result is not None for value, result in zip(values, results)}
+
+    async def gallop_search(self, value:int) -> int:
+        """
+        倍增搜尋：從當前值往前探測1、2、4、8…的位置，直到遇到無效序號，
+        再於最後的無效序號與最小有效序號之間以多分搜尋找出最小有效值
+        每輪同時探測的節點數依往返時間調整；假設有效序號連續
+        """
+        low = None # 已知無效
+        high = value # 已知有效
+        offset = 1
+        while low is None and high > 0:
+            points = []
+            for _ in range(self.fanout()):
+                points.append(max(0, value - offset))
+                offset *= 2
+                if points[-1] == 0:
+                    break
+            results = await self.probe_values(points)
+            for point in points:
+                if not results[point]:
+                    low = point
+                    break
+                high = point
+        if low is None:
+            return high
+        while high - low > 1:
+            count = min(self.fanout(), high - low - 1)
+            points = sorted({low + (high - low) * i // (count + 1) for i in range(1, count + 1)})
+            results = await self.probe_values(points)
+            for point in points:
+                if results[point]:
+                    high = point
+                    break
+                low = point
+        return high
+
+    async def timed_search(self, value:int, method:str='gallop') -> int:
+        """執行搜尋並記錄使用的探測次數與時間"""
+        probes, hits = self.probe_count, self.cache_hits
+        start = time.perf_counter()
+        if method == 'gallop':
+            value = await self.gallop_search(value)
+        else:
+            value = await self.step_search(value)
+        self.last_search = {
+            "probes": self.probe_count - probes,
+            "cache_hits": self.cache_hits - hits,
+            "seconds": time.perf_counter() - start,
+        }
+        log.info(f"最小有效值：{value}，探測{self.last_search['probes']}次，快取命中{self.last_search['cache_hits']}次，耗時{self.last_search['seconds']:.2f}秒")
+        return value
+
     async def step_main(self):
         """
-        若是沒有最小值，則從當前值開始逐步減少檢查範圍，直到找到最小的有效值
+        若是沒有最小值，則從當前值開始倍增搜尋最小的有效值
         若是有最小值，則直接產生階段值與當前值的序號列表
         """
         if self.old_value is None:
             # 如果沒有最小值，則搜尋最小值
-            log.info("開始步進搜尋最小有效值")
-            start_number = await self.step_search(self.new_value)
+            log.info("開始倍增搜尋最小有效值")
+            start_number = await self.timed_search(self.new_value)
             self.old_value = start_number
         else:
             # 如果有最小值，則直接產生階段值與當前值的序號列表
@@ -142,6 +247,9 @@ class GuessFinder(Default_Class):
             limit_value = max(0, self.old_value) if self.old_value else -1
             # 生成檢查序號範圍
             round_list = [n + i for i in range(self.async_limit) if n + i < start_num and n + i > limit_value]
+            if not round_list:
+                # 整段範圍都不大於上一輪的值，已檢查過
+                continue
             log.info(f"檢查序號範圍：{round_list[0]} ~ {round_list[-1]}")
             result = await self.guess_create_tasks(round_list)
             if result:
@@ -177,6 +285,7 @@ class Finder(StepFinder, GuessFinder):
         self.new_value = new_value
         valid_segments = []
         self.guess_type = None
+        await self.calibrate()
 
         if self.format_info.space == 1:
             log.info("序號連貫，使用步進法尋找有效檔案段")
@@ -84,10 +84,11 @@ def load_cookies_to_dict(cookies: common.CookieType) -> dict|None:
         try:
             if '.txt' == cookies[-4:]:
                 with open(cookies, 'r', encoding='utf-8') as f:
-                    if 'Netscape' in f.read():
-                        result = parse_netscape_to_dict(f.read())
-                    else:
-                        result = parse_string_to_dict(f.read())
+                    content = f.read()
+                if 'Netscape' in content:
+                    result = parse_netscape_to_dict(content)
+                else:
+                    result = parse_string_to_dict(content)
             else:
                 result = parse_string_to_dict(cookies)
         except:
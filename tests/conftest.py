@@ -0,0 +1,44 @@
+import types
+import asyncio
+
+import pytest
+
+from src.services import downloader
+
+class Clock:
+    """可手動推進的時鐘"""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def patch_clock(monkeypatch, clock):
+    """以clock取代模組中的time.monotonic與time.time，事件迴圈仍使用真實時間"""
+    def patch(module) -> Clock:
+        monkeypatch.setattr(module, 'time', types.SimpleNamespace(monotonic=clock, time=clock))
+        return clock
+    return patch
+
+
+@pytest.fixture
+def no_retry_wait(monkeypatch):
+    """下載與探測重試間的等待改為立即返回"""
+    sleep = asyncio.sleep
+
+    async def fast_sleep(delay, *args, **kwargs):
+        await sleep(0)
+
+    monkeypatch.setattr(downloader.asyncio, 'sleep', fast_sleep)
+
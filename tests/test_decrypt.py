@@ -0,0 +1,34 @@
+import os
+import random
+
+import pytest
+from Crypto.Cipher import AES
+from Crypto.Util.Padding import pad
+
+from src.services import decrypt
+
+
+@pytest.mark.parametrize('size', [0, 1, 15, 16, 17, 4096, 10000])
+def test_stream_decryptor_matches_whole_file(size):
+    key, iv = os.urandom(16), os.urandom(16)
+    plain = os.urandom(size)
+    encrypted = AES.new(key, AES.MODE_CBC, iv).encrypt(pad(plain, AES.block_size))
+    rng = random.Random(size)
+    decryptor = decrypt.StreamDecryptor(key, iv.hex())
+    output = b''
+    start = 0
+    while start < len(encrypted):
+        end = start + rng.randint(1, 100)
+        output += decryptor.update(encrypted[start:end])
+        start = end
+    output += decryptor.finalize()
+    assert output == plain
+
+
+def test_stream_decryptor_rejects_truncated_input():
+    key = os.urandom(16)
+    encrypted = AES.new(key, AES.MODE_CBC, bytes(16)).encrypt(pad(b'x' * 100, AES.block_size))
+    decryptor = decrypt.StreamDecryptor(key)
+    decryptor.update(encrypted[:-1])
+    with pytest.raises(ValueError):
+        decryptor.finalize()
@@ -0,0 +1,126 @@
+import os
+import asyncio
+
+import pytest
+from Crypto.Cipher import AES
+from Crypto.Util.Padding import pad
+
+from src.services import decrypt, downloader, transport
+
+URL = 'http://origin.test/stream/media.ts'
+CONTENT = bytes(range(256)) * 64  # 16384 bytes
+
+
+def test_range_download_parts(tmp_path, no_retry_wait):
+    session = transport.FakeTransport({URL: CONTENT})
+    filepath = str(tmp_path / 'seg_1.ts')
+    ok = asyncio.run(downloader.async_download_range(URL, filepath, session, 1000, 5000, part_size=2048))
+    assert ok
+    with open(filepath, 'rb') as f:
+        assert f.read() == CONTENT[1000:6000]
+    assert len(session.requests) == 3
+    assert not os.path.exists(filepath + '.part')
+
+def test_range_download_failed_part_leaves_no_file(tmp_path, no_retry_wait):
+    def route(method, url, headers):
+        # 第二個分段一律失敗
+        return 503 if headers.get('Range', '').startswith('bytes=3048-') else CONTENT
+
+    session = transport.FakeTransport({URL: route})
+    filepath = str(tmp_path / 'seg_1.ts')
+    ok = asyncio.run(downloader.async_download_range(URL, filepath, session, 1000, 5000, part_size=2048, retry_times=2))
+    assert not ok
+    assert not os.path.exists(filepath)
+    assert not os.path.exists(filepath + '.part')
+
+def test_range_download_resume(tmp_path, no_retry_wait):
+    session = transport.FakeTransport({URL: CONTENT})
+    filepath = str(tmp_path / 'seg_1.ts')
+    # 中斷時留下的暫存檔大小正確但內容不完整，不可視為已完成
+    with open(filepath + '.part', 'wb') as f:
+        f.truncate(5000)
+    assert asyncio.run(downloader.async_download_range(URL, filepath, session, 1000, 5000, part_size=2048))
+    with open(filepath, 'rb') as f:
+        assert f.read() == CONTENT[1000:6000]
+
+    # 已完成的檔案不再請求
+    session.requests.clear()
+    assert asyncio.run(downloader.async_download_range(URL, filepath, session, 1000, 5000, part_size=2048))
+    assert session.requests == []
+
+
+def test_download_resume_with_record(tmp_path, no_retry_wait):
+    session = transport.FakeTransport({URL: CONTENT})
+    filepath = str(tmp_path / 'seg_1.ts')
+    assert asyncio.run(downloader.async_download(URL, filepath, session, verify='record'))
+    assert len(session.requests) == 1
+
+    # 紀錄的大小相符時不傳輸內容
+    session.requests.clear()
+    assert asyncio.run(downloader.async_download(URL, filepath, session, verify='record', known_size=len(CONTENT)))
+    assert session.requests == []
+
+    # 檔案不完整時重新下載
+    with open(filepath, 'r+b') as f:
+        f.truncate(100)
+    assert asyncio.run(downloader.async_download(URL, filepath, session, verify='record', known_size=len(CONTENT)))
+    with open(filepath, 'rb') as f:
+        assert f.read() == CONTENT
+
+
+def test_download_resume_with_probe(tmp_path, no_retry_wait):
+    session = transport.FakeTransport({URL: CONTENT})
+    filepath = str(tmp_path / 'seg_1.ts')
+    with open(filepath, 'wb') as f:
+        f.write(CONTENT)
+    # 以HEAD取得大小，不傳輸內容
+    assert asyncio.run(downloader.async_download(URL, filepath, session, verify='probe', known_size=1))
+    assert [method for method, _ in session.requests] == ['HEAD']
+
+
+def test_download_with_stream_decryption(tmp_path, no_retry_wait):
+    key, iv = os.urandom(16), os.urandom(16)
+    encrypted = AES.new(key, AES.MODE_CBC, iv).encrypt(pad(CONTENT, AES.block_size))
+    session = transport.FakeTransport({URL: encrypted})
+    filepath = str(tmp_path / 'fragments' / 'seg_1.ts')
+    decrypt_path = str(tmp_path / 'decrypt' / 'seg_1.ts')
+    ok = asyncio.run(downloader.async_download(URL, filepath, session, chunk_size=1000, decrypt_key=key, decrypt_iv=iv.hex(), decrypt_path=decrypt_path, keep_encrypted=False))
+    assert ok
+    assert not os.path.exists(filepath)
+    with open(decrypt_path, 'rb') as f:
+        assert f.read() == CONTENT
+
+
+def test_truncated_plaintext_is_decrypted_again(tmp_path, no_retry_wait):
+    key = os.urandom(16)
+    encrypted = AES.new(key, AES.MODE_CBC, bytes(16)).encrypt(pad(CONTENT, AES.block_size))
+    session = transport.FakeTransport({URL: encrypted})
+    filepath = tmp_path / 'fragments' / 'seg_1.ts'
+    decrypt_path = tmp_path / 'decrypt' / 'seg_1.ts'
+    filepath.parent.mkdir()
+    decrypt_path.parent.mkdir()
+    filepath.write_bytes(encrypted)
+    # 上次執行中斷時留下的不完整明文
+    decrypt_path.write_bytes(CONTENT[:1000])
+    ok = asyncio.run(downloader.async_download(URL, str(filepath), session, verify='record', known_size=len(encrypted), decrypt_key=key, decrypt_path=str(decrypt_path)))
+    assert ok
+    assert session.requests == []
+    assert decrypt_path.read_bytes() == CONTENT
+
+
+class BrokenResponse(transport.FakeResponse):
+    """傳輸到一半中斷的回應"""
+
+    async def iter_chunked(self, chunk_size):
+        yield self.body[:chunk_size]
+        raise transport.TransportConnectionError('connection reset')
+
+
+def test_interrupted_stream_leaves_no_plaintext(tmp_path):
+    key = os.urandom(16)
+    encrypted = AES.new(key, AES.MODE_CBC, bytes(16)).encrypt(pad(CONTENT, AES.block_size))
+    response = BrokenResponse(200, encrypted, {})
+    decrypt_path = str(tmp_path / 'seg_1.ts')
+    with pytest.raises(transport.TransportConnectionError):
+        asyncio.run(downloader.write_response(response, None, 1000, decrypt.StreamDecryptor(key), decrypt_path))
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,104 @@
+import asyncio
+import dataclasses
+
+import pytest
+
+from src.services import m3u8_graber, transport
+
+URL = 'http://origin.test/live/index.m3u8'
+PLAYLIST = '#EXTM3U\n#EXT-X-TARGETDURATION:2\n#EXT-X-MEDIA-SEQUENCE:0\n#EXTINF:2.0,\nseg_0.ts\n'
+
+
+def write_cookies(path, value):
+    path.write_text(
+        "# Netscape HTTP Cookie File\n"
+        f".origin.test\tTRUE\t/\tFALSE\t0\ttoken\t{value}\n",
+        encoding='utf-8',
+    )
+
+
+def test_reload_rereads_cookie_file(tmp_path):
+    cookies_file = tmp_path / 'cookies.txt'
+    write_cookies(cookies_file, 'first')
+    graber = m3u8_graber.async_get_media_m3u8.from_snapshot({"media_playlist_url": URL, "media_playlist_content": PLAYLIST})
+    graber.cookies = str(cookies_file)
+    session = transport.FakeTransport({URL: PLAYLIST.encode()})
+    graber.bind_session(session)
+
+    assert asyncio.run(graber.async_update_media_playlist())
+    assert session.cookies == {'token': 'first'}
+    write_cookies(cookies_file, 'second')
+    assert asyncio.run(graber.async_update_media_playlist())
+    assert session.cookies == {'token': 'second'}
+
+
+def test_reload_uses_dict_cookies():
+    graber = m3u8_graber.async_get_media_m3u8.from_snapshot({"media_playlist_url": URL, "media_playlist_content": PLAYLIST})
+    graber.cookies = {'token': 'value'}
+    session = transport.FakeTransport({URL: PLAYLIST.encode()})
+    graber.bind_session(session)
+    assert asyncio.run(graber.async_update_media_playlist())
+    assert session.cookies == {'token': 'value'}
+
+
+def test_patch_url_falls_back_to_master(tmp_path):
+    graber = m3u8_graber.async_get_media_m3u8.from_snapshot({
+        "master_playlist_url": 'http://origin.test/master.m3u8',
+        "media_playlist_url": 'http://origin.test/hls/720/index.m3u8',
+        "media_playlist_content": PLAYLIST.replace('seg_0.ts', '720/seg_0.ts'),
+    })
+    session = transport.FakeTransport({'http://origin.test/hls/720/seg_0.ts': 404, 'http://origin.test/720/seg_0.ts': b'ts'})
+    graber.bind_session(session)
+    info = graber.media_playlist_info
+    assert asyncio.run(graber.async_get_media_patch_url(info)) == 'http://origin.test/'
+    assert graber.media_patch_url == 'http://origin.test/'
+    session = transport.FakeTransport()
+    graber.bind_session(session)
+    assert asyncio.run(graber.async_get_media_patch_url(info)) is None
+
+
+def without_order(info):
+    return dataclasses.replace(info, files=[dataclasses.replace(file, order=0) for file in info.files], new_files=[dataclasses.replace(file, order=0) for file in info.new_files])
+
+
+def live_playlist(start, count, key_every=0):
+    lines = ['#EXTM3U', '#EXT-X-VERSION:3', '#EXT-X-TARGETDURATION:2', f'#EXT-X-MEDIA-SEQUENCE:{start}', '#EXT-X-MAP:URI="init.mp4"']
+    for sequence in range(start, start + count):
+        if key_every and (sequence % key_every == 0 or sequence == start):
+            # 視窗開頭需重複目前生效的金鑰
+            key_sequence = sequence - sequence % key_every
+            lines.append(f'#EXT-X-KEY:METHOD=AES-128,URI="key_{key_sequence}.key",IV=0x{key_sequence:032x}')
+        lines.append(f'#EXT-X-PROGRAM-DATE-TIME:2026-01-01T00:00:{sequence:02d}Z')
+        lines.append('#EXTINF:2.000,')
+        lines.append(f'seg_{sequence}.ts')
+    return '\n'.join(lines) + '\n'
+
+
+@pytest.mark.parametrize('key_every', [0, 4])
+def test_delta_parse_matches_full_parse(key_every):
+    previous = m3u8_graber.process_media_playlist(URL, live_playlist(10, 6, key_every))
+    last_sequence = previous.files[-1].sequence
+    content = live_playlist(13, 7, key_every)
+    delta = m3u8_graber.process_media_playlist(URL, content, last_sequence, previous)
+    full = m3u8_graber.process_media_playlist(URL, content, last_sequence)
+    assert without_order(delta) == without_order(full)
+    assert [file.sequence for file in delta.new_files] == [16, 17, 18, 19]
+    # 已解析過的碎片直接沿用，不重新建立
+    assert all(file is old for file, old in zip(delta.files, previous.files[3:]))
+
+
+def test_delta_parse_without_new_segments():
+    previous = m3u8_graber.process_media_playlist(URL, live_playlist(10, 6))
+    delta = m3u8_graber.process_media_playlist(URL, live_playlist(11, 5), 15, previous)
+    assert delta.new_files == []
+    assert without_order(delta) == without_order(m3u8_graber.process_media_playlist(URL, live_playlist(11, 5), 15))
+
+
+@pytest.mark.parametrize('content', [
+    live_playlist(0, 4),  # 序號重置
+    live_playlist(10, 6).replace('seg_15.ts', 'seg_15b.ts'),  # 序號未變但檔案變更
+])
+def test_delta_parse_falls_back_to_full_parse(content):
+    previous = m3u8_graber.process_media_playlist(URL, live_playlist(10, 6))
+    assert m3u8_graber.split_media_playlist(content, 15, previous) is None
+    assert m3u8_graber.process_media_playlist(URL, content, 15, previous) == m3u8_graber.process_media_playlist(URL, content, 15)
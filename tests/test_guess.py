@@ -0,0 +1,63 @@
+import re
+import asyncio
+
+import pytest
+
+from src.app_types.common import FormatInfo
+from src.services import probe, transport
+from src.utils import guess
+
+FORMAT_URL = 'http://origin.test/seg_{num}.ts'
+NUMBER = re.compile(r'seg_(\d+)\.ts')
+
+
+@pytest.fixture(autouse=True)
+def host_methods(monkeypatch):
+    monkeypatch.setattr(probe, 'host_methods', {})
+
+
+def origin(first: int, last: int) -> transport.FakeTransport:
+    """序號first到last的碎片存在"""
+    def route(method, url, headers):
+        num = int(NUMBER.search(url).group(1))
+        return b'x' if first <= num <= last else None
+    return transport.FakeTransport(default=route)
+
+
+def finder(session, fanout: int) -> guess.StepFinder:
+    step_finder = guess.StepFinder(FormatInfo(url=FORMAT_URL, space=1), session)
+    step_finder.fanout = lambda: fanout
+    return step_finder
+
+
+@pytest.mark.parametrize('fanout', [1, 3, 16])
+def test_gallop_search_finds_first_valid(fanout):
+    value = 100
+    for first in range(value + 1):
+        session = origin(first, value)
+        assert asyncio.run(finder(session, fanout).gallop_search(value)) == first, first
+
+
+@pytest.mark.parametrize('first, value', [(0, 0), (0, 1), (1, 1), (0, 1024), (1, 1024), (1023, 1024), (1024, 1024)])
+def test_gallop_search_boundaries(first, value):
+    session = origin(first, value)
+    assert asyncio.run(finder(session, 4).gallop_search(value)) == first
+
+
+def test_gallop_search_at_zero_sends_no_probe():
+    session = origin(0, 0)
+    assert asyncio.run(finder(session, 4).gallop_search(0)) == 0
+    assert session.requests == []
+
+
+@pytest.mark.parametrize('first', [0, 1, 500, 999_000])
+def test_probe_count_accounting(first):
+    value = 1_000_000
+    session = origin(first, value)
+    step_finder = finder(session, 1)
+    assert asyncio.run(step_finder.timed_search(value)) == first
+    probes = step_finder.last_search["probes"]
+    assert probes == step_finder.probe_count == len(session.requests)
+    assert step_finder.last_search["cache_hits"] == 0
+    # 倍增與二分搜尋的探測次數為對數等級
+    assert probes <= 2 * value.bit_length() + 2
@@ -0,0 +1,35 @@
+from src.services import journal
+
+
+def test_last_record_wins(tmp_path):
+    fragment_journal = journal.FragmentJournal(str(tmp_path))
+    fragment_journal.record(1, 'seg_1.ts', 'http://origin.test/seg_1.ts', 0, 'Failed')
+    fragment_journal.record(1, 'seg_1.ts', 'http://origin.test/seg_1.ts', 100, 'Successful')
+    fragment_journal.record(2, 'seg_2.ts', 'http://origin.test/seg_2.ts', 100, 'Successful')
+    records = fragment_journal.load()
+    assert records[1]["status"] == 'Successful'
+    assert sorted(records) == [1, 2]
+
+
+def test_shard_journals_are_merged_by_time(tmp_path):
+    single = journal.FragmentJournal(str(tmp_path))
+    shards = [journal.FragmentJournal(str(tmp_path), index) for index in range(2)]
+    assert len({single.path, *(shard.path for shard in shards)}) == 3
+    single.record(1, 'seg_1.ts', '', 0, 'Failed')
+    shards[0].record(2, 'seg_2.ts', '', 100, 'Successful')
+    # 之後的執行中由另一個行程重新下載
+    shards[1].record(1, 'seg_1.ts', '', 100, 'Successful')
+    shards[1].record(2, 'seg_2.ts', '', 0, 'Failed')
+    records = single.load()
+    assert records[1]["status"] == 'Successful'
+    assert records[2]["status"] == 'Failed'
+
+
+def test_truncated_line_is_skipped(tmp_path):
+    fragment_journal = journal.FragmentJournal(str(tmp_path))
+    fragment_journal.record(1, 'seg_1.ts', '', 100, 'Successful')
+    with open(fragment_journal.path, 'a', encoding='utf-8') as f:
+        f.write('{"number": 2, "filena')
+    assert sorted(fragment_journal.load()) == [1]
+    fragment_journal.record(3, 'seg_3.ts', '', 100, 'Successful')
+    assert sorted(fragment_journal.load()) == [1, 3]
@@ -0,0 +1,88 @@
+import os
+import sys
+import asyncio
+
+import pytest
+
+from src.services import live_remux
+
+FAKE_FFMPEG = '''\
+import sys
+# 測試用的ffmpeg：將標準輸入原樣寫入最後一個參數的檔案
+with open(sys.argv[-1], 'wb') as f:
+    while chunk := sys.stdin.buffer.read(65536):
+        f.write(chunk)
+'''
+
+
+@pytest.fixture
+def fake_ffmpeg(tmp_path):
+    if os.name == 'nt':
+        pytest.skip('測試用ffmpeg腳本需要可執行的shebang')
+    tool = tmp_path / 'ffmpeg'
+    tool.write_text(f'#!{sys.executable}\n' + FAKE_FFMPEG)
+    tool.chmod(0o755)
+    return str(tool)
+
+
+def write_segments(folder, count):
+    paths = []
+    for num in range(count):
+        path = folder / f'seg_{num}.ts'
+        path.write_bytes(bytes([num]) * 100)
+        paths.append(str(path))
+    return paths
+
+
+def test_out_of_order_segments_are_written_in_order(tmp_path, fake_ffmpeg):
+    paths = write_segments(tmp_path, 5)
+    output = tmp_path / 'out.mp4'
+
+    async def main():
+        remuxer = live_remux.LiveRemuxer(fake_ffmpeg, str(output), reorder_limit=10)
+        assert await remuxer.start()
+        for num in range(5):
+            remuxer.expect(num)
+        for num in (3, 1, 4, 0, 2):
+            await remuxer.complete(num, paths[num])
+        return await remuxer.close(), remuxer
+
+    ok, remuxer = asyncio.run(main())
+    assert ok
+    assert remuxer.written == 5 and remuxer.dropped == 0
+    assert output.read_bytes() == b''.join(bytes([num]) * 100 for num in range(5))
+
+
+def test_full_reorder_buffer_drops_and_rejects_output(tmp_path, fake_ffmpeg):
+    paths = write_segments(tmp_path, 5)
+
+    async def main():
+        remuxer = live_remux.LiveRemuxer(fake_ffmpeg, str(tmp_path / 'out.mp4'), reorder_limit=2)
+        assert await remuxer.start()
+        for num in range(5):
+            remuxer.expect(num)
+        # 碎片0遲遲未完成，緩衝區超過上限後被略過
+        for num in (1, 2, 3, 4):
+            await remuxer.complete(num, paths[num])
+        await remuxer.complete(0, paths[0])
+        return await remuxer.close(), remuxer
+
+    ok, remuxer = asyncio.run(main())
+    assert not ok
+    assert remuxer.dropped == 1 and remuxer.written == 4
+
+
+def test_failed_segment_rejects_output(tmp_path, fake_ffmpeg):
+    paths = write_segments(tmp_path, 3)
+
+    async def main():
+        remuxer = live_remux.LiveRemuxer(fake_ffmpeg, str(tmp_path / 'out.mp4'))
+        assert await remuxer.start()
+        for num in range(3):
+            remuxer.expect(num)
+        await remuxer.complete(0, paths[0])
+        await remuxer.complete(1, None)
+        await remuxer.complete(2, paths[2])
+        return await remuxer.close()
+
+    assert not asyncio.run(main())
@@ -0,0 +1,70 @@
+import os
+import threading
+import multiprocessing
+from collections import Counter
+
+from src.app_types import m3u8
+from src.services import numbering
+from src.services.m3u8_downloader import m3u8_downloader
+
+
+def update_deltas(folder: str, times: int) -> None:
+    store = numbering.DeltaStore(folder)
+    for _ in range(times):
+        store.update('origin.test', Counter({1: 1, 2: 2}))
+
+
+def test_delta_store_keeps_updates_from_all_processes(tmp_path):
+    context = multiprocessing.get_context('spawn')
+    processes = [context.Process(target=update_deltas, args=(str(tmp_path), 20)) for _ in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(60)
+        assert process.exitcode == 0
+    assert numbering.DeltaStore(str(tmp_path)).load('origin.test') == Counter({1: 80, 2: 160})
+    assert not [path for path in tmp_path.iterdir() if path.suffix == '.tmp']
+
+
+def test_histogram_of_whole_playlist():
+    paths = [f'media/seg_{num}.ts?token=1' for num in (10, 12, 14, 17, 19)] + ['media/init.mp4']
+    numbers = numbering.extract_numbers(paths)
+    assert numbers == [10, 12, 14, 17, 19, None]
+    assert numbering.delta_histogram(numbers) == Counter({2: 3, 3: 1})
+    assert numbering.rank_deltas(Counter({2: 3, 3: 1})) == [2, 3, 1, 4]
+
+
+def test_deltas_are_written_once_per_mission(tmp_path, monkeypatch):
+    writes = []
+    replace = os.replace
+
+    def spy_replace(source, target):
+        writes.append((os.path.basename(source), os.path.basename(target)))
+        replace(source, target)
+
+    monkeypatch.setattr(numbering.os, 'replace', spy_replace)
+    mission = m3u8_downloader(threading.Event(), m3u8.M3U8Info(url='http://origin.test/media.m3u8', filename='mission'))
+    mission.delta_store = numbering.DeltaStore(str(tmp_path))
+    # 每次重新讀取播放清單只累積，不寫入檔案
+    mission.learn_deltas([10, 12, 14], 'http://origin.test/seg_10.ts')
+    mission.learn_deltas([14, 16, 19], 'http://origin.test/seg_14.ts')
+    assert writes == []
+    assert mission.new_deltas == Counter({2: 3, 3: 1})
+
+    mission.save_deltas()
+    mission.save_deltas()
+    assert len(writes) == 1
+    source, target = writes[0]
+    assert target == numbering.DELTAS_FILE
+    assert source.startswith(numbering.DELTAS_FILE) and source.endswith('.tmp')
+    assert [path.name for path in tmp_path.iterdir() if path.suffix == '.tmp'] == []
+    assert numbering.DeltaStore(str(tmp_path)).load('origin.test') == Counter({2: 3, 3: 1})
+
+
+def test_corrupt_deltas_file_is_not_overwritten(tmp_path):
+    path = tmp_path / numbering.DELTAS_FILE
+    path.write_text('{"broken', encoding='utf-8')
+    store = numbering.DeltaStore(str(tmp_path))
+    assert store.load('origin.test') == Counter()
+    store.update('origin.test', Counter({1: 1}))
+    assert path.read_text(encoding='utf-8') == '{"broken'
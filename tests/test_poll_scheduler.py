@@ -0,0 +1,64 @@
+import pytest
+
+from src.core import poll_scheduler
+
+
+@pytest.fixture
+def poll(patch_clock):
+    patch_clock(poll_scheduler)
+    return poll_scheduler.PollScheduler()
+
+
+def reload(poll, clock, target_duration, changed, **kwargs):
+    """模擬一次讀取，回傳下一次讀取前等待的秒數"""
+    poll.start_reload()
+    poll.update(target_duration, changed, **kwargs)
+    delay = poll.next_delay()
+    clock.advance(delay)
+    return delay
+
+
+def test_default_interval_without_target_duration(poll):
+    assert poll.next_delay() == poll.default_interval
+
+
+def test_changed_playlist_waits_target_duration(poll, clock):
+    assert reload(poll, clock, 6, True) == 6
+    assert not poll.finished()
+
+
+def test_unchanged_playlist_backs_off(poll, clock):
+    reload(poll, clock, 6, True)
+    delays = [reload(poll, clock, 6, False) for _ in range(3)]
+    assert delays[0] < delays[1] < delays[2]
+
+
+def test_endlist_finishes_immediately(poll, clock):
+    reload(poll, clock, 6, True, ended=True)
+    assert poll.finished()
+
+
+@pytest.mark.parametrize('target_duration', [2, 6, 10])
+def test_stall_ends_on_elapsed_time(poll, clock, target_duration):
+    reload(poll, clock, target_duration, True)
+    start = clock()
+    while not poll.finished():
+        reload(poll, clock, target_duration, False)
+        assert clock() - start < poll.stall_timeout() + target_duration * 2
+    # 判定結束的時間不因backoff延後
+    assert clock() - start <= poll.stall_timeout() + target_duration
+
+
+def test_new_segment_resets_stall(poll, clock):
+    poll.start_reload()
+    poll.update(2, True)
+    clock.advance(poll.stall_timeout() - 1)
+    poll.start_reload()
+    poll.update(2, True)
+    clock.advance(poll.stall_timeout() - 1)
+    poll.start_reload()
+    poll.update(2, False)
+    # 未變更的時間從最後一次出現新碎片起算
+    assert not poll.finished()
+    clock.advance(1)
+    assert poll.finished()
@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+
+from src.services import probe, scheduler, transport
+
+URL = 'http://origin.test/seg_1.ts'
+CONTENT = b'x' * 1000
+
+
+@pytest.fixture(autouse=True)
+def host_methods(monkeypatch):
+    methods = {}
+    monkeypatch.setattr(probe, 'host_methods', methods)
+    return methods
+
+
+def route_by_method(**statuses):
+    """依請求方式回傳狀態碼，未指定的方式回傳內容"""
+    def route(method, url, headers):
+        key = 'range' if 'Range' in headers else method.lower()
+        return statuses.get(key, CONTENT)
+    return route
+
+
+def calibrate(session, **kwargs):
+    return asyncio.run(probe.calibrate(URL, session, **kwargs))
+
+
+def test_head_is_cached(host_methods):
+    session = transport.FakeTransport({URL: CONTENT})
+    assert calibrate(session) == 'head'
+    assert host_methods == {'origin.test': 'head'}
+    # 已記錄的主機不再請求
+    calibrate(session)
+    assert session.requests == [('HEAD', URL)]
+
+
+def test_rejected_head_falls_back_to_range(host_methods):
+    session = transport.FakeTransport({URL: route_by_method(head=405)})
+    assert calibrate(session) == 'range'
+    assert host_methods == {'origin.test': 'range'}
+
+
+def test_rejected_head_and_range_fall_back_to_get(host_methods):
+    session = transport.FakeTransport({URL: route_by_method(head=405, range=403)})
+    assert calibrate(session) == 'get'
+    assert host_methods == {'origin.test': 'get'}
+
+
+@pytest.mark.parametrize('status', [500, 502])
+def test_server_error_is_not_cached(host_methods, status):
+    session = transport.FakeTransport({URL: status})
+    assert calibrate(session) == 'head'
+    assert host_methods == {}
+
+
+def test_throttled_probe_is_retried_and_not_cached(host_methods, no_retry_wait):
+    connection_scheduler = scheduler.ConnectionScheduler(max_connections=4, host_connections=4)
+    session = transport.FakeTransport({URL: 503})
+    assert calibrate(session, connection_scheduler=connection_scheduler) == 'head'
+    assert host_methods == {}
+    # 請求經由連線排程器，限流訊號降低主機的連線數
+    assert len(session.requests) > 1
+    assert connection_scheduler.status()["limits"]["origin.test"] < 4
+
+
+def test_timeout_is_not_cached(host_methods):
+    session = transport.FakeTransport({URL: CONTENT}, latency=0.05)
+    assert calibrate(session, timeout=0.01) == 'head'
+    assert host_methods == {}
@@ -0,0 +1,83 @@
+import json
+import asyncio
+
+import pytest
+
+from src.app_types.common import FormatInfo
+from src.services import probe, probe_cache, transport
+from src.utils import guess
+
+FORMAT_URL = 'http://origin.test/seg_{num}.ts'
+
+
+@pytest.fixture
+def cache_clock(patch_clock):
+    return patch_clock(probe_cache)
+
+
+def test_positive_and_negative_ttl(tmp_path, cache_clock):
+    cache = probe_cache.ProbeCache(str(tmp_path), positive_ttl=100, negative_ttl=10)
+    cache.put(FORMAT_URL, 1, True)
+    cache.put(FORMAT_URL, 2, False)
+    assert cache.get(FORMAT_URL, 1) is True
+    assert cache.get(FORMAT_URL, 2) is False
+    assert cache.get(FORMAT_URL, 3) is None
+    cache_clock.advance(10)
+    # 剛好到期仍有效
+    assert cache.get(FORMAT_URL, 2) is False
+    cache_clock.advance(1)
+    assert cache.get(FORMAT_URL, 2) is None
+    assert cache.get(FORMAT_URL, 1) is True
+    cache_clock.advance(90)
+    assert cache.get(FORMAT_URL, 1) is None
+    assert cache.entries[FORMAT_URL] == {}
+    assert cache.hits == 4
+
+
+def test_save_and_load_drop_expired(tmp_path, cache_clock):
+    cache = probe_cache.ProbeCache(str(tmp_path), positive_ttl=100, negative_ttl=10)
+    cache.put(FORMAT_URL, 1, True)
+    cache.put(FORMAT_URL, 2, False)
+    cache.save()
+    cache_clock.advance(50)
+    reloaded = probe_cache.ProbeCache(str(tmp_path), positive_ttl=100, negative_ttl=10)
+    reloaded.load()
+    assert reloaded.get(FORMAT_URL, 1) is True
+    assert reloaded.get(FORMAT_URL, 2) is None
+
+    # 儲存時移除過期紀錄
+    reloaded.put(FORMAT_URL, 3, False)
+    reloaded.save()
+    with open(cache.path, 'r', encoding='utf-8') as f:
+        assert set(json.load(f)[FORMAT_URL]) == {'1', '3'}
+
+
+def test_save_only_when_changed(tmp_path, cache_clock):
+    cache = probe_cache.ProbeCache(str(tmp_path))
+    cache.save()
+    assert not (tmp_path / probe_cache.PROBE_CACHE_FILE).exists()
+    cache.put(FORMAT_URL, 1, True)
+    cache.save()
+    assert (tmp_path / probe_cache.PROBE_CACHE_FILE).exists()
+    assert not cache.dirty
+
+
+def test_corrupt_cache_is_ignored(tmp_path, cache_clock):
+    (tmp_path / probe_cache.PROBE_CACHE_FILE).write_text('{"broken', encoding='utf-8')
+    cache = probe_cache.ProbeCache(str(tmp_path))
+    cache.load()
+    assert cache.entries == {}
+
+
+def test_finder_uses_cache_instead_of_probing(tmp_path, cache_clock, monkeypatch):
+    monkeypatch.setattr(probe, 'host_methods', {})
+    cache = probe_cache.ProbeCache(str(tmp_path))
+    session = transport.FakeTransport({FORMAT_URL.format(num=1): b'x'})
+    finder = guess.StepFinder(FormatInfo(url=FORMAT_URL, space=1), session, cache=cache)
+    assert asyncio.run(finder.check_status(1)) == 1
+    assert asyncio.run(finder.check_status(2)) is None
+    assert (finder.probe_count, len(session.requests)) == (2, 2)
+    # 快取中的結果不再請求
+    assert asyncio.run(finder.check_status(1)) == 1
+    assert asyncio.run(finder.check_status(2)) is None
+    assert (finder.probe_count, finder.cache_hits, len(session.requests)) == (2, 2, 2)
@@ -0,0 +1,122 @@
+import asyncio
+
+import pytest
+
+from src.services import scheduler
+
+URL = 'http://origin.test/seg_1.ts'
+
+
+@pytest.fixture(autouse=True)
+def fixed_clock(patch_clock):
+    return patch_clock(scheduler)
+
+
+def run_slots(connection_scheduler, urls):
+    """以連線名額同時請求urls，回傳各主機的最大同時連線數與全域最大值"""
+    active = {}
+    peak = {}
+    total = [0, 0]
+
+    async def fetch(url):
+        host = scheduler.get_host(url)
+        async with connection_scheduler.slot(url):
+            active[host] = active.get(host, 0) + 1
+            peak[host] = max(peak.get(host, 0), active[host])
+            total[0] += 1
+            total[1] = max(total[1], total[0])
+            await asyncio.sleep(0.01)
+            active[host] -= 1
+            total[0] -= 1
+
+    async def main():
+        await asyncio.gather(*(fetch(url) for url in urls))
+
+    asyncio.run(main())
+    return peak, total[1]
+
+
+def test_slots_respect_host_limit():
+    connection_scheduler = scheduler.ConnectionScheduler(max_connections=30, host_connections=2)
+    peak, _ = run_slots(connection_scheduler, [URL] * 10)
+    assert peak == {"origin.test": 2}
+    assert connection_scheduler.status()["active"] == 0
+
+
+def test_slots_respect_global_limit_without_blocking_other_hosts():
+    connection_scheduler = scheduler.ConnectionScheduler(max_connections=3, host_connections=2)
+    urls = [f'http://{host}.test/seg.ts' for host in ('a', 'b') for _ in range(6)]
+    peak, total = run_slots(connection_scheduler, urls)
+    assert total == 3
+    # 一個主機額滿時另一個主機仍可取得名額
+    assert set(peak) == {"a.test", "b.test"}
+    assert connection_scheduler.status() == {"active": 0, "waiting": 0, "hosts": {}, "limits": {"a.test": 2, "b.test": 2}}
+
+
+def test_cancelled_waiter_releases_nothing():
+    connection_scheduler = scheduler.ConnectionScheduler(max_connections=1, host_connections=1)
+
+    async def main():
+        await connection_scheduler.acquire("origin.test")
+        waiter = asyncio.create_task(connection_scheduler.acquire("origin.test"))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        connection_scheduler.release("origin.test")
+
+    asyncio.run(main())
+    assert connection_scheduler.status()["active"] == 0
+    assert connection_scheduler.status()["waiting"] == 0
+
+
+def test_aimd_decreases_once_per_wave(clock):
+    limit = scheduler.AIMDLimit(10)
+    assert limit.observe(503, 0.1)
+    assert int(limit) == 5
+    # 同一波請求的壅塞訊號不重複減少
+    assert limit.observe(429, 0.1) == ''
+    assert limit.observe(None, 0.1) == ''
+    assert int(limit) == 5
+    clock.advance(1)
+    assert limit.observe(None, 0.1)
+    assert int(limit) == 2
+
+
+def test_aimd_does_not_go_below_minimum(clock):
+    limit = scheduler.AIMDLimit(2, minimum=1)
+    for _ in range(5):
+        limit.observe(503, 0.1)
+        clock.advance(1)
+    assert int(limit) == 1
+
+
+def test_aimd_grows_to_maximum(clock):
+    limit = scheduler.AIMDLimit(2, maximum=4)
+    for _ in range(100):
+        limit.observe(200, 0.1)
+        clock.advance(0.1)
+    assert int(limit) == 4
+    assert limit.limit == 4
+
+
+def test_aimd_decreases_on_latency(clock):
+    limit = scheduler.AIMDLimit(8)
+    for _ in range(5):
+        limit.observe(200, 0.1)
+        clock.advance(0.1)
+    before = int(limit)
+    reasons = []
+    for _ in range(10):
+        reasons.append(limit.observe(200, 1.0))
+        clock.advance(0.1)
+    assert any(reasons)
+    assert int(limit) < before
+
+
+def test_host_limit_never_exceeds_host_connections(clock):
+    connection_scheduler = scheduler.ConnectionScheduler(max_connections=30, host_connections=3)
+    for _ in range(100):
+        connection_scheduler.report(URL, 200, 0.1)
+        clock.advance(0.1)
+    assert connection_scheduler.status()["limits"] == {"origin.test": 3}
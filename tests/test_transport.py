@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+from src.services import transport
+
+URL = 'http://origin.test/stream/seg_1.ts'
+CONTENT = bytes(range(256)) * 4
+
+
+async def fetch(session, method, url, headers=None, timeout=None):
+    async with session.request(method, url, headers, timeout) as response:
+        return response.status, dict(response.headers), await response.read()
+
+
+def test_interfaces_are_abstract():
+    with pytest.raises(TypeError):
+        transport.Transport()
+    with pytest.raises(TypeError):
+        transport.Response()
+
+    class Partial(transport.Transport):
+        def update_cookies(self, cookies):
+            pass
+
+    with pytest.raises(TypeError):
+        Partial()
+
+
+def test_fake_transport_get_head_and_missing():
+    session = transport.FakeTransport({URL: CONTENT})
+    status, headers, body = asyncio.run(fetch(session, 'GET', URL))
+    assert (status, body, headers['Content-Length']) == (200, CONTENT, str(len(CONTENT)))
+    status, headers, body = asyncio.run(fetch(session, 'HEAD', URL))
+    assert (status, body, headers['Content-Length']) == (200, b'', str(len(CONTENT)))
+    assert asyncio.run(fetch(session, 'GET', URL + '?missing'))[0] == 404
+    assert session.requests == [('GET', URL), ('HEAD', URL), ('GET', URL + '?missing')]
+
+
+def test_fake_transport_range():
+    session = transport.FakeTransport({URL: CONTENT})
+    status, headers, body = asyncio.run(fetch(session, 'GET', URL, {'Range': 'bytes=10-19'}))
+    assert (status, body) == (206, CONTENT[10:20])
+    assert headers['Content-Range'] == f'bytes 10-19/{len(CONTENT)}'
+    status, _, body = asyncio.run(fetch(session, 'GET', URL, {'Range': 'bytes=1000-'}))
+    assert (status, body) == (206, CONTENT[1000:])
+    assert asyncio.run(fetch(session, 'GET', URL, {'Range': f'bytes={len(CONTENT)}-'}))[0] == 416
+
+
+def test_fake_transport_routes_and_timeout():
+    session = transport.FakeTransport({URL: 503}, default=lambda method, url, headers: url.encode(), latency=0.05)
+    assert asyncio.run(fetch(session, 'GET', URL))[0] == 503
+    assert asyncio.run(fetch(session, 'GET', 'http://other.test/a'))[2] == b'http://other.test/a'
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(fetch(session, 'GET', URL, timeout=0.01))
+
+
+def test_create_transport_rejects_unknown_name():
+    with pytest.raises(ValueError):
+        transport.create_transport('ftp')